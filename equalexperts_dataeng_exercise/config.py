@@ -0,0 +1,120 @@
+"""
+DuckDB resource settings for BlogAnalysisDB. Each setting is taken, in order of
+precedence, from an explicit argument, a BLOG_ANALYSIS_<SETTING> environment variable
+or the [duckdb] table of a TOML config file given by path or BLOG_ANALYSIS_CONFIG:
+
+    [duckdb]
+    threads = 4
+    memory_limit = "2GB"
+    temp_directory = "/mnt/nvme/duckdb-spill"
+    max_temp_directory_size = "50GB"
+    preserve_insertion_order = false
+
+Settings that are not given anywhere keep DuckDB's defaults.
+"""
+
+import os
+import logging
+import tomllib
+
+ENV_PREFIX = 'BLOG_ANALYSIS_'
+CONFIG_PATH_ENV = 'BLOG_ANALYSIS_CONFIG'
+
+
+def _parse_bool(value):
+    if isinstance(value, bool):
+        return value
+    if str(value).strip().lower() in ('1', 'true', 'yes', 'on'):
+        return True
+    if str(value).strip().lower() in ('0', 'false', 'no', 'off'):
+        return False
+    raise ValueError(f"Expected a boolean, got {value!r}.")
+
+
+# The supported settings and how their values are parsed
+RESOURCE_SETTINGS = {
+    'threads': int,
+    'memory_limit': str,
+    'temp_directory': str,
+    'max_temp_directory_size': str,
+    'preserve_insertion_order': _parse_bool,
+}
+
+
+def _parse_settings(settings, source):
+    parsed = {}
+    for name, value in settings.items():
+        if value is None:
+            continue
+        if name not in RESOURCE_SETTINGS:
+            raise ValueError(f"Unknown DuckDB resource setting {name!r} in {source}, expected one of {sorted(RESOURCE_SETTINGS)}.")
+        try:
+            parsed[name] = RESOURCE_SETTINGS[name](value)
+        except ValueError as e:
+            raise ValueError(f"Invalid value for {name} in {source}: {e}") from e
+    return parsed
+
+
+def load_resource_settings(overrides=None, config_path=None, environ=None):
+    """
+    Resolves the DuckDB resource settings to connect with.
+
+    Args:
+        overrides (dict): Settings given explicitly, e.g. from the command line. None values are ignored.
+        config_path (str): A TOML config file, defaults to $BLOG_ANALYSIS_CONFIG if set.
+        environ (dict): The environment to read, defaults to os.environ.
+
+    Returns:
+        dict: The settings to pass as duckdb.connect(config=...).
+
+    Raises:
+        ValueError: If a setting is unknown or its value cannot be parsed.
+    """
+    environ = os.environ if environ is None else environ
+    config_path = config_path or environ.get(CONFIG_PATH_ENV)
+
+    settings = {}
+    if config_path:
+        with open(config_path, 'rb') as config_file:
+            settings.update(_parse_settings(tomllib.load(config_file).get('duckdb', {}), config_path))
+    settings.update(_parse_settings(
+        {name: environ.get(ENV_PREFIX + name.upper()) for name in RESOURCE_SETTINGS}, 'the environment'))
+    settings.update(_parse_settings(overrides or {}, 'the arguments'))
+
+    if settings:
+        logging.info(f"DuckDB resource settings: {settings}")
+    return settings
+
+
+def scratch_directory(settings):
+    """
+    Returns the directory to create scratch files in: the temp_directory setting, created
+    if it does not exist yet, or None for the system temp directory if it is not set or
+    cannot be created.
+    """
+    temp_directory = settings.get('temp_directory')
+    if not temp_directory:
+        return None
+    try:
+        os.makedirs(temp_directory, exist_ok=True)
+    except OSError as e:
+        logging.warning(f"Cannot create temp_directory {temp_directory}, using the system temp directory: {e}")
+        return None
+    return temp_directory
+
+
+def add_resource_arguments(parser):
+    """Adds the resource setting options shared by the command line entry points."""
+    group = parser.add_argument_group('DuckDB resources')
+    group.add_argument('--config', help=f"TOML file with a [duckdb] table of settings (default: ${CONFIG_PATH_ENV})")
+    group.add_argument('--threads', type=int, help="number of DuckDB worker threads")
+    group.add_argument('--memory-limit', help="maximum memory of the DuckDB buffer manager, e.g. 2GB")
+    group.add_argument('--temp-directory', help="directory DuckDB spills to when it runs out of memory")
+    group.add_argument('--max-temp-directory-size', help="maximum size of the spill files, e.g. 50GB")
+    group.add_argument('--preserve-insertion-order', type=_parse_bool, metavar='{true,false}',
+                       help="false lets DuckDB reorder rows to use less memory in large loads")
+
+
+def resource_settings_from_args(args):
+    """Returns the explicit settings of the parsed command line arguments."""
+    return {name: getattr(args, name) for name in RESOURCE_SETTINGS}
@@ -0,0 +1,87 @@
+"""
+A bounded pool of reusable DuckDB cursors for query workloads. The cursors are opened
+on the connection of a BlogAnalysisDB, so they share its database instance: threads can
+query in parallel, each reads a consistent snapshot of the committed data, and none of
+them pays the cost of opening the database file again.
+
+DuckDB lets one process write a database file, or several processes read it with
+read_only connections. A dashboard process should therefore open
+BlogAnalysisDB(read_only=True) and take its cursors from that; a process that also loads
+data takes them from its writer.
+"""
+
+import queue
+import logging
+import threading
+from contextlib import contextmanager
+
+
+class ReaderPool:
+    """
+    Hands out at most `size` cursors on a connection, creating them on first use and
+    reusing them afterwards.
+
+    Args:
+        conn: The DuckDB connection to open the cursors on.
+        size (int): The maximum number of cursors in use at the same time.
+    """
+
+    def __init__(self, conn, size=4):
+        if size < 1:
+            raise ValueError(f"The reader pool needs at least one cursor, got {size}.")
+        self.conn = conn
+        self.size = size
+        self._idle = queue.LifoQueue()
+        self._opened = 0
+        self._lock = threading.Lock()
+        self._closed = False
+
+
+    def _take(self, timeout):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._opened < self.size:
+                self._opened += 1
+                return self.conn.cursor()
+        try:
+            return self._idle.get(timeout=timeout)
+        except queue.Empty:
+            raise TimeoutError(f"No reader became available within {timeout}s, all {self.size} are in use.")
+
+
+    @contextmanager
+    def acquire(self, timeout=None):
+        """
+        Yields a cursor for the duration of the block and returns it to the pool after.
+        Blocks while all cursors are in use.
+
+        Args:
+            timeout (float): Seconds to wait for a free cursor, None waits indefinitely.
+
+        Raises:
+            TimeoutError: If no cursor became free within the timeout.
+        """
+        if self._closed:
+            raise RuntimeError("The reader pool is closed.")
+        cursor = self._take(timeout)
+        try:
+            yield cursor
+        finally:
+            if self._closed:
+                cursor.close()
+            else:
+                self._idle.put(cursor)
+
+
+    def close(self):
+        """Closes the idle cursors; cursors still in use are closed when they are returned."""
+        self._closed = True
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+        logging.info("Reader pool closed.")
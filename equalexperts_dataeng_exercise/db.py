@@ -1,18 +1,246 @@
+import os
+import glob
 import duckdb
+import shutil
 import logging
+import tempfile
+from datetime import date
+from contextlib import nullcontext
+
+from equalexperts_dataeng_exercise.config import load_resource_settings, scratch_directory
+from equalexperts_dataeng_exercise.connections import ReaderPool
+from equalexperts_dataeng_exercise.inputs import MEMBER_CHUNK_BYTES, is_tar_archive, iter_tar_members, iter_jsonl_chunks
+
+
+# The operational types of the vote columns. Id and CreationDate are mandatory, the
+# other columns are optional but must be valid when present.
+VOTES_COLUMN_DEFINITIONS = {
+    'Id': 'BIGINT',
+    'PostId': 'BIGINT',
+    'VoteTypeId': 'BIGINT',
+    'CreationDate': 'DATETIME',
+    'UserId': 'BIGINT',
+    'BountyAmount': 'NUMERIC'
+}
+REQUIRED_COLUMNS = ('Id', 'CreationDate')
+
+# Physical layouts of blog_analysis.votes: 'indexed' keeps ART indexes on Id and
+# CreationDate, 'sorted' keeps the rows ordered by CreationDate without indexes so that
+# zonemaps prune date-range and week scans, 'partitioned' keeps the votes out of the
+# database file as Parquet partitioned by Year and WeekNumber, behind a view
+STORAGE_LAYOUTS = ('indexed', 'sorted', 'partitioned')
+INDEXED_COLUMNS = ('Id', 'CreationDate')
+
+# The periods the outlier views group the daily vote count cube by, and their columns
+OUTLIER_GRANULARITIES = {
+    'day': ('Date',),
+    'week': ('Year', 'WeekNumber'),
+    'month': ('Year', 'Month'),
+}
+
+# The number of staged records cleanse_and_deduplicate_staging_table deduplicates at a
+# time. Larger loads are split into buckets by a hash of the Id
+DEDUP_BUCKET_ROWS = 10_000_000
+
+# The outlier modes over the weekly vote counts besides the global average: the average
+# of the week's year, the average of the previous weeks, and an exponentially weighted
+# moving average of the previous weeks
+WINDOWED_OUTLIER_MODES = ('yearly', 'trailing', 'ewma')
+
+# blog_analysis.votes_id_blocks keeps one row per block of 2^ID_BLOCK_BITS consecutive
+# Ids, with a bit set in its 64-bit mask for every Id of the block held in the votes table
+ID_BLOCK_BITS = 6
+
+
+def outliers_view_name(granularity, by_vote_type=False, filtered=False):
+    """
+    Returns the name of an outliers view. Views counted per VoteTypeId or over filtered
+    votes get a name of their own, so they never replace outlier_days, outlier_weeks or
+    outlier_months.
+    """
+    return f"outlier_{granularity}s{'_by_vote_type' if by_vote_type else ''}{'_filtered' if filtered else ''}"
+
+
+def _custom_week_sql(timestamp_column):
+    """
+    Returns the SQL expressions for the Year and custom WeekNumber of a timestamp column.
+    Days in the first week of January that ISO 8601 would count in the last week of the
+    previous year are assigned 'week 0' of the new year.
+    """
+    year_sql = f"EXTRACT(YEAR FROM {timestamp_column})"
+    week_sql = f"""
+        CASE
+            WHEN EXTRACT(MONTH FROM {timestamp_column}) = 1
+                    AND EXTRACT(DAY FROM {timestamp_column}) <= 7
+                    AND EXTRACT(ISODOW FROM {timestamp_column}) >= 4
+                THEN 0
+            ELSE
+                EXTRACT(WEEK FROM {timestamp_column})
+        END"""
+    return year_sql, week_sql
+
+
+def _files_sql(file_path):
+    """Returns a SQL string literal, or a list of them, for one or several file paths."""
+    if isinstance(file_path, (list, tuple)):
+        return '[' + ', '.join(_files_sql(path) for path in file_path) + ']'
+    escaped_path = str(file_path).replace("'", "''")
+    return f"'{escaped_path}'"
+
+
+def _read_json_sql(file_path, column_definitions):
+    """Returns a read_json call loading every column of the JSONL file(s) as VARCHAR."""
+    columns_sql = ', '.join([f"'{col}': 'VARCHAR'" for col in column_definitions])
+    return f"""
+        SELECT *
+        FROM read_json({_files_sql(file_path)},
+                        format = 'newline_delimited',
+                        ignore_errors = true,
+                        columns = {{{columns_sql}}})"""
+
+
+def _invalid_value_sql(col, typed_value_sql):
+    """Returns the condition of a raw column whose parsed value typed_value_sql is invalid."""
+    if col in REQUIRED_COLUMNS:
+        return f"{typed_value_sql} IS NULL"
+    return f"({col} IS NOT NULL AND {typed_value_sql} IS NULL)"
+
+
+def _valid_record_sql(column_definitions):
+    """Returns the condition of a raw VARCHAR record whose every column parses."""
+    invalid_sql = ' OR '.join([_invalid_value_sql(col, f"try_cast({col} AS {data_type})")
+                               for col, data_type in column_definitions.items()])
+    return f"NOT ({invalid_sql})"
+
+
+def _recency_key_sql(valid_sql, file_order_sql, creation_date_sql="CreationDate"):
+    """
+    Returns the key ranking the records of one Id, the largest being the one kept: the
+    latest raw CreationDate, then a valid record over an invalid one, then the later
+    record in file order. Both the bucketed and the windowed deduplication rank by it,
+    so they keep the same record of tied duplicates, and chunked loads carry it across
+    chunks.
+    """
+    return (f"struct_pack(CreationDate := COALESCE({creation_date_sql}, ''), valid := {valid_sql}, "
+            f"file_order := CAST({file_order_sql} AS BIGINT))")
+
+
+def _cleanse_and_deduplicate_sql(source_sql, column_definitions, flagged_duplicates=False):
+    """
+    Returns the query validating and deduplicating the raw VARCHAR records of source_sql.
+    Every column is parsed once, the typed columns are returned with a staging_status,
+    and the error description and raw values are only built for rejected records.
+    When flagged_duplicates is set, source_sql already has an is_duplicate column and
+    is not ranked again.
+    """
+    # Parse every column exactly once and flag the values that failed to parse
+    typed_sql = ',\n'.join([f"try_cast({col} AS {data_type}) AS typed_{col}"
+                            for col, data_type in column_definitions.items()])
+    invalid_sql = ',\n'.join([f"{_invalid_value_sql(col, f'typed_{col}')} AS invalid_{col}"
+                              for col in column_definitions])
+    any_invalid_sql = ' OR '.join([f"invalid_{col}" for col in column_definitions])
+    # Every record but the latest of its Id is a duplicate. The row number of the source
+    # is its file order, which breaks the ties between records of the same CreationDate
+    file_order_sql = "" if flagged_duplicates else ", ROW_NUMBER() OVER () AS file_order"
+    duplicate_sql = ("" if flagged_duplicates else f""",
+                ROW_NUMBER() OVER (
+                    PARTITION BY Id
+                    ORDER BY {_recency_key_sql(f'NOT ({any_invalid_sql})', 'file_order')} DESC
+                ) > 1 AS is_duplicate""")
+    # The raw CreationDate ranks the records, chunked loads compare it across chunks
+    output_sql = ', '.join([f"typed_{col} AS {col}" for col in column_definitions] + ["CreationDate AS raw_creation_date"])
+    error_columns = sorted(column_definitions, key=lambda col: col not in REQUIRED_COLUMNS)
+    error_sql = ',\n'.join([f"CASE WHEN invalid_{col} THEN 'Invalid {col}' END" for col in error_columns])
+    raw_values_sql = ', '.join([f"'{col}': {col}" for col in column_definitions])
+
+    return f"""
+        WITH ordered AS (
+            SELECT *{file_order_sql}
+            FROM {source_sql} AS source
+        ), typed AS (
+            SELECT *, {typed_sql}
+            FROM ordered
+        ), checked AS (
+            SELECT *, {invalid_sql}
+            FROM typed
+        ), flagged AS (
+            SELECT *, {any_invalid_sql} AS is_invalid{duplicate_sql}
+            FROM checked
+        )
+        SELECT
+            {output_sql},
+            CASE
+                WHEN is_invalid THEN 'FAILED'
+                WHEN is_duplicate THEN 'DUPLICATE'
+                ELSE 'READYTOLOAD'
+            END AS staging_status,
+            CASE WHEN is_invalid OR is_duplicate THEN
+                CONCAT_WS('; ',
+                    {error_sql},
+                    CASE WHEN is_duplicate THEN 'Duplicate record' END
+                )
+            END AS error_description,
+            CASE WHEN is_invalid THEN {{{raw_values_sql}}} END AS rejected_values
+        FROM flagged"""
+
 
 class BlogAnalysisDB:
-    def __init__(self, db_path='warehouse.db'):
+    def __init__(self, db_path='warehouse.db', settings=None, config_path=None, read_only=False, reader_pool_size=4,
+                 layout='indexed', partition_path=None, archive_path=None, dedup_bucket_rows=DEDUP_BUCKET_ROWS):
+        """
+        Opens the database. The connection stays open until close() or the end of a
+        with block; entering the with block reuses it rather than opening another one.
+
+        Args:
+            db_path (str): The DuckDB database file, or ':memory:'.
+            settings (dict): DuckDB resource settings (threads, memory_limit, temp_directory,
+                max_temp_directory_size, preserve_insertion_order). Settings not given here
+                are read from the environment or the config file, see config.py.
+            config_path (str): A TOML file with a [duckdb] table of resource settings.
+            read_only (bool): Open the file read-only, so several reader processes can
+                share it. Requires an existing database file.
+            reader_pool_size (int): The maximum number of cursors handed out by reader().
+            layout (str): The physical layout of blog_analysis.votes, 'indexed', 'sorted'
+                or 'partitioned'.
+            partition_path (str): The directory of the Parquet partitions of the
+                partitioned layout, defaults to the database file name with a -votes suffix.
+            archive_path (str): The directory of the Parquet partitions that archive_votes
+                moves cold votes to, defaults to the database file name with an -archive suffix.
+            dedup_bucket_rows (int): The number of staged records deduplicated at a time,
+                lower values use less memory on large loads.
+        """
+        if layout not in STORAGE_LAYOUTS:
+            raise ValueError(f"Unknown storage layout {layout!r}, expected one of {STORAGE_LAYOUTS}.")
+        if dedup_bucket_rows < 1:
+            raise ValueError(f"A dedup bucket needs at least one record, got {dedup_bucket_rows}.")
+        if layout == 'partitioned' and partition_path is None:
+            if db_path == ':memory:':
+                raise ValueError("The partitioned layout of an in-memory database needs a partition_path.")
+            partition_path = os.path.splitext(db_path)[0] + '-votes'
         self.db_path = db_path
+        self.layout = layout
+        if archive_path is None and db_path != ':memory:':
+            archive_path = os.path.splitext(db_path)[0] + '-archive'
+        self.partition_path = os.path.abspath(partition_path) if partition_path else None
+        self.archive_path = os.path.abspath(archive_path) if archive_path else None
+        self.settings = load_resource_settings(settings, config_path)
+        self.read_only = read_only
+        self.reader_pool_size = reader_pool_size
+        self.dedup_bucket_rows = dedup_bucket_rows
+        self.profiler = None
+        self.conn = None
+        self.readers = None
         self._connect()
 
     def _connect(self):
         try:
-            self.conn = duckdb.connect(self.db_path)
+            self.conn = duckdb.connect(self.db_path, read_only=self.read_only, config=self.settings)
+            self.readers = ReaderPool(self.conn, self.reader_pool_size)
             logging.info("Connected to DuckDB successfully.")
         except Exception as e:
             logging.error("Failed to connect to DuckDB: %s", e)
             self.conn = None
+            raise e
 
 
     def test_connection(self):
@@ -26,7 +254,9 @@ class BlogAnalysisDB:
 
 
     def __enter__(self):
-        self._connect()
+        # Only reconnect a closed instance, the connection opened by __init__ is reused
+        if self.conn is None:
+            self._connect()
         return self
 
 
@@ -36,12 +266,106 @@ class BlogAnalysisDB:
 
     def close(self):
         if self.conn:
+            self.disable_profiling()
+            self.readers.close()
             self.conn.close()
+            self.conn = None
+            self.readers = None
             logging.info("Database connection closed.")
 
 
+    def reader(self, timeout=None):
+        """
+        Returns a context manager yielding a pooled cursor for queries. Cursors share
+        this connection's database, so several threads can read at once, each seeing
+        the last committed data, without opening the file again.
+
+        Args:
+            timeout (float): Seconds to wait for a free cursor, None waits indefinitely.
+        """
+        return self.readers.acquire(timeout)
+
+
+    def enable_profiling(self, capture_plans=True, plan_format='json'):
+        """
+        Starts recording the wall time, row counts and DuckDB query profile of every
+        pipeline step run through profile_step. Does nothing if profiling is already on.
+
+        Args:
+            capture_plans (bool): Keep the query profile of every statement, not only its timing.
+            plan_format (str): 'json' for DuckDB's JSON profile, 'query_tree' for the EXPLAIN ANALYZE tree.
+
+        Returns:
+            PipelineProfiler: The profiler collecting the report.
+        """
+        from equalexperts_dataeng_exercise.profiling import PipelineProfiler, ProfiledConnection
+
+        if self.profiler is None:
+            self.profiler = PipelineProfiler(self.conn, capture_plans, plan_format)
+            self.conn = ProfiledConnection(self.conn, self.profiler)
+        return self.profiler
+
+
+    def disable_profiling(self):
+        """Stops profiling and returns the profiler holding the report, or None."""
+        profiler, self.profiler = self.profiler, None
+        if profiler is not None:
+            self.conn = profiler.conn
+            profiler.close()
+        return profiler
+
+
+    def profile_step(self, name, rows_in_query=None, rows_out_query=None):
+        """
+        Returns a context manager recording one pipeline step when profiling is enabled,
+        and a no-op one otherwise. See PipelineProfiler.step.
+        """
+        if self.profiler is None:
+            return nullcontext()
+        return self.profiler.step(name, rows_in_query, rows_out_query)
+
+
+    def register_udfs(self):
+        """
+        Registers the Python validation rules from utility.py as SQL functions:
+        cleanse_and_deduplicate_row is called row by row, cleanse_and_deduplicate_batch
+        is its vectorized equivalent working on Arrow arrays. Both take (Id, PostId,
+        VoteTypeId, CreationDate, UserId, BountyAmount, row_number) and return
+        STRUCT(status, error_description).
+
+        Raises:
+            ImportError: If pyarrow or numpy, the arrow extra, is not installed.
+        """
+        try:
+            # DuckDB needs numpy for Python functions, and pyarrow for the Arrow one
+            import numpy  # noqa: F401
+            import pyarrow  # noqa: F401
+        except ImportError as e:
+            raise ImportError("The validation UDFs need pyarrow and numpy, install the arrow extra: "
+                              "pip install 'equalexperts_dataeng_exercise[arrow]'.") from e
+        from equalexperts_dataeng_exercise.utility import cleanse_and_deduplicate_row, cleanse_and_deduplicate_batch
+
+        parameters = ["VARCHAR", "VARCHAR", "VARCHAR", "VARCHAR", "VARCHAR", "VARCHAR", "BIGINT"]
+        return_type = "STRUCT(status VARCHAR, error_description VARCHAR)"
+        try:
+            # Missing optional columns are NULL, so the rules must see NULL inputs
+            self.conn.create_function("cleanse_and_deduplicate_row", cleanse_and_deduplicate_row,
+                                      parameters=parameters, return_type=return_type, null_handling='special')
+            self.conn.create_function("cleanse_and_deduplicate_batch", cleanse_and_deduplicate_batch,
+                                      parameters=parameters, return_type=return_type, type='arrow',
+                                      null_handling='special')
+            logging.info("Validation UDFs registered successfully.")
+        except Exception as e:
+            logging.error(f"Error registering validation UDFs: {e}")
+            raise e
+
+
     def setup_schema(self, table_name, column_definitions):
         schema_name = "blog_analysis"
+        if table_name == 'votes' and self.layout == 'partitioned':
+            # The partitioned layout keeps the votes in Parquet files behind a view
+            self.setup_partitioned_votes(column_definitions)
+            return
         try:
             self.conn.execute(f"CREATE SCHEMA IF NOT EXISTS {schema_name};")
             # Construct the column definitions into SQL format
@@ -85,28 +409,48 @@ class BlogAnalysisDB:
 
     def load_json_to_staging_table(self, file_path, column_definitions):
         """
-        Creates a new table from a JSON file using DuckDB's read_json function.
+        Creates a new table from one or more JSON files using DuckDB's read_json function.
+        Several files are read as a single parallel scan into the same staging table, so
+        they are cleansed and deduplicated together. read_json decompresses .jsonl.gz and
+        .jsonl.zst files while scanning; the JSONL members of tar archives are streamed
+        out of the archive in blocks of MEMBER_CHUNK_BYTES and appended block by block.
         
         Args:
-            file_path (str): The path to the JSON file.
+            file_path (str or list): The path, glob or list of paths to the JSON files.
             column_definitions (dict): The columns and their SQL types.
         """
         table_name = "blog_analysis.staging_votes_load"
+        file_paths = [file_path] if isinstance(file_path, (str, os.PathLike)) else list(file_path)
+        scanned_paths = [path for path in file_paths if not is_tar_archive(path)]
+        archive_paths = [path for path in file_paths if is_tar_archive(path)]
         try:
-            # Construct the columns part of the SQL query from the column_definitions
-            columns_sql = ', '.join([f"'{col}': 'VARCHAR'" for col, dtype in column_definitions.items()])
-
-            # Construct the CREATE TABLE AS SELECT query
-            create_table_query = f"""
-                CREATE OR REPLACE TABLE {table_name} AS
-                SELECT *
-                FROM read_json('{file_path}',
-                                format = 'newline_delimited',
-                                ignore_errors = true,
-                                columns = {{{columns_sql}}});
-            """
+            if scanned_paths:
+                # Construct the CREATE TABLE AS SELECT query
+                create_table_query = f"""
+                    CREATE OR REPLACE TABLE {table_name} AS
+                    SELECT *
+                    FROM ({_read_json_sql(scanned_paths, column_definitions)}) records;
+                """
+            else:
+                columns_sql = ', '.join([f"{col} VARCHAR" for col in column_definitions])
+                create_table_query = f"CREATE OR REPLACE TABLE {table_name} ({columns_sql});"
             # Execute the query
             self.conn.execute(create_table_query)
+
+            if archive_paths:
+                # The block directory is only needed to extract archive members
+                with tempfile.TemporaryDirectory(dir=scratch_directory(self.settings)) as block_dir:
+                    block_path = os.path.join(block_dir, 'member.jsonl')
+                    for archive_path in archive_paths:
+                        for _, member in iter_tar_members(archive_path):
+                            for block in iter_jsonl_chunks(member, chunk_bytes=MEMBER_CHUNK_BYTES):
+                                with open(block_path, 'wb') as block_file:
+                                    block_file.write(block)
+                                self.conn.execute(f"""
+                                    INSERT INTO {table_name}
+                                    SELECT *
+                                    FROM ({_read_json_sql(block_path, column_definitions)}) records;
+                                """)
             logging.info(f"Table {table_name} created successfully from {file_path}.")
         
         except Exception as e:
@@ -115,56 +459,666 @@ class BlogAnalysisDB:
             raise e
 
 
-    def cleanse_and_deduplicate_staging_table(self):
+    def split_staging_into_shards(self, shard_dir, shards):
         """
-        Cleanses the data in the staging_votes table, checks for duplicates, and creates 
-        a new table with status and error descriptions.
+        Splits blog_analysis.staging_votes_load into Parquet files under shard_dir, one
+        directory per shard, in a single scan. Every record of an Id hashes to the same
+        shard, and the records keep their load order in load_order for the tie-break of
+        the deduplication.
+
+        Args:
+            shard_dir (str): The directory to write the shards to.
+            shards (int): The number of shards.
+
+        Returns:
+            list: The Parquet files of every shard, by shard index.
+        """
+        table_name = "blog_analysis.staging_votes_load"
+        try:
+            self.conn.execute(f"""
+                COPY (
+                    SELECT *, rowid AS load_order, hash(Id) % {shards} AS shard
+                    FROM {table_name}
+                ) TO {_files_sql(shard_dir)} (FORMAT PARQUET, PARTITION_BY (shard));
+            """)
+            logging.info(f"Table {table_name} split into {shards} shard(s) in {shard_dir}.")
+            return [sorted(glob.glob(os.path.join(shard_dir, f'shard={shard_index}', '*.parquet')))
+                    for shard_index in range(shards)]
+
+        except Exception as e:
+            logging.error(f"Error splitting table {table_name} into shards: {e}")
+            raise e
+
+
+    def load_shard_to_staging_table(self, shard_files, column_definitions):
+        """
+        Creates blog_analysis.staging_votes_load from the Parquet files of one shard written
+        by split_staging_into_shards, in load order.
+
+        Args:
+            shard_files (list): The Parquet files of the shard, none for an empty shard.
+            column_definitions (dict): The columns and their SQL types.
+        """
+        table_name = "blog_analysis.staging_votes_load"
+        try:
+            if shard_files:
+                self.conn.execute(f"""
+                    CREATE OR REPLACE TABLE {table_name} AS
+                    SELECT {', '.join(column_definitions)}
+                    FROM read_parquet({_files_sql(shard_files)})
+                    ORDER BY load_order;
+                """)
+            else:
+                columns_sql = ', '.join([f"{col} VARCHAR" for col in column_definitions])
+                self.conn.execute(f"CREATE OR REPLACE TABLE {table_name} ({columns_sql});")
+            logging.info(f"Table {table_name} created from {len(shard_files)} shard file(s).")
+
+        except Exception as e:
+            logging.error(f"Error creating table {table_name} from the shard files: {e}")
+            raise e
+
+
+    def cleanse_and_deduplicate_staging_table(self, column_definitions=None, dedup_bucket_rows=None, skip_unchanged=False):
+        """
+        Cleanses the data in the staging_votes_load table, checks for duplicates, and creates
+        the staging_votes table with the typed columns, a status and error descriptions.
+        Every column is parsed once; the typed values are kept so the operational load
+        does not cast again, and the raw values and error description are only built for
+        rejected records.
+
+        Duplicates are found without sorting the load. The records are split into buckets
+        by a hash of their Id, and the buckets are processed one after another. Within a
+        bucket an aggregation on the hashes finds the Ids that may occur more than once,
+        and only their records are grouped by Id to pick the one with the latest
+        CreationDate with arg_max. The other records of those Ids are flagged DUPLICATE
+        by a join against the few duplicated Ids. Records of the same CreationDate are
+        ranked like the windowed deduplication of the fused pipeline: a valid record wins
+        over an invalid one, then the later one in file order. A bucket holds at most
+        dedup_bucket_rows hashes, which bounds the memory of the aggregation.
+
+        Args:
+            column_definitions (dict): The columns and their SQL types, defaults to
+            VOTES_COLUMN_DEFINITIONS. Id and CreationDate are mandatory, the other
+            columns only need to be valid when present.
+            dedup_bucket_rows (int): The number of records per bucket, defaults to the
+            dedup_bucket_rows of the database.
+            skip_unchanged (bool): Mark the records unchanged below the CDC watermark as
+            UNCHANGED while cleansing, see _skip_unchanged_sql.
         """
         table_name_load = "blog_analysis.staging_votes_load"
         table_name = "blog_analysis.staging_votes"
+        column_definitions = column_definitions or VOTES_COLUMN_DEFINITIONS
+        dedup_bucket_rows = dedup_bucket_rows or self.dedup_bucket_rows
         try:
+            load_rows = self.conn.execute(f"SELECT COUNT(*) FROM {table_name_load}").fetchone()[0]
+            buckets = max(1, -(-load_rows // dedup_bucket_rows))
+            self.conn.execute("""
+                CREATE OR REPLACE TEMP TABLE duplicated_vote_ids (
+                    Id VARCHAR,
+                    latest_row BIGINT
+                );
+            """)
+            recency_key_sql = _recency_key_sql(_valid_record_sql(column_definitions), 'rowid')
+            for bucket in range(buckets):
+                # The rowid is the file order of the staged records
+                self.conn.execute(f"""
+                    INSERT INTO duplicated_vote_ids
+                    SELECT Id, arg_max(rowid, {recency_key_sql}) AS latest_row
+                    FROM {table_name_load}
+                    WHERE hash(Id) IN (
+                        SELECT hash(Id)
+                        FROM {table_name_load}
+                        WHERE hash(Id) % {buckets} = {bucket}
+                        GROUP BY hash(Id)
+                        HAVING COUNT(*) > 1
+                    )
+                    GROUP BY Id
+                    HAVING COUNT(*) > 1;
+                """)
+
             # Define the SQL command for data cleansing and deduplication
+            flagged_sql = f"""(
+                SELECT load.*, COALESCE(load.rowid <> duplicated.latest_row, false) AS is_duplicate
+                FROM {table_name_load} load
+                LEFT JOIN duplicated_vote_ids duplicated ON duplicated.Id IS NOT DISTINCT FROM load.Id
+            )"""
+            cleansed_sql = _cleanse_and_deduplicate_sql(flagged_sql, column_definitions, flagged_duplicates=True)
+            if skip_unchanged:
+                cleansed_sql = self._skip_unchanged_sql(cleansed_sql, table_name_load, column_definitions)
             cleanse_dedupe_query = f"""
                 CREATE OR REPLACE TABLE {table_name} AS
-                SELECT 
-                    *,
-                    CASE 
-                        WHEN Id IS NULL OR try_cast(Id as BIGINT) IS NULL THEN 'FAILED'
-                        WHEN CreationDate IS NULL OR try_cast(CreationDate as TIMESTAMP) IS NULL THEN 'FAILED'
-                        WHEN PostId IS NOT NULL AND try_cast(PostId as BIGINT) IS NULL THEN 'FAILED'
-                        WHEN VoteTypeId IS NOT NULL AND try_cast(VoteTypeId as BIGINT) IS NULL THEN 'FAILED'
-                        WHEN UserId IS NOT NULL AND try_cast(UserId as BIGINT) IS NULL THEN 'FAILED'
-                        WHEN BountyAmount IS NOT NULL AND try_cast(BountyAmount as DECIMAL(18,2)) IS NULL THEN 'FAILED'
-                        WHEN rn > 1 THEN 'DUPLICATE'
-                        ELSE 'READYTOLOAD'
-                    END AS staging_status,
-                    CONCAT_WS('; ',
-                        CASE WHEN Id IS NULL OR try_cast(Id as BIGINT) IS NULL THEN 'Invalid Id' ELSE NULL END,
-                        CASE WHEN CreationDate IS NULL OR try_cast(CreationDate as TIMESTAMP) IS NULL THEN 'Invalid CreationDate' ELSE NULL END,
-                        CASE WHEN PostId IS NOT NULL AND try_cast(PostId as BIGINT) IS NULL THEN 'Invalid PostId' ELSE NULL END,
-                        CASE WHEN VoteTypeId IS NOT NULL AND try_cast(VoteTypeId as BIGINT) IS NULL THEN 'Invalid VoteTypeId' ELSE NULL END,
-                        CASE WHEN UserId IS NOT NULL AND try_cast(UserId as BIGINT) IS NULL THEN 'Invalid UserId' ELSE NULL END,
-                        CASE WHEN BountyAmount IS NOT NULL AND try_cast(BountyAmount as DECIMAL(18,2)) IS NULL THEN 'Invalid BountyAmount' ELSE NULL END,
-                        CASE WHEN rn > 1 THEN 'Duplicate record' ELSE NULL END
-                    ) AS error_description
-                FROM (
-                    SELECT 
-                        *,
-                        ROW_NUMBER() OVER (PARTITION BY Id ORDER BY CreationDate DESC) as rn
-                    FROM {table_name_load}
-                ) AS ranked;
+                {cleansed_sql};
             """
 
             # Execute the data cleansing and deduplication command
             self.conn.execute(cleanse_dedupe_query)
+            self.conn.execute("DROP TABLE duplicated_vote_ids;")
+            self.conn.execute("DROP TABLE IF EXISTS held_votes;")
 
-            logging.info(f"Staging table successfully cleansed, duplicates checked, and new table {table_name} created.")
+            logging.info(f"Staging table successfully cleansed, duplicates checked in {buckets} bucket(s), "
+                         f"and new table {table_name} created.")
 
         except Exception as e:
             logging.error(f"Error during data cleansing and deduplication: {e}")
             raise e
 
 
+    def export_staging_table(self, shard_path):
+        """
+        Copies the cleansed blog_analysis.staging_votes table into a new shard database
+        file, for a sharded ingest to combine with combine_shard_staging_tables.
+
+        Args:
+            shard_path (str): The shard database file to create.
+        """
+        try:
+            self.conn.execute(f"ATTACH '{shard_path}' AS vote_shard;")
+            try:
+                self.conn.execute("CREATE SCHEMA IF NOT EXISTS vote_shard.blog_analysis;")
+                self.conn.execute("""
+                    CREATE OR REPLACE TABLE vote_shard.blog_analysis.staging_votes AS
+                    SELECT * FROM blog_analysis.staging_votes;
+                """)
+            finally:
+                self.conn.execute("DETACH vote_shard;")
+            logging.info(f"Staging table exported to {shard_path}.")
+
+        except Exception as e:
+            logging.error(f"Error exporting the staging table to {shard_path}: {e}")
+            raise e
+
+
+    def combine_shard_staging_tables(self, shard_paths, column_definitions=None, skip_unchanged=False):
+        """
+        Attaches the shard databases written by a sharded ingest read-only and combines
+        their cleansed blog_analysis.staging_votes tables into this database's. The
+        shards hold disjoint Ids, so the combined table is deduplicated as a whole.
+
+        Args:
+            shard_paths (list): The shard database files.
+            column_definitions (dict): The columns and their SQL types, defaults to
+            VOTES_COLUMN_DEFINITIONS.
+            skip_unchanged (bool): Mark the records unchanged below the CDC watermark as
+            UNCHANGED while combining, see _skip_unchanged_sql. The shard workers do not
+            see the votes table, so it is done here.
+        """
+        table_name = "blog_analysis.staging_votes"
+        attached = []
+        try:
+            self.conn.execute("CREATE SCHEMA IF NOT EXISTS blog_analysis;")
+            for shard_index, shard_path in enumerate(shard_paths):
+                self.conn.execute(f"ATTACH '{shard_path}' AS vote_shard_{shard_index} (READ_ONLY);")
+                attached.append(f"vote_shard_{shard_index}")
+            union_sql = "\nUNION ALL\n".join([f"SELECT * FROM {shard}.blog_analysis.staging_votes" for shard in attached])
+            if skip_unchanged:
+                union_sql = self._skip_unchanged_sql(union_sql, f"({union_sql})", column_definitions or VOTES_COLUMN_DEFINITIONS)
+            self.conn.execute(f"""
+                CREATE OR REPLACE TABLE {table_name} AS
+                {union_sql};
+            """)
+            self.conn.execute("DROP TABLE IF EXISTS held_votes;")
+            logging.info(f"Table {table_name} combined from {len(shard_paths)} shard(s).")
+
+        except Exception as e:
+            logging.error(f"Error combining the shard staging tables: {e}")
+            raise e
+        finally:
+            for shard in attached:
+                self.conn.execute(f"DETACH {shard};")
+
+
+    def load_json_to_fused_staging(self, file_path, column_definitions=None, skip_unchanged=False):
+        """
+        Fused alternative to load_json_to_staging_table plus cleanse_and_deduplicate_staging_table:
+        streams read_json straight through validation and deduplication into the temporary
+        fused_staging_votes table, which lives in memory (spilling to the temp directory)
+        rather than in the database file. Only the FAILED records are persisted, in
+        blog_analysis.votes_quarantine.
+
+        Args:
+            file_path (str or list): The path, glob or list of paths to the JSON files.
+            column_definitions (dict): The columns and their SQL types, defaults to
+            VOTES_COLUMN_DEFINITIONS.
+            skip_unchanged (bool): Mark the records unchanged below the CDC watermark as
+            UNCHANGED while validating, see _skip_unchanged_sql.
+        """
+        table_name = "fused_staging_votes"
+        column_definitions = column_definitions or VOTES_COLUMN_DEFINITIONS
+        try:
+            cleansed_sql = _cleanse_and_deduplicate_sql(f"({_read_json_sql(file_path, column_definitions)})", column_definitions)
+            if skip_unchanged:
+                # Only the Id and CreationDate are read again to find the held votes
+                key_definitions = {col: column_definitions[col] for col in REQUIRED_COLUMNS}
+                cleansed_sql = self._skip_unchanged_sql(cleansed_sql, f"({_read_json_sql(file_path, key_definitions)})",
+                                                        column_definitions)
+            self.conn.execute(f"""
+                CREATE OR REPLACE TEMP TABLE {table_name} AS
+                {cleansed_sql};
+            """)
+            self.conn.execute("DROP TABLE IF EXISTS held_votes;")
+
+            raw_columns_sql = ', '.join([f"{col} VARCHAR" for col in column_definitions])
+            self.conn.execute(f"""
+                CREATE TABLE IF NOT EXISTS blog_analysis.votes_quarantine (
+                    {raw_columns_sql},
+                    error_description VARCHAR,
+                    quarantined_at TIMESTAMP
+                );
+            """)
+            self.conn.execute(f"""
+                INSERT INTO blog_analysis.votes_quarantine
+                SELECT UNNEST(rejected_values), error_description, current_localtimestamp()
+                FROM {table_name}
+                WHERE staging_status = 'FAILED';
+            """)
+            logging.info(f"Table {table_name} validated and deduplicated from {file_path}, rejected records quarantined.")
+
+        except Exception as e:
+            logging.error(f"Error in fused load of {file_path}: {e}")
+            raise e
+
+
+    def drop_fused_staging(self):
+        """Drops the temporary table of a fused load once it has been merged."""
+        self.conn.execute("DROP TABLE IF EXISTS fused_staging_votes;")
+
+
+    def setup_streaming_dedup_keys(self):
+        """
+        Starts a chunked load by creating the temporary table of the Ids that earlier
+        chunks have already staged, with the recency key of their latest record, valid or
+        not. Only keys are kept, never whole rows.
+        """
+        try:
+            self.conn.execute("""
+                CREATE OR REPLACE TEMP TABLE streamed_vote_keys (
+                    Id BIGINT,
+                    recency_key STRUCT(CreationDate VARCHAR, valid BOOLEAN, file_order BIGINT)
+                );
+            """)
+            logging.info("Streaming dedup keys table is set up successfully.")
+
+        except Exception as e:
+            logging.error(f"Error setting up streaming dedup keys table: {e}")
+            raise e
+
+
+    def deduplicate_staging_against_previous_chunks(self, chunk_number, staging_table="blog_analysis.staging_votes"):
+        """
+        Marks as DUPLICATE the staged records that lose against a record of the same Id
+        from an earlier chunk of the same load, so the records of an Id are ranked across
+        the whole load just as they are within one staging table. A rejected record of an
+        earlier chunk therefore keeps hiding the older records of its Id. The recency keys
+        of the chunk's records are then added to the streamed keys.
+
+        Args:
+            chunk_number (int): The position of the chunk in the load, which orders its
+            records after those of the earlier chunks.
+            staging_table (str): The cleansed staging table of the current chunk.
+        """
+        table_name = staging_table
+        chunk_key_sql = _recency_key_sql("staging_status <> 'FAILED'", chunk_number, "raw_creation_date")
+        try:
+            self.conn.execute(f"""
+                UPDATE {table_name} AS staging
+                SET staging_status = 'DUPLICATE',
+                    error_description = 'Duplicate record'
+                FROM streamed_vote_keys streamed
+                WHERE staging.staging_status = 'READYTOLOAD'
+                    AND streamed.Id = staging.Id
+                    AND streamed.recency_key > {_recency_key_sql('true', chunk_number, 'staging.raw_creation_date')};
+            """)
+            self.conn.execute(f"""
+                CREATE OR REPLACE TEMP TABLE chunk_vote_keys AS
+                SELECT Id, max({chunk_key_sql}) AS recency_key
+                FROM {table_name}
+                WHERE Id IS NOT NULL
+                GROUP BY Id;
+            """)
+            self.conn.execute("""
+                UPDATE streamed_vote_keys AS streamed
+                SET recency_key = greatest(streamed.recency_key, chunk.recency_key)
+                FROM chunk_vote_keys chunk
+                WHERE chunk.Id = streamed.Id;
+            """)
+            self.conn.execute("""
+                INSERT INTO streamed_vote_keys
+                SELECT Id, recency_key
+                FROM chunk_vote_keys
+                WHERE Id NOT IN (SELECT Id FROM streamed_vote_keys);
+            """)
+            self.conn.execute("DROP TABLE chunk_vote_keys;")
+            logging.info("Staging table deduplicated against previously loaded chunks.")
+
+        except Exception as e:
+            logging.error(f"Error deduplicating staging table against previous chunks: {e}")
+            raise e
+
+
+    def drop_streaming_dedup_keys(self):
+        """Ends a chunked load by dropping the streamed keys table."""
+        self.conn.execute("DROP TABLE IF EXISTS streamed_vote_keys;")
+
+
+    def staging_status_counts(self, staging_table="blog_analysis.staging_votes"):
+        """Returns the number of staged records per staging_status."""
+        return dict(self.conn.execute(f"""
+            SELECT staging_status, COUNT(*) FROM {staging_table} GROUP BY staging_status;
+        """).fetchall())
+
+
+    def setup_ingest_manifest(self):
+        """
+        Creates the manifest of ingested files if it does not exist. Every successfully
+        ingested file gets a row with its path, size, mtime and content hash and the
+        result of the batch it was loaded in.
+        """
+        try:
+            self.conn.execute("CREATE SCHEMA IF NOT EXISTS blog_analysis;")
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS blog_analysis.ingest_manifest (
+                    batch_id BIGINT,
+                    file_path VARCHAR,
+                    file_size BIGINT,
+                    file_mtime_ns BIGINT,
+                    content_hash VARCHAR,
+                    status VARCHAR,
+                    load_mode VARCHAR,
+                    rows_loaded BIGINT,
+                    rows_rejected BIGINT,
+                    rows_duplicate BIGINT,
+                    ingested_at TIMESTAMP
+                );
+            """)
+        except Exception as e:
+            logging.error(f"Error setting up the ingest manifest: {e}")
+            raise e
+
+
+    def is_file_ingested(self, file_path, file_size, file_mtime_ns):
+        """Tells whether a file with this path, size and mtime is in the manifest."""
+        self.setup_ingest_manifest()
+        return self.conn.execute("""
+            SELECT COUNT(*) > 0 FROM blog_analysis.ingest_manifest
+            WHERE file_path = ? AND file_size = ? AND file_mtime_ns = ?;
+        """, [file_path, file_size, file_mtime_ns]).fetchone()[0]
+
+
+    def is_content_ingested(self, content_hash):
+        """Tells whether a file with this content hash is in the manifest."""
+        self.setup_ingest_manifest()
+        return self.conn.execute("""
+            SELECT COUNT(*) > 0 FROM blog_analysis.ingest_manifest WHERE content_hash = ?;
+        """, [content_hash]).fetchone()[0]
+
+
+    def record_ingested_files(self, files, status='LOADED', load_mode=None, status_counts=None):
+        """
+        Adds the files of one batch to the manifest.
+
+        Args:
+            files (list): Dicts with the file_path, file_size, file_mtime_ns and content_hash of each file.
+            status (str): 'LOADED' for files that were processed, 'SKIPPED' for copies of
+                content that was already loaded.
+            load_mode (str): The load mode of the batch.
+            status_counts (dict): The number of staged records per staging_status in the batch.
+        """
+        status_counts = status_counts or {}
+        try:
+            self.setup_ingest_manifest()
+            batch_id = self.conn.execute("SELECT COALESCE(MAX(batch_id), 0) + 1 FROM blog_analysis.ingest_manifest;").fetchone()[0]
+            self.conn.executemany("""
+                INSERT INTO blog_analysis.ingest_manifest
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, current_localtimestamp());
+            """, [[batch_id, file['file_path'], file['file_size'], file['file_mtime_ns'], file['content_hash'],
+                   status, load_mode, status_counts.get('READYTOLOAD', 0), status_counts.get('FAILED', 0),
+                   status_counts.get('DUPLICATE', 0)] for file in files])
+            logging.info(f"Batch {batch_id} of {len(files)} file(s) recorded in the ingest manifest as {status}.")
+
+        except Exception as e:
+            logging.error(f"Error recording ingested files in the manifest: {e}")
+            raise e
+
+
+    def setup_ingest_watermark(self):
+        """
+        Ensures the blog_analysis.ingest_watermark table exists. It holds a single row,
+        the greatest (CreationDate, Id) merged by a CDC load; when it is created next to
+        an already populated votes table it starts from that table's greatest key.
+        """
+        try:
+            self.conn.execute("CREATE SCHEMA IF NOT EXISTS blog_analysis;")
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS blog_analysis.ingest_watermark (
+                    CreationDate TIMESTAMP,
+                    Id BIGINT,
+                    updated_at TIMESTAMP
+                );
+            """)
+            watermark_exists = self.conn.execute("SELECT COUNT(*) FROM blog_analysis.ingest_watermark;").fetchone()[0]
+            votes_exists = self.conn.execute("""
+                SELECT COUNT(*)
+                FROM information_schema.tables
+                WHERE table_schema = 'blog_analysis' AND table_name = 'votes';
+            """).fetchone()[0]
+            if not watermark_exists and votes_exists:
+                self.conn.execute(f"""
+                    INSERT INTO blog_analysis.ingest_watermark
+                    SELECT CreationDate, Id, current_localtimestamp()
+                    FROM {self._votes_history_table()}
+                    ORDER BY CreationDate DESC, Id DESC
+                    LIMIT 1;
+                """)
+
+        except Exception as e:
+            logging.error(f"Error setting up the ingest watermark: {e}")
+            raise e
+
+
+    def get_ingest_watermark(self):
+        """Returns the (CreationDate, Id) watermark of CDC loads, or None before the first one."""
+        self.setup_ingest_watermark()
+        return self.conn.execute("SELECT CreationDate, Id FROM blog_analysis.ingest_watermark;").fetchone()
+
+
+    def _skip_unchanged_sql(self, staged_sql, source_sql, column_mappings):
+        """
+        Wraps a query returning cleansed staged records so that the READYTOLOAD records at
+        or below the CDC watermark that are identical to the vote already held for their Id
+        come out as UNCHANGED, and only new records and genuine corrections go on to the
+        merge. The held votes are first collected into the temp table held_votes, for the
+        batch Ids at or below the watermark that the Id summary flags as held, so records
+        above the watermark and new Ids are never looked up in the votes table. The caller
+        drops held_votes once the wrapped query has run.
+
+        Args:
+            staged_sql (str): The query returning the cleansed records.
+            source_sql (str): A relation with the Id and CreationDate of the batch records,
+            raw or typed, to find the held votes to compare with.
+            column_mappings (dict): The vote columns to compare.
+        """
+        self.setup_schema('votes', column_mappings)
+        watermark = self.get_ingest_watermark()
+        if watermark is None:
+            return staged_sql
+        self.setup_votes_id_summary()
+        watermark_date, watermark_id = watermark
+        held_columns_sql = ', '.join(f"votes.{column_name} AS held_{column_name}" for column_name in column_mappings)
+        self.conn.execute(f"""
+            CREATE OR REPLACE TEMP TABLE held_votes AS
+            SELECT {held_columns_sql}
+            FROM {self._votes_history_table()} votes
+            WHERE votes.Id IN (
+                SELECT batch.Id
+                FROM (
+                    SELECT try_cast(Id AS BIGINT) AS Id, try_cast(CreationDate AS TIMESTAMP) AS CreationDate
+                    FROM {source_sql} source
+                ) batch
+                JOIN blog_analysis.votes_id_blocks blocks
+                    ON blocks.block = batch.Id >> {ID_BLOCK_BITS}
+                WHERE (batch.CreationDate < TIMESTAMP '{watermark_date}'
+                        OR (batch.CreationDate = TIMESTAMP '{watermark_date}' AND batch.Id <= {watermark_id}))
+                    AND (blocks.mask >> (batch.Id & {2 ** ID_BLOCK_BITS - 1})::INTEGER) & 1 = 1
+            );
+        """)
+        unchanged_sql = ' AND '.join(
+            f"held.held_{column_name} IS NOT DISTINCT FROM staged.{column_name}" for column_name in column_mappings)
+        return f"""
+            SELECT staged.* REPLACE (
+                CASE
+                    WHEN staged.staging_status = 'READYTOLOAD'
+                        AND (staged.CreationDate < TIMESTAMP '{watermark_date}'
+                            OR (staged.CreationDate = TIMESTAMP '{watermark_date}' AND staged.Id <= {watermark_id}))
+                        AND {unchanged_sql}
+                        THEN 'UNCHANGED'
+                    ELSE staged.staging_status
+                END AS staging_status
+            )
+            FROM ({staged_sql}) staged
+            LEFT JOIN held_votes held ON held.held_Id = staged.Id"""
+
+
+    def advance_ingest_watermark(self, staging_table="blog_analysis.staging_votes"):
+        """
+        Moves the watermark up to the greatest (CreationDate, Id) of the merged batch.
+        It is advanced only after the merge commits, so a failed load leaves it behind,
+        which costs comparisons but never skips a record.
+
+        Args:
+            staging_table (str): The staging table of the merged batch.
+        """
+        try:
+            self.setup_ingest_watermark()
+            self.conn.execute(f"""
+                CREATE OR REPLACE TEMP TABLE next_ingest_watermark AS
+                SELECT CreationDate, Id
+                FROM (
+                    SELECT CreationDate, Id FROM blog_analysis.ingest_watermark
+                    UNION ALL
+                    SELECT CreationDate, Id FROM {staging_table} WHERE staging_status = 'READYTOLOAD'
+                ) candidates
+                ORDER BY CreationDate DESC, Id DESC
+                LIMIT 1;
+            """)
+            self.conn.begin()
+            try:
+                self.conn.execute("DELETE FROM blog_analysis.ingest_watermark;")
+                self.conn.execute("""
+                    INSERT INTO blog_analysis.ingest_watermark
+                    SELECT CreationDate, Id, current_localtimestamp() FROM next_ingest_watermark;
+                """)
+            except Exception:
+                self.conn.rollback()
+                raise
+            self.conn.commit()
+            self.conn.execute("DROP TABLE next_ingest_watermark;")
+
+        except Exception as e:
+            logging.error(f"Error advancing the ingest watermark: {e}")
+            raise e
+
+
+    def setup_votes_id_summary(self):
+        """
+        Ensures the membership summary of the operational Ids exists: the Id range held
+        in blog_analysis.votes_id_range and the per-block bitmaps of
+        blog_analysis.votes_id_blocks. When it is created next to an already populated
+        votes table it is built once from that table.
+        """
+        try:
+            self.conn.execute("CREATE SCHEMA IF NOT EXISTS blog_analysis;")
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS blog_analysis.votes_id_range (
+                    min_id BIGINT,
+                    max_id BIGINT
+                );
+            """)
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS blog_analysis.votes_id_blocks (
+                    block BIGINT PRIMARY KEY,
+                    mask UBIGINT
+                );
+            """)
+            summary_exists = self.conn.execute("SELECT COUNT(*) FROM blog_analysis.votes_id_range;").fetchone()[0]
+            votes_exists = self.conn.execute("""
+                SELECT COUNT(*)
+                FROM information_schema.tables
+                WHERE table_schema = 'blog_analysis' AND table_name = 'votes';
+            """).fetchone()[0]
+            if not summary_exists and votes_exists:
+                self._add_to_votes_id_summary(f"SELECT Id FROM {self._votes_history_table()}")
+
+        except Exception as e:
+            logging.error(f"Error setting up the votes Id summary: {e}")
+            raise e
+
+
+    def rebuild_votes_id_summary(self):
+        """
+        Rebuilds the Id summary from blog_analysis.votes. Deleted votes leave their bits
+        set, which only costs needless probes, so this is only needed to tighten it.
+        """
+        try:
+            self.conn.execute("DELETE FROM blog_analysis.votes_id_range;")
+            self.conn.execute("DELETE FROM blog_analysis.votes_id_blocks;")
+            self._add_to_votes_id_summary(f"SELECT Id FROM {self._votes_history_table()}")
+            logging.info("Votes Id summary rebuilt from the operational table.")
+
+        except Exception as e:
+            logging.error(f"Error rebuilding the votes Id summary: {e}")
+            raise e
+
+
+    def _add_to_votes_id_summary(self, ids_query):
+        self.conn.execute(f"""
+            INSERT INTO blog_analysis.votes_id_blocks
+            SELECT Id >> {ID_BLOCK_BITS}, bit_or(1::UBIGINT << (Id & {2 ** ID_BLOCK_BITS - 1})::INTEGER)
+            FROM ({ids_query}) ids
+            GROUP BY ALL
+            ON CONFLICT (block) DO UPDATE SET mask = mask | excluded.mask;
+        """)
+        self.conn.execute(f"""
+            CREATE OR REPLACE TEMP TABLE next_votes_id_range AS
+            SELECT MIN(min_id) AS min_id, MAX(max_id) AS max_id
+            FROM (
+                SELECT min_id, max_id FROM blog_analysis.votes_id_range
+                UNION ALL
+                SELECT MIN(Id), MAX(Id) FROM ({ids_query}) ids
+            ) ranges
+            HAVING MIN(min_id) IS NOT NULL;
+        """)
+        self.conn.execute("DELETE FROM blog_analysis.votes_id_range;")
+        self.conn.execute("INSERT INTO blog_analysis.votes_id_range SELECT * FROM next_votes_id_range;")
+        self.conn.execute("DROP TABLE next_votes_id_range;")
+
+
+    def _stage_existing_id_candidates(self, staging_table):
+        """
+        Collects into the temp table existing_id_candidates the READYTOLOAD Ids of the
+        batch that may already be held in blog_analysis.votes: those inside the held Id
+        range whose bit is set in the block bitmaps. Every other batch Id is new, so the
+        merge never probes the votes table for it.
+
+        Returns:
+            tuple: The number of candidates and their smallest and largest Id.
+        """
+        self.setup_votes_id_summary()
+        self.conn.execute(f"""
+            CREATE OR REPLACE TEMP TABLE existing_id_candidates AS
+            SELECT staging.Id
+            FROM {staging_table} staging
+            JOIN blog_analysis.votes_id_range id_range
+                ON staging.Id BETWEEN id_range.min_id AND id_range.max_id
+            JOIN blog_analysis.votes_id_blocks blocks
+                ON blocks.block = staging.Id >> {ID_BLOCK_BITS}
+            WHERE staging.staging_status = 'READYTOLOAD'
+                AND (blocks.mask >> (staging.Id & {2 ** ID_BLOCK_BITS - 1})::INTEGER) & 1 = 1;
+        """)
+        candidates = self.conn.execute("SELECT COUNT(*), MIN(Id), MAX(Id) FROM existing_id_candidates;").fetchone()
+        logging.info(f"{candidates[0]} batch records may replace existing votes, the others are new.")
+        return candidates
+
+
     def move_data_to_operational(self, table_mappings):
         """
         Deletes existing records in the operational table and moves unique data from
@@ -174,19 +1128,20 @@ class BlogAnalysisDB:
             table_mappings (dict): A dictionary mapping operational table columns to staging table columns.
         """
         try:
-            # Step 1: Deleting matching records in the operational table
-            delete_query = """
-                DELETE FROM blog_analysis.votes
-                WHERE EXISTS (
-                    SELECT 1 
-                    FROM blog_analysis.staging_votes 
-                    WHERE blog_analysis.staging_votes.Id = blog_analysis.votes.Id
-                    AND staging_status = 'READYTOLOAD'
-
-                );
-            """
-            self.conn.execute(delete_query)
-            logging.info("Existing matching records deleted from the operational table.")
+            # Step 1: Deleting matching records in the operational table, only the batch Ids
+            # the Id summary cannot rule out are looked up
+            candidate_count, _, _ = self._stage_existing_id_candidates("blog_analysis.staging_votes")
+            if candidate_count:
+                delete_query = """
+                    DELETE FROM blog_analysis.votes
+                    WHERE EXISTS (
+                        SELECT 1
+                        FROM existing_id_candidates
+                        WHERE existing_id_candidates.Id = blog_analysis.votes.Id
+                    );
+                """
+                self.conn.execute(delete_query)
+                logging.info("Existing matching records deleted from the operational table.")
 
             # Step 2: Construct the dynamic column part of the SQL query from the table_mappings
             operational_columns = ', '.join(table_mappings.keys())
@@ -204,78 +1159,88 @@ class BlogAnalysisDB:
             """
 
             self.conn.execute(insert_query)
+            self._add_to_votes_id_summary("""
+                SELECT Id FROM blog_analysis.staging_votes WHERE staging_status = 'READYTOLOAD'
+            """)
             logging.info("Unique records successfully moved from staging to operational.")
 
-            # Final step 4: Create indexes on specific columns in the operational table
-            index_columns = ['Id', 'CreationDate']  # Specify only the columns you need indexed
-            for column_name in index_columns:
-                try:
-                    # In SQL databases supporting index drop
-                    self.conn.execute(f"DROP INDEX IF EXISTS {column_name}_idx;")
-                except Exception as e:
-                    logging.info(f"Could not drop index {column_name}_idx. Reason: {e}")
-
-                self.conn.execute(f"CREATE INDEX IF NOT EXISTS {column_name}_idx ON blog_analysis.votes ({column_name});")
+            # Final step 4: Indexes that already exist were maintained by the insert
+            self.apply_votes_layout()
 
+            self.rebuild_weekly_vote_counts()
 
         except Exception as e:
             logging.error(f"Error moving data from staging to operational: {e}")
             raise e
 
 
-    def move_data_to_operational_with_ctas(self, column_mappings):
+    def move_data_to_operational_with_ctas(self, column_mappings, staging_table="blog_analysis.staging_votes"):
         """
         Merges existing records in the operational table with new and updated records
-        from the staging table using a CTAS approach. Also adds indexes to the new table.
+        from the staging table using a CTAS approach. The new table is indexed or sorted
+        by CreationDate depending on the storage layout.
 
         Args:
             column_mappings (dict): Mapping of column names from staging to operational table
             with data types.
+            staging_table (str): The cleansed staging table to load from.
         """
         try:
             # Step 0: Ensure the operational table exists
             self.setup_schema("votes",column_mappings)
 
+            if self.layout == 'partitioned':
+                self._stage_existing_id_candidates(staging_table)
+                self._replace_partitioned_votes(
+                    """
+                        SELECT Id, CreationDate, VoteTypeId
+                        FROM blog_analysis.votes
+                        WHERE Id IN (SELECT Id FROM existing_id_candidates)
+                    """,
+                    f"SELECT * FROM {staging_table} WHERE staging_status = 'READYTOLOAD'",
+                    column_mappings, rebuild=True)
+                logging.info("Operational partitions successfully rewritten with the combined data.")
+                return
+
             # Step 1: Construct column SQL for SELECT clause based on column mappings
             select_sql_schema = ', '.join([f"{src_col}" for src_col in column_mappings.keys()])
             select_sql_operational = ', '.join([f"operational.{dest_col}" for dest_col in column_mappings.keys()])
-            select_sql_schema_cast = ', '.join([f"cast({col_name} AS {data_type}) AS {col_name}" 
-                                                for col_name, data_type in column_mappings.items()])
             
-            # Step 2: Combined dataset of unique latest records from staging and unmatched records from operational
+            # Step 2: Combined dataset of unique latest records from staging and unmatched records
+            # from operational. Batch Ids the Id summary rules out cannot match, so only the
+            # candidates are joined against.
+            self._stage_existing_id_candidates(staging_table)
+            self._remove_archived_votes("SELECT Id FROM existing_id_candidates", column_mappings)
             combined_table_query = f"""
                 CREATE OR REPLACE TABLE combined_votes AS
                 SELECT {select_sql_schema}
-                FROM blog_analysis.staging_votes
+                FROM {staging_table}
                 WHERE staging_status = 'READYTOLOAD'
 
                 UNION ALL
                 
                 SELECT {select_sql_operational}
                 FROM blog_analysis.votes operational
-                LEFT JOIN blog_analysis.staging_votes staging ON operational.Id = staging.Id
-                    AND staging_status = 'READYTOLOAD' -- make sure only clean data makes it to the comparison. 
+                LEFT JOIN existing_id_candidates staging ON operational.Id = staging.Id
                 WHERE staging.Id IS NULL ;
             """
             self.conn.execute(combined_table_query)
 
-            # Step 3: Recreate the operational table with the combined dataset
+            # Step 3: Recreate the operational table with the combined dataset, the staging
+            # columns are already typed so no cast is needed
             recreate_operational_table = f"""
                 CREATE OR REPLACE TABLE blog_analysis.votes AS
-                SELECT {select_sql_schema_cast} FROM combined_votes;
+                SELECT {select_sql_schema} FROM combined_votes
+                {self._votes_order_sql()};
             """
             self.conn.execute(recreate_operational_table)
 
-            # Final step 4: Create indexes on specific columns in the operational table
-            index_columns = ['Id', 'CreationDate']  # Specify only the columns you need indexed
-            for column_name in index_columns:
-                try:
-                    # In SQL databases supporting index drop
-                    self.conn.execute(f"DROP INDEX IF EXISTS {column_name}_idx;")
-                except Exception as e:
-                    logging.info(f"Could not drop index {column_name}_idx. Reason: {e}")
+            # Final step 4: The replaced table lost its indexes, the indexed layout builds them again
+            self.apply_votes_layout()
+            self._add_to_votes_id_summary(f"SELECT Id FROM {staging_table} WHERE staging_status = 'READYTOLOAD'")
 
-                self.conn.execute(f"CREATE INDEX IF NOT EXISTS {column_name}_idx ON blog_analysis.votes ({column_name});")
+            # Step 5: The whole table was rewritten, so rebuild the weekly aggregate with it
+            self.rebuild_weekly_vote_counts()
 
             logging.info("Operational table successfully updated with combined data and indexes using CTAS approach.")
 
@@ -284,54 +1249,961 @@ class BlogAnalysisDB:
             raise e
 
 
-    def create_outlier_weeks_view(self):
-        """Create or replace the 'outlier_weeks' view in the database."""
-        try:
-            query = """
-                CREATE OR REPLACE VIEW blog_analysis.outlier_weeks AS
-                WITH WeeklyVotes AS (
-                    SELECT
-                        EXTRACT(YEAR FROM CreationDate) AS Year,
-                        CASE 
-                            WHEN EXTRACT(MONTH FROM CreationDate) = 1 
-                                    AND EXTRACT(DAY FROM CreationDate) <= 7 
-                                    AND EXTRACT(ISODOW FROM CreationDate) >= 4 
-                                THEN 0 -- Assign 'week 0' for days in the first week of January that would traditionally be part of the last week of the previous year according to ISO standards
-                            ELSE
-                                EXTRACT(WEEK FROM CreationDate) -- Use standard week number for other cases
-                        END AS CustomWeekNumber,
-                        COUNT(*) AS VoteCount
+    def move_data_to_operational_with_merge(self, column_mappings, staging_table="blog_analysis.staging_votes"):
+        """
+        Upserts the READYTOLOAD records from the staging table into the operational table
+        in place. Only the rows whose Id appears in the batch are deleted and re-inserted,
+        so the cost of a load scales with the batch rather than with the whole table.
+        In the indexed layout the indexes are created once and then maintained by DuckDB
+        on every insert; in the sorted layout the batch is appended in CreationDate order.
+
+        Args:
+            column_mappings (dict): Mapping of column names from staging to operational table
+            with data types.
+            staging_table (str): The cleansed staging table to load from.
+        """
+        try:
+            # Step 0: Ensure the operational table, its layout and the weekly aggregate exist
+            self.setup_schema("votes", column_mappings)
+            self.setup_weekly_vote_counts()
+            self.apply_votes_layout()
+
+            # Step 1: Construct column SQL for the INSERT based on column mappings
+            operational_columns = ', '.join(column_mappings.keys())
+
+            # Step 2: Only the batch Ids the Id summary cannot rule out are looked up in the
+            # votes table, and only within their Id range so zonemaps skip the other row groups
+            candidate_count, min_candidate_id, max_candidate_id = self._stage_existing_id_candidates(staging_table)
+            replaced_votes_sql = f"""
+                FROM blog_analysis.votes
+                WHERE Id BETWEEN {min_candidate_id} AND {max_candidate_id}
+                    AND Id IN (SELECT Id FROM existing_id_candidates)
+            """
+
+            if candidate_count:
+                # A correction of an archived vote replaces it in the archive as well
+                self._remove_archived_votes("SELECT Id FROM existing_id_candidates", column_mappings,
+                                            min_candidate_id, max_candidate_id)
+
+            if self.layout == 'partitioned':
+                self._replace_partitioned_votes(
+                    f"SELECT Id, CreationDate, VoteTypeId {replaced_votes_sql}" if candidate_count else None,
+                    f"SELECT * FROM {staging_table} WHERE staging_status = 'READYTOLOAD'",
+                    column_mappings)
+                logging.info("Operational partitions successfully upserted with the staged batch.")
+                return
+
+            # Step 3: Replace the batch rows in a single transaction, so readers never see
+            # a half-applied load
+            self.conn.begin()
+            try:
+                # The replaced rows leave their old week and the batch rows join their new one
+                replaced_dates_sql = f"""
+                    SELECT CreationDate, VoteTypeId, -1 AS Sign
+                    {replaced_votes_sql}
+
+                    UNION ALL
+
+                """ if candidate_count else ""
+                self._stage_vote_count_deltas(f"""
+                    {replaced_dates_sql}
+                    SELECT CreationDate, VoteTypeId, 1 AS Sign
+                    FROM {staging_table}
+                    WHERE staging_status = 'READYTOLOAD'
+                """)
+
+                if candidate_count:
+                    self.conn.execute(f"DELETE {replaced_votes_sql};")
+
+                insert_query = f"""
+                    INSERT INTO blog_analysis.votes ({operational_columns})
+                    SELECT {operational_columns}
+                    FROM {staging_table}
+                    WHERE staging_status = 'READYTOLOAD'
+                    {self._votes_order_sql()};
+                """
+                self.conn.execute(insert_query)
+                self._apply_vote_count_deltas()
+                self._add_to_votes_id_summary(f"SELECT Id FROM {staging_table} WHERE staging_status = 'READYTOLOAD'")
+            except Exception:
+                self.conn.rollback()
+                raise
+            # DuckDB rolls a failed commit back itself, so it is left out of the rollback above
+            self.conn.commit()
+
+            logging.info("Operational table successfully upserted in place with the staged batch.")
+
+        except Exception as e:
+            logging.error(f"Error merging staged batch into operational table: {e}")
+            raise e
+
+
+    def _votes_order_sql(self):
+        return "ORDER BY CreationDate, Id" if self.layout == 'sorted' else ""
+
+
+    def apply_votes_layout(self):
+        """
+        Brings the indexes of blog_analysis.votes in line with the storage layout: the
+        indexed layout creates the missing ones, which DuckDB then maintains on every
+        insert, and the sorted layout drops them, since its loads and scans do not use them.
+        The partitioned layout has no table to index.
+        """
+        try:
+            for column_name in INDEXED_COLUMNS:
+                if self.layout == 'indexed':
+                    self.conn.execute(f"CREATE INDEX IF NOT EXISTS {column_name}_idx ON blog_analysis.votes ({column_name});")
+                elif self.layout == 'sorted':
+                    self.conn.execute(f"DROP INDEX IF EXISTS blog_analysis.{column_name}_idx;")
+        except Exception as e:
+            logging.error(f"Error applying the {self.layout} layout to the operational table: {e}")
+            raise e
+
+
+    def cluster_votes(self):
+        """
+        Rewrites blog_analysis.votes in CreationDate order. Merged batches are appended in
+        order, but each one overlaps the dates of the ones before it, so a periodic rewrite
+        keeps the zonemaps tight. The indexed layout rebuilds its indexes afterwards.
+        Partitions are always written in CreationDate order, so they are left as they are.
+        """
+        if self.layout == 'partitioned':
+            logging.info("Operational partitions are already written in CreationDate order.")
+            return
+        try:
+            self.conn.execute("""
+                CREATE OR REPLACE TABLE blog_analysis.votes AS
+                SELECT * FROM blog_analysis.votes
+                ORDER BY CreationDate, Id;
+            """)
+            self.apply_votes_layout()
+            logging.info("Operational table rewritten in CreationDate order.")
+        except Exception as e:
+            logging.error(f"Error clustering the operational table: {e}")
+            raise e
+
+
+    def _partition_files(self, partitions=None, root=None):
+        """Lists the Parquet files of the given (Year, WeekNumber) partitions, or of all of them."""
+        root = root or self.partition_path
+        if partitions is None:
+            partitions = [('*', '*')]
+        return sorted(file_path for year, week in partitions
+                      for file_path in glob.glob(os.path.join(root, f'Year={year}', f'WeekNumber={week}', '*.parquet')))
+
+
+    def _partitions_sql(self, root, column_definitions):
+        """Returns the query reading the partitions under root with their Year and WeekNumber."""
+        if self._partition_files(root=root):
+            partitions_glob = os.path.join(root, 'Year=*', 'WeekNumber=*', '*.parquet')
+            return f"SELECT * FROM read_parquet({_files_sql(partitions_glob)}, hive_partitioning = true)"
+        # read_parquet fails on a glob without matches, so an empty store is an empty typed relation
+        null_columns_sql = ', '.join(f"NULL::{data_type} AS {col}" for col, data_type in column_definitions.items())
+        return f"SELECT {null_columns_sql}, NULL::BIGINT AS Year, NULL::BIGINT AS WeekNumber WHERE false"
+
+
+    def setup_partitioned_votes(self, column_definitions=VOTES_COLUMN_DEFINITIONS):
+        """
+        Creates the views of the partitioned layout over the Parquet partitions:
+        blog_analysis.votes with the vote columns, and blog_analysis.votes_partitioned,
+        which adds the Year and WeekNumber partition columns so that filters on them
+        skip whole partitions.
+
+        Args:
+            column_definitions (dict): The vote columns and their types.
+        """
+        try:
+            os.makedirs(self.partition_path, exist_ok=True)
+            self.conn.execute("CREATE SCHEMA IF NOT EXISTS blog_analysis;")
+            self.conn.execute(f"""
+                CREATE OR REPLACE VIEW blog_analysis.votes_partitioned AS
+                {self._partitions_sql(self.partition_path, column_definitions)};
+            """)
+            self.conn.execute(f"""
+                CREATE OR REPLACE VIEW blog_analysis.votes AS
+                SELECT {', '.join(column_definitions)} FROM blog_analysis.votes_partitioned;
+            """)
+            logging.info(f"Votes view set up over the partitions in {self.partition_path}.")
+
+        except Exception as e:
+            logging.error(f"Error setting up the partitioned votes in {self.partition_path}: {e}")
+            raise e
+
+
+    def _write_vote_partitions(self, rows_sql, partitions=None, root=None, compression=None):
+        """
+        Writes the votes of rows_sql as Parquet partitioned by Year and WeekNumber, in
+        CreationDate order, and swaps them in for the given (Year, WeekNumber) partitions,
+        or for the whole store when partitions is None. The files are written to a
+        scratch directory first, so a failed write leaves the current partitions untouched.
+        """
+        root = root or self.partition_path
+        os.makedirs(root, exist_ok=True)
+        year_sql, week_sql = _custom_week_sql("CreationDate")
+        compression_sql = f", COMPRESSION {compression}" if compression else ""
+        write_dir = tempfile.mkdtemp(prefix='.write-', dir=root)
+        try:
+            self.conn.execute(f"""
+                COPY (
+                    SELECT *, {year_sql} AS Year, {week_sql} AS WeekNumber
+                    FROM ({rows_sql}) partition_rows
+                    ORDER BY CreationDate, Id
+                ) TO {_files_sql(write_dir)} (FORMAT PARQUET, PARTITION_BY (Year, WeekNumber), OVERWRITE_OR_IGNORE{compression_sql});
+            """)
+            if partitions is None:
+                partitions = [('*', '*')]
+            replaced_dirs = [partition_dir for year, week in partitions
+                             for partition_dir in glob.glob(os.path.join(root, f'Year={year}', f'WeekNumber={week}'))]
+            replaced_root = os.path.join(write_dir, '.replaced')
+            for partition_dir in replaced_dirs:
+                os.renames(partition_dir, os.path.join(replaced_root, os.path.relpath(partition_dir, root)))
+            for partition_dir in glob.glob(os.path.join(write_dir, 'Year=*', 'WeekNumber=*')):
+                os.renames(partition_dir, os.path.join(root, os.path.relpath(partition_dir, write_dir)))
+        finally:
+            shutil.rmtree(write_dir, ignore_errors=True)
+        logging.info(f"{len(replaced_dirs)} partition(s) replaced in {root}.")
+
+
+    def _rewrite_vote_partitions(self, removed_votes_sql, added_sql, column_mappings, root, compression=None,
+                                 kept_sql=None):
+        """
+        Removes and adds votes in the Parquet partitions under root. Only the partitions
+        that lose or gain a vote are rewritten, unless kept_sql gives the votes to keep,
+        in which case every partition is. The removed votes are left in the temp table
+        removed_votes for the caller's bookkeeping.
+
+        Args:
+            removed_votes_sql (str): A query returning the Id, CreationDate and VoteTypeId
+                of the held votes to remove, or None.
+            added_sql (str): A query returning the vote columns of the votes to add, or None.
+            column_mappings (dict): The vote columns.
+            root (str): The directory of the partitions.
+            compression (str): The Parquet compression codec, DuckDB's default if None.
+            kept_sql (str): A query returning every vote to keep, for a full rewrite.
+        """
+        columns_sql = ', '.join(column_mappings.keys())
+        year_sql, week_sql = _custom_week_sql("CreationDate")
+        self.conn.execute(f"""
+            CREATE OR REPLACE TEMP TABLE removed_votes AS
+            {removed_votes_sql or "SELECT NULL::BIGINT AS Id, NULL::TIMESTAMP AS CreationDate, NULL::BIGINT AS VoteTypeId WHERE false"};
+        """)
+        kept_filter_sql = "WHERE Id NOT IN (SELECT Id FROM removed_votes)"
+
+        if kept_sql:
+            partitions = None
+            kept_sql = f"SELECT {columns_sql} FROM ({kept_sql}) kept {kept_filter_sql}"
+        else:
+            added_dates_sql = f"UNION ALL SELECT CreationDate FROM ({added_sql}) added" if added_sql else ""
+            partitions = self.conn.execute(f"""
+                SELECT DISTINCT {year_sql} AS Year, {week_sql} AS WeekNumber
+                FROM (SELECT CreationDate FROM removed_votes {added_dates_sql}) dates;
+            """).fetchall()
+            # Only the files of the touched partitions are read back
+            partition_files = self._partition_files(partitions, root)
+            kept_sql = (f"SELECT {columns_sql} FROM read_parquet({_files_sql(partition_files)}) {kept_filter_sql}"
+                        if partition_files else None)
+
+        rows_sql = ' UNION ALL '.join(query for query in (kept_sql, added_sql) if query)
+        if rows_sql and partitions != []:
+            self._write_vote_partitions(rows_sql, partitions, root, compression)
+
+
+    def _replace_partitioned_votes(self, removed_votes_sql, added_rows_sql, column_mappings, rebuild=False):
+        """
+        Removes and adds votes in the partitioned layout, rewriting only the partitions
+        that lose or gain a vote, or every partition with rebuild. The weekly vote counts
+        and the Id summary follow in one transaction once the files are in place.
+
+        Args:
+            removed_votes_sql (str): A query returning the Id, CreationDate and VoteTypeId
+                of the held votes to remove, or None.
+            added_rows_sql (str): A query returning the votes to add, or None.
+            column_mappings (dict): The vote columns.
+            rebuild (bool): Rewrite every partition rather than only the touched ones.
+        """
+        columns_sql = ', '.join(column_mappings.keys())
+        added_sql = f"SELECT {columns_sql} FROM ({added_rows_sql}) added" if added_rows_sql else None
+        self._rewrite_vote_partitions(removed_votes_sql, added_sql, column_mappings, self.partition_path,
+                                      kept_sql="SELECT * FROM blog_analysis.votes" if rebuild else None)
+        self.setup_partitioned_votes(column_mappings)
+
+        self.conn.begin()
+        try:
+            if rebuild:
+                self.rebuild_weekly_vote_counts()
+            else:
+                added_signed_sql = f"UNION ALL SELECT CreationDate, VoteTypeId, 1 AS Sign FROM ({added_sql}) added" if added_sql else ""
+                self._stage_vote_count_deltas(f"SELECT CreationDate, VoteTypeId, -1 AS Sign FROM removed_votes {added_signed_sql}")
+                self._apply_vote_count_deltas()
+            if added_sql:
+                self._add_to_votes_id_summary(f"SELECT Id FROM ({added_sql}) added")
+        except Exception:
+            self.conn.rollback()
+            raise
+        self.conn.commit()
+        self.conn.execute("DROP TABLE removed_votes;")
+
+
+    def _archive_exists(self):
+        return self.conn.execute("""
+            SELECT COUNT(*)
+            FROM information_schema.tables
+            WHERE table_schema = 'blog_analysis' AND table_name = 'votes_archive';
+        """).fetchone()[0] > 0
+
+
+    def _votes_history_table(self):
+        """Returns the relation holding every vote: the history view once votes have been archived."""
+        return "blog_analysis.votes_history" if self._archive_exists() else "blog_analysis.votes"
+
+
+    def setup_votes_archive(self, column_definitions=VOTES_COLUMN_DEFINITIONS):
+        """
+        Creates the views over the cold tier: blog_analysis.votes_archive over the
+        archived Parquet partitions, and blog_analysis.votes_history, the union of the hot
+        votes table and the archive that holds the full history.
+
+        Args:
+            column_definitions (dict): The vote columns and their types.
+        """
+        try:
+            columns_sql = ', '.join(column_definitions)
+            self.conn.execute(f"""
+                CREATE OR REPLACE VIEW blog_analysis.votes_archive AS
+                {self._partitions_sql(self.archive_path, column_definitions)};
+            """)
+            self.conn.execute(f"""
+                CREATE OR REPLACE VIEW blog_analysis.votes_history AS
+                SELECT {columns_sql} FROM blog_analysis.votes
+                UNION ALL
+                SELECT {columns_sql} FROM blog_analysis.votes_archive;
+            """)
+            logging.info(f"Votes history view set up over the archive in {self.archive_path}.")
+
+        except Exception as e:
+            logging.error(f"Error setting up the votes archive in {self.archive_path}: {e}")
+            raise e
+
+
+    def archive_votes(self, horizon_weeks, column_mappings=VOTES_COLUMN_DEFINITIONS):
+        """
+        Moves the votes older than the horizon out of the hot votes table into the
+        ZSTD-compressed Parquet archive, partitioned by Year and WeekNumber. The horizon
+        is counted in whole weeks back from the week of the latest vote. The weekly vote
+        counts keep the archived weeks, so the outlier weeks still cover the full history.
+
+        Args:
+            horizon_weeks (int): The number of recent weeks to keep in the hot table.
+            column_mappings (dict): The vote columns.
+
+        Returns:
+            int: The number of votes archived.
+        """
+        try:
+            if self.layout == 'partitioned':
+                raise ValueError("The partitioned layout already keeps every week in Parquet, there is nothing to archive.")
+            if horizon_weeks < 0:
+                raise ValueError(f"The archive horizon must be a number of weeks, got {horizon_weeks}.")
+            if self.archive_path is None:
+                raise ValueError("Archiving the votes of an in-memory database needs an archive_path.")
+
+            self.setup_schema("votes", column_mappings)
+            self.setup_weekly_vote_counts()
+            self.setup_votes_id_summary()
+            cutoff = self.conn.execute(f"""
+                SELECT date_trunc('week', MAX(CreationDate)) - INTERVAL {int(horizon_weeks)} WEEK
+                FROM blog_analysis.votes;
+            """).fetchone()[0]
+            archived_count = 0 if cutoff is None else self.conn.execute(
+                "SELECT COUNT(*) FROM blog_analysis.votes WHERE CreationDate < ?;", [cutoff]).fetchone()[0]
+            if not archived_count:
+                logging.info(f"No votes older than {horizon_weeks} weeks to archive.")
+                return 0
+
+            # Votes left in the archive by an interrupted run are replaced, not duplicated
+            moved_sql = f"SELECT {', '.join(column_mappings)} FROM blog_analysis.votes WHERE CreationDate < '{cutoff}'"
+            if not self._archive_exists():
+                self.setup_votes_archive(column_mappings)
+            self._rewrite_vote_partitions(
+                f"""
+                    SELECT Id, CreationDate, VoteTypeId
+                    FROM blog_analysis.votes_archive
+                    WHERE Id IN (SELECT Id FROM ({moved_sql}) moved)
+                """,
+                moved_sql, column_mappings, self.archive_path, compression='zstd')
+            self.setup_votes_archive(column_mappings)
+
+            self.conn.begin()
+            try:
+                self.conn.execute("DELETE FROM blog_analysis.votes WHERE CreationDate < ?;", [cutoff])
+            except Exception:
+                self.conn.rollback()
+                raise
+            self.conn.commit()
+            self.conn.execute("DROP TABLE removed_votes;")
+            logging.info(f"{archived_count} votes created before {cutoff} moved to the archive in {self.archive_path}.")
+            return archived_count
+
+        except Exception as e:
+            logging.error(f"Error archiving the votes older than {horizon_weeks} weeks: {e}")
+            raise e
+
+
+    def _remove_archived_votes(self, ids_sql, column_mappings, min_id=None, max_id=None):
+        """
+        Takes the votes of the given Ids out of the archive and out of the weekly vote
+        counts, rewriting only the archived weeks that hold one, so that a correction
+        or a delete of an archived vote replaces it rather than adding to it.
+
+        Args:
+            ids_sql (str): A query returning the Ids to remove.
+            column_mappings (dict): The vote columns.
+            min_id (int): The smallest Id to remove, lets Parquet statistics skip row groups.
+            max_id (int): The largest Id to remove.
+        """
+        if not self._archive_exists():
+            return
+        range_sql = f"Id BETWEEN {min_id} AND {max_id} AND" if min_id is not None else ""
+        removed_count = self.conn.execute(f"""
+            SELECT COUNT(*) FROM blog_analysis.votes_archive WHERE {range_sql} Id IN ({ids_sql});
+        """).fetchone()[0]
+        if not removed_count:
+            return
+
+        self._rewrite_vote_partitions(
+            f"SELECT Id, CreationDate, VoteTypeId FROM blog_analysis.votes_archive WHERE {range_sql} Id IN ({ids_sql})",
+            None, column_mappings, self.archive_path, compression='zstd')
+        self.setup_votes_archive(column_mappings)
+        self.conn.begin()
+        try:
+            self._stage_vote_count_deltas("SELECT CreationDate, VoteTypeId, -1 AS Sign FROM removed_votes")
+            self._apply_vote_count_deltas()
+        except Exception:
+            self.conn.rollback()
+            raise
+        self.conn.commit()
+        self.conn.execute("DROP TABLE removed_votes;")
+        logging.info(f"{removed_count} archived votes removed from the archive in {self.archive_path}.")
+
+
+    def setup_weekly_vote_counts(self):
+        """
+        Ensures the vote count aggregates exist: blog_analysis.daily_vote_counts, the cube
+        of votes per day and VoteTypeId, and blog_analysis.weekly_vote_counts, its weekly
+        totals. When they are created next to an already populated votes table they are
+        backfilled once from that table.
+        """
+        try:
+            self.conn.execute("CREATE SCHEMA IF NOT EXISTS blog_analysis;")
+            exists = self.conn.execute("""
+                SELECT COUNT(*)
+                FROM information_schema.tables
+                WHERE table_schema = 'blog_analysis' AND table_name IN ('daily_vote_counts', 'weekly_vote_counts');
+            """).fetchone()[0]
+            if exists == 2:
+                return
+
+            votes_exists = self.conn.execute("""
+                SELECT COUNT(*)
+                FROM information_schema.tables
+                WHERE table_schema = 'blog_analysis' AND table_name = 'votes';
+            """).fetchone()[0]
+            if votes_exists:
+                self.rebuild_weekly_vote_counts()
+            else:
+                self.conn.execute("""
+                    CREATE OR REPLACE TABLE blog_analysis.daily_vote_counts (
+                        Date DATE,
+                        VoteTypeId BIGINT,
+                        VoteCount BIGINT
+                    );
+                """)
+                self.conn.execute("""
+                    CREATE OR REPLACE TABLE blog_analysis.weekly_vote_counts (
+                        Year BIGINT,
+                        WeekNumber BIGINT,
+                        VoteCount BIGINT
+                    );
+                """)
+            logging.info("Weekly vote counts aggregate is set up successfully.")
+
+        except Exception as e:
+            logging.error(f"Error setting up weekly vote counts aggregate: {e}")
+            raise e
+
+
+    def _extend_calendar(self, dates_sql):
+        """
+        Extends the blog_analysis.calendar dimension to every day between the first and
+        the last date of dates_sql. The calendar maps each date to its custom Year and
+        WeekNumber, so grouping votes by week joins on the date instead of evaluating
+        the week-0 expression for every vote.
+
+        Args:
+            dates_sql (str): A query returning a Date column.
+        """
+        year_sql, week_sql = _custom_week_sql("Date")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS blog_analysis.calendar (
+                Date DATE,
+                Year BIGINT,
+                WeekNumber BIGINT
+            );
+        """)
+        self.conn.execute(f"""
+            INSERT INTO blog_analysis.calendar
+            SELECT Date, {year_sql}, {week_sql}
+            FROM (
+                SELECT unnest(generate_series(MIN(Date)::TIMESTAMP, MAX(Date)::TIMESTAMP, INTERVAL 1 DAY))::DATE AS Date
+                FROM ({dates_sql}) dates
+            ) days
+            WHERE Date NOT IN (SELECT Date FROM blog_analysis.calendar);
+        """)
+
+
+    def _weekly_counts_sql(self, daily_table, count_column):
+        """Returns the query rolling the per-day counts of daily_table up to the custom weeks."""
+        self._extend_calendar(f"SELECT Date FROM {daily_table}")
+        return f"""
+            SELECT calendar.Year, calendar.WeekNumber, SUM(daily.{count_column})::BIGINT AS {count_column}
+            FROM {daily_table} daily
+            JOIN blog_analysis.calendar calendar ON calendar.Date = daily.Date
+            GROUP BY ALL
+        """
+
+
+    def rebuild_weekly_vote_counts(self):
+        """
+        Recomputes the daily vote count cube from every vote, archived ones included, and
+        the weekly vote counts from the cube.
+        """
+        try:
+            self.conn.execute(f"""
+                CREATE OR REPLACE TABLE blog_analysis.daily_vote_counts AS
+                SELECT CreationDate::DATE AS Date, VoteTypeId, COUNT(*) AS VoteCount
+                FROM {self._votes_history_table()}
+                GROUP BY ALL;
+            """)
+            # Only the days are mapped to their week, not every vote
+            self.conn.execute(f"""
+                CREATE OR REPLACE TABLE blog_analysis.weekly_vote_counts AS
+                {self._weekly_counts_sql("blog_analysis.daily_vote_counts", "VoteCount")};
+            """)
+            self._update_weekly_vote_baselines(changed_weeks_table=None)
+            logging.info("Weekly vote counts aggregate rebuilt successfully.")
+
+        except Exception as e:
+            logging.error(f"Error rebuilding weekly vote counts aggregate: {e}")
+            raise e
+
+
+    def _stage_vote_count_deltas(self, signed_votes_query):
+        """
+        Groups signed votes into per-day and VoteTypeId and per-week count changes, kept
+        in temporary tables until _apply_vote_count_deltas is called.
+
+        Args:
+            signed_votes_query (str): A query returning CreationDate, VoteTypeId and Sign
+            (+1 for a vote entering the table, -1 for a vote leaving it).
+        """
+        self.conn.execute(f"""
+            CREATE OR REPLACE TEMP TABLE daily_vote_deltas AS
+            SELECT CreationDate::DATE AS Date, VoteTypeId, SUM(Sign)::BIGINT AS VoteDelta
+            FROM ({signed_votes_query}) signed_votes
+            GROUP BY ALL
+            HAVING SUM(Sign) <> 0;
+        """)
+        self.conn.execute(f"""
+            CREATE OR REPLACE TEMP TABLE weekly_vote_deltas AS
+            SELECT *
+            FROM ({self._weekly_counts_sql("daily_vote_deltas", "VoteDelta")}) weekly
+            WHERE VoteDelta <> 0;
+        """)
+
+
+    def _apply_vote_count_deltas(self):
+        """Applies the staged count changes to the daily vote count cube and the weekly vote counts."""
+        self.conn.execute("""
+            UPDATE blog_analysis.daily_vote_counts AS daily
+            SET VoteCount = daily.VoteCount + deltas.VoteDelta
+            FROM daily_vote_deltas deltas
+            WHERE daily.Date = deltas.Date AND daily.VoteTypeId IS NOT DISTINCT FROM deltas.VoteTypeId;
+        """)
+        self.conn.execute("""
+            INSERT INTO blog_analysis.daily_vote_counts (Date, VoteTypeId, VoteCount)
+            SELECT deltas.Date, deltas.VoteTypeId, deltas.VoteDelta
+            FROM daily_vote_deltas deltas
+            WHERE NOT EXISTS (
+                SELECT 1
+                FROM blog_analysis.daily_vote_counts daily
+                WHERE daily.Date = deltas.Date AND daily.VoteTypeId IS NOT DISTINCT FROM deltas.VoteTypeId
+            );
+        """)
+        self.conn.execute("DELETE FROM blog_analysis.daily_vote_counts WHERE VoteCount <= 0;")
+        self.conn.execute("""
+            UPDATE blog_analysis.weekly_vote_counts AS weekly
+            SET VoteCount = weekly.VoteCount + deltas.VoteDelta
+            FROM weekly_vote_deltas deltas
+            WHERE weekly.Year = deltas.Year AND weekly.WeekNumber = deltas.WeekNumber;
+        """)
+        self.conn.execute("""
+            INSERT INTO blog_analysis.weekly_vote_counts (Year, WeekNumber, VoteCount)
+            SELECT deltas.Year, deltas.WeekNumber, deltas.VoteDelta
+            FROM weekly_vote_deltas deltas
+            WHERE NOT EXISTS (
+                SELECT 1
+                FROM blog_analysis.weekly_vote_counts weekly
+                WHERE weekly.Year = deltas.Year AND weekly.WeekNumber = deltas.WeekNumber
+            );
+        """)
+        self.conn.execute("DELETE FROM blog_analysis.weekly_vote_counts WHERE VoteCount <= 0;")
+        self._update_weekly_vote_baselines(changed_weeks_table="weekly_vote_deltas")
+        self.conn.execute("DROP TABLE IF EXISTS daily_vote_deltas;")
+        self.conn.execute("DROP TABLE IF EXISTS weekly_vote_deltas;")
+
+
+    def setup_weekly_vote_baselines(self, trailing_weeks=4, alpha=0.3):
+        """
+        Ensures the state of the windowed outlier modes exists and matches the parameters:
+        blog_analysis.yearly_vote_counts, the vote and week counts per year, and
+        blog_analysis.weekly_vote_baselines, which keeps for every week the average of its
+        previous trailing_weeks weeks and the EWMA of the weeks before it. From then on
+        every load updates the state with the weekly counts: the years it touches are
+        recounted, and the weeks from the first one it changes are recomputed from the
+        state of the week before them. Appending a week therefore costs O(trailing_weeks).
+
+        Args:
+            trailing_weeks (int): The number of previous weeks the trailing mode averages.
+            alpha (float): The weight of the latest week in the EWMA, between 0 and 1.
+
+        Raises:
+            ValueError: If trailing_weeks is not positive or alpha is not in (0, 1].
+        """
+        if trailing_weeks < 1:
+            raise ValueError(f"The trailing window needs at least one week, got {trailing_weeks}.")
+        if not 0 < alpha <= 1:
+            raise ValueError(f"The EWMA weight must be in (0, 1], got {alpha}.")
+        try:
+            self.setup_weekly_vote_counts()
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS blog_analysis.weekly_vote_baseline_settings (
+                    TrailingWeeks BIGINT,
+                    Alpha DOUBLE
+                );
+            """)
+            settings = self.conn.execute(
+                "SELECT TrailingWeeks, Alpha FROM blog_analysis.weekly_vote_baseline_settings").fetchall()
+            if settings == [(trailing_weeks, alpha)]:
+                return
+
+            self.conn.execute("""
+                CREATE OR REPLACE TABLE blog_analysis.yearly_vote_counts (
+                    Year BIGINT,
+                    VoteCount BIGINT,
+                    WeekCount BIGINT
+                );
+            """)
+            self.conn.execute("""
+                CREATE OR REPLACE TABLE blog_analysis.weekly_vote_baselines (
+                    Year BIGINT,
+                    WeekNumber BIGINT,
+                    Position BIGINT PRIMARY KEY,
+                    VoteCount BIGINT,
+                    TrailingMean DOUBLE,
+                    Ewma DOUBLE,
+                    PreviousEwma DOUBLE
+                );
+            """)
+            self.conn.execute("DELETE FROM blog_analysis.weekly_vote_baseline_settings;")
+            self.conn.execute("INSERT INTO blog_analysis.weekly_vote_baseline_settings VALUES (?, ?);",
+                              [trailing_weeks, alpha])
+            self._update_weekly_vote_baselines(changed_weeks_table=None)
+            logging.info("Weekly vote baselines are set up successfully.")
+
+        except Exception as e:
+            logging.error(f"Error setting up weekly vote baselines: {e}")
+            raise e
+
+
+    def _update_weekly_vote_baselines(self, changed_weeks_table):
+        """
+        Brings the state of the windowed outlier modes, when it was set up, up to date
+        with the weekly vote counts.
+
+        Args:
+            changed_weeks_table (str): A table of the Year and WeekNumber of the changed
+                weeks, or None after a full recount.
+        """
+        settings = self.conn.execute("""
+            SELECT COUNT(*)
+            FROM information_schema.tables
+            WHERE table_schema = 'blog_analysis' AND table_name = 'weekly_vote_baseline_settings';
+        """).fetchone()[0]
+        if not settings:
+            return
+        trailing_weeks, alpha = self.conn.execute(
+            "SELECT TrailingWeeks, Alpha FROM blog_analysis.weekly_vote_baseline_settings").fetchone()
+
+        if changed_weeks_table is None:
+            self.conn.execute("DELETE FROM blog_analysis.yearly_vote_counts;")
+            self.conn.execute("DELETE FROM blog_analysis.weekly_vote_baselines;")
+        else:
+            self.conn.execute(f"""
+                DELETE FROM blog_analysis.yearly_vote_counts
+                WHERE Year IN (SELECT Year FROM {changed_weeks_table});
+            """)
+            # Every week from the first changed one on depends on the changed counts
+            self.conn.execute(f"""
+                DELETE FROM blog_analysis.weekly_vote_baselines
+                WHERE Year * 100 + WeekNumber >= (SELECT MIN(Year * 100 + WeekNumber) FROM {changed_weeks_table});
+            """)
+        self.conn.execute("""
+            INSERT INTO blog_analysis.yearly_vote_counts
+            SELECT Year, SUM(VoteCount), COUNT(*)
+            FROM blog_analysis.weekly_vote_counts
+            WHERE Year NOT IN (SELECT Year FROM blog_analysis.yearly_vote_counts)
+            GROUP BY Year;
+        """)
+
+        # An aggregate rather than ORDER BY ... LIMIT 1, which can miss the kept rows after
+        # the deletes of the same transaction
+        kept_weeks, last_position, last_year, last_week_number, last_ewma = self.conn.execute("""
+            SELECT COUNT(*), COALESCE(MAX(Position), 0), arg_max(Year, Position), arg_max(WeekNumber, Position),
+                   arg_max(Ewma, Position)
+            FROM blog_analysis.weekly_vote_baselines;
+        """).fetchone()
+        if kept_weeks != last_position:
+            raise RuntimeError(f"The weekly vote baselines keep {kept_weeks} weeks for positions up to {last_position}, "
+                               "rebuild them with rebuild_weekly_vote_counts.")
+        if not kept_weeks:
+            # The first week is its own EWMA
+            ewma_seed = "SELECT Position, VoteCount::DOUBLE AS Ewma FROM new_weeks WHERE Position = 1"
+            new_weeks_filter = ""
+        else:
+            ewma_seed = f"SELECT {last_position} AS Position, {last_ewma}::DOUBLE AS Ewma"
+            new_weeks_filter = f"WHERE Year * 100 + WeekNumber > {last_year * 100 + last_week_number}"
+        self.conn.execute(f"""
+            INSERT INTO blog_analysis.weekly_vote_baselines
+            WITH RECURSIVE new_weeks AS (
+                SELECT Year, WeekNumber, VoteCount, {last_position} + ROW_NUMBER() OVER (ORDER BY Year, WeekNumber) AS Position
+                FROM blog_analysis.weekly_vote_counts
+                {new_weeks_filter}
+            ),
+            ewma AS (
+                {ewma_seed}
+                UNION ALL
+                SELECT new_weeks.Position, {alpha} * new_weeks.VoteCount + {1 - alpha} * ewma.Ewma
+                FROM ewma
+                JOIN new_weeks ON new_weeks.Position = ewma.Position + 1
+            ),
+            -- Only the last trailing_weeks kept weeks are needed for the first new averages
+            window_weeks AS (
+                SELECT Position, VoteCount
+                FROM blog_analysis.weekly_vote_baselines
+                WHERE Position > {last_position - trailing_weeks}
+                UNION ALL
+                SELECT Position, VoteCount
+                FROM new_weeks
+            ),
+            trailing_means AS (
+                SELECT Position, AVG(VoteCount) OVER (
+                    ORDER BY Position ROWS BETWEEN {trailing_weeks} PRECEDING AND 1 PRECEDING
+                ) AS TrailingMean
+                FROM window_weeks
+            )
+            SELECT new_weeks.Year, new_weeks.WeekNumber, new_weeks.Position, new_weeks.VoteCount,
+                   trailing_means.TrailingMean, ewma.Ewma, previous.Ewma AS PreviousEwma
+            FROM new_weeks
+            JOIN trailing_means ON trailing_means.Position = new_weeks.Position
+            JOIN ewma ON ewma.Position = new_weeks.Position
+            LEFT JOIN ewma previous ON previous.Position = new_weeks.Position - 1;
+        """)
+
+
+    def delete_votes(self, ids):
+        """
+        Deletes votes from the operational table, or from the archive, by Id and removes
+        them from the weekly vote counts aggregate.
+
+        Args:
+            ids (list): The Ids of the votes to delete.
+        """
+        try:
+            self.setup_weekly_vote_counts()
+            self.conn.execute("CREATE OR REPLACE TEMP TABLE deleted_vote_ids AS SELECT unnest(?::BIGINT[]) AS Id;", [list(ids)])
+            if self.layout == 'partitioned':
+                self._replace_partitioned_votes("""
+                    SELECT Id, CreationDate, VoteTypeId
                     FROM blog_analysis.votes
-                    GROUP BY Year, CustomWeekNumber
-                ), AvgVotes AS (
-                    SELECT AVG(VoteCount) AS AvgVoteCount
-                    FROM WeeklyVotes
+                    WHERE Id IN (SELECT Id FROM deleted_vote_ids)
+                """, None, VOTES_COLUMN_DEFINITIONS)
+                self.conn.execute("DROP TABLE deleted_vote_ids;")
+                logging.info(f"{len(ids)} votes deleted from the operational partitions.")
+                return
+            # A deleted vote that was archived is removed from the archive
+            self._remove_archived_votes("SELECT Id FROM deleted_vote_ids", VOTES_COLUMN_DEFINITIONS)
+            self.conn.begin()
+            try:
+                self._stage_vote_count_deltas("""
+                    SELECT CreationDate, VoteTypeId, -1 AS Sign
+                    FROM blog_analysis.votes
+                    WHERE Id IN (SELECT Id FROM deleted_vote_ids)
+                """)
+                self.conn.execute("DELETE FROM blog_analysis.votes WHERE Id IN (SELECT Id FROM deleted_vote_ids);")
+                self._apply_vote_count_deltas()
+                self.conn.execute("DROP TABLE deleted_vote_ids;")
+            except Exception:
+                self.conn.rollback()
+                raise
+            self.conn.commit()
+            logging.info(f"{len(ids)} votes deleted from the operational table.")
+
+        except Exception as e:
+            logging.error(f"Error deleting votes from the operational table: {e}")
+            raise e
+
+
+    def create_outlier_weeks_view(self):
+        """
+        Create or replace the 'outlier_weeks' view in the database. The view reads the
+        incrementally maintained weekly vote counts, so it costs O(weeks) rather than O(votes).
+        """
+        self.create_outliers_view('week')
+
+
+    def create_outliers_view(self, granularity='week', threshold=0.2, vote_type_ids=None, by_vote_type=False,
+                             start_date=None, end_date=None):
+        """
+        Create or replace the blog_analysis.outlier_days, outlier_weeks or outlier_months
+        view. A period is an outlier when its vote count deviates from the average count
+        per period by more than the threshold. The counts are rolled up from the daily vote
+        count cube, so the view costs O(days) rather than O(votes). Views per VoteTypeId or
+        over filtered votes are named with a _by_vote_type or _filtered suffix, e.g.
+        outlier_weeks_by_vote_type_filtered, see outliers_view_name.
+
+        Args:
+            granularity (str): 'day', 'week' or 'month'.
+            threshold (float): The allowed relative deviation from the average, 0.2 is 20%.
+            vote_type_ids (list): Only count the votes of these VoteTypeIds, None counts all.
+            by_vote_type (bool): Count and average every VoteTypeId separately, the view
+                then has a VoteTypeId column.
+            start_date (date or str): Only count the votes from this day on.
+            end_date (date or str): Only count the votes up to and including this day.
+
+        Returns:
+            str: The name of the view in the blog_analysis schema.
+
+        Raises:
+            ValueError: If the granularity, threshold, VoteTypeIds or dates are invalid.
+        """
+        if granularity not in OUTLIER_GRANULARITIES:
+            raise ValueError(f"Unknown outlier granularity {granularity!r}, expected one of {list(OUTLIER_GRANULARITIES)}.")
+        if threshold < 0:
+            raise ValueError(f"The outlier threshold cannot be negative, got {threshold}.")
+        filters = []
+        if vote_type_ids is not None:
+            vote_type_ids = [int(vote_type_id) for vote_type_id in vote_type_ids]
+            filters.append(f"daily.VoteTypeId IN ({', '.join(map(str, vote_type_ids)) or 'NULL'})")
+        if start_date is not None:
+            filters.append(f"daily.Date >= DATE '{date.fromisoformat(str(start_date))}'")
+        if end_date is not None:
+            filters.append(f"daily.Date <= DATE '{date.fromisoformat(str(end_date))}'")
+
+        view_name = outliers_view_name(granularity, by_vote_type, bool(filters))
+        try:
+            self.setup_weekly_vote_counts()
+            period_columns = list(OUTLIER_GRANULARITIES[granularity])
+            if by_vote_type:
+                period_columns.append('VoteTypeId')
+            if granularity == 'week' and not filters and not by_vote_type:
+                # The weekly totals are already maintained next to the cube
+                counts_query = "SELECT Year, WeekNumber, VoteCount FROM blog_analysis.weekly_vote_counts"
+            else:
+                periods = {
+                    'day': "daily.Date",
+                    'week': "calendar.Year, calendar.WeekNumber",
+                    'month': "EXTRACT(YEAR FROM daily.Date) AS Year, EXTRACT(MONTH FROM daily.Date) AS Month",
+                }
+                counts_query = f"""
+                    SELECT {periods[granularity]}{', daily.VoteTypeId' if by_vote_type else ''}, SUM(daily.VoteCount)::BIGINT AS VoteCount
+                    FROM blog_analysis.daily_vote_counts daily
+                    {'JOIN blog_analysis.calendar calendar ON calendar.Date = daily.Date' if granularity == 'week' else ''}
+                    {'WHERE ' + ' AND '.join(filters) if filters else ''}
+                    GROUP BY ALL
+                """
+            query = f"""
+                CREATE OR REPLACE VIEW blog_analysis.{view_name} AS
+                WITH PeriodVotes AS (
+                    SELECT *, AVG(VoteCount) OVER ({'PARTITION BY VoteTypeId' if by_vote_type else ''}) AS AvgVoteCount
+                    FROM ({counts_query}) counts
                 )
-                SELECT 
-                    w.Year, 
-                    w.CustomWeekNumber AS WeekNumber, 
-                    w.VoteCount
-                FROM 
-                    WeeklyVotes w, AvgVotes av
+                SELECT {', '.join(period_columns)}, VoteCount
+                FROM PeriodVotes
                 WHERE
-                    w.VoteCount < 0.8 * av.AvgVoteCount OR
-                    w.VoteCount > 1.2 * av.AvgVoteCount
-                ORDER BY 
-                    w.Year, 
-                    w.CustomWeekNumber;
+                    VoteCount < {1 - threshold} * AvgVoteCount OR
+                    VoteCount > {1 + threshold} * AvgVoteCount
+                ORDER BY {', '.join(period_columns)};
             """
             self.conn.execute(query)
-            logging.info("Outlier weeks view created successfully.")
+            logging.info(f"View {view_name} created successfully.")
+            return view_name
 
         except Exception as e:
-            logging.error(f"Error replacing Outlier weeks view: {e}")
+            logging.error(f"Error replacing the {view_name} view: {e}")
             raise e
 
 
+    def create_windowed_outlier_weeks_view(self, mode, threshold=0.2, trailing_weeks=4, alpha=0.3):
+        """
+        Create or replace the blog_analysis.outlier_weeks_yearly, outlier_weeks_trailing or
+        outlier_weeks_ewma view. Instead of the average of every week, a week is compared
+        to the average of the weeks of its year, to the average of its previous
+        trailing_weeks weeks, or to the EWMA of the weeks before it. The views read the
+        incrementally maintained state of setup_weekly_vote_baselines, so they cost O(weeks).
 
+        Args:
+            mode (str): 'yearly', 'trailing' or 'ewma'.
+            threshold (float): The allowed relative deviation from the baseline, 0.2 is 20%.
+            trailing_weeks (int): The number of previous weeks the trailing mode averages.
+            alpha (float): The weight of the latest week in the EWMA, between 0 and 1.
 
+        Raises:
+            ValueError: If the mode, threshold, trailing_weeks or alpha are invalid.
+        """
+        if mode not in WINDOWED_OUTLIER_MODES:
+            raise ValueError(f"Unknown outlier mode {mode!r}, expected one of {list(WINDOWED_OUTLIER_MODES)}.")
+        if threshold < 0:
+            raise ValueError(f"The outlier threshold cannot be negative, got {threshold}.")
 
+        try:
+            self.setup_weekly_vote_baselines(trailing_weeks, alpha)
+            baselines = {
+                'yearly': """
+                    SELECT weekly.Year, weekly.WeekNumber, weekly.VoteCount, yearly.VoteCount / yearly.WeekCount AS Baseline
+                    FROM blog_analysis.weekly_vote_counts weekly
+                    JOIN blog_analysis.yearly_vote_counts yearly ON yearly.Year = weekly.Year
+                """,
+                'trailing': """
+                    SELECT Year, WeekNumber, VoteCount, TrailingMean AS Baseline
+                    FROM blog_analysis.weekly_vote_baselines
+                """,
+                'ewma': """
+                    SELECT Year, WeekNumber, VoteCount, PreviousEwma AS Baseline
+                    FROM blog_analysis.weekly_vote_baselines
+                """,
+            }
+            query = f"""
+                CREATE OR REPLACE VIEW blog_analysis.outlier_weeks_{mode} AS
+                SELECT Year, WeekNumber, VoteCount, Baseline
+                FROM ({baselines[mode]}) baselines
+                WHERE
+                    VoteCount < {1 - threshold} * Baseline OR
+                    VoteCount > {1 + threshold} * Baseline
+                ORDER BY Year, WeekNumber;
+            """
+            self.conn.execute(query)
+            logging.info(f"Outlier weeks {mode} view created successfully.")
 
-
-
-
+        except Exception as e:
+            logging.error(f"Error replacing Outlier weeks {mode} view: {e}")
+            raise e
@@ -16,65 +16,411 @@ the data is primed for analytical querying and reporting.
 """
 
 import os
+import sys
+import glob
+import shutil
+import hashlib
 import logging
+import argparse
+import tempfile
+import itertools
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 # from db import BlogAnalysisDB  # Importing db. class
-from equalexperts_dataeng_exercise.db import BlogAnalysisDB
+from equalexperts_dataeng_exercise.db import BlogAnalysisDB, VOTES_COLUMN_DEFINITIONS, STORAGE_LAYOUTS, DEDUP_BUCKET_ROWS
+from equalexperts_dataeng_exercise.config import add_resource_arguments, resource_settings_from_args, scratch_directory
+from equalexperts_dataeng_exercise.inputs import is_tar_archive, iter_jsonl_streams, iter_jsonl_chunks
 
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
+READY_ROWS_QUERY = "SELECT COUNT(*) FROM {staging_table} WHERE staging_status = 'READYTOLOAD'"
+OPERATIONAL_ROWS_QUERY = "SELECT COUNT(*) FROM blog_analysis.votes"
+LOAD_MODES = ('merge', 'rebuild', 'cdc')
 
-def ingest_data(file_path, db):
-    """
-    Orchestrates the data ingestion process from a JSONL file to the database.
+
+def resolve_input_files(file_path):
     """
-    try:
-        # Create schema 
-        db.conn.execute(f"CREATE SCHEMA IF NOT EXISTS blog_analysis;")
+    Expands a path, a glob or a list of them into the sorted list of files to ingest.
 
-        # Step 0: Validate file existence & create db. if not exists
-        if not os.path.exists(file_path):
-            error_message = f"File {file_path} does not exist."
+    Args:
+        file_path (str or list): The path(s) or glob(s) to expand.
+
+    Raises:
+        FileNotFoundError: If a path does not exist or a glob matches no files.
+    """
+    patterns = [file_path] if isinstance(file_path, (str, os.PathLike)) else list(file_path)
+    resolved_files = []
+    for pattern in patterns:
+        pattern = str(pattern)
+        matches = sorted(glob.glob(pattern)) if glob.has_magic(pattern) else [pattern]
+        matches = [match for match in matches if os.path.exists(match)]
+        if not matches:
+            error_message = f"File {pattern} does not exist."
             logging.error(error_message)
             raise FileNotFoundError(error_message)
+        resolved_files.extend(match for match in matches if match not in resolved_files)
+    return resolved_files
 
 
-        # Step 1: Ingest / load JSON file to staging landing table..
-        column_definitions = {
-            'Id': 'BIGINT',
-            'PostId': 'BIGINT',
-            'VoteTypeId': 'BIGINT',
-            'CreationDate': 'DATETIME',
-            'UserId': 'BIGINT',
-            'BountyAmount': 'NUMERIC'
-        }
+def file_fingerprint(file_path):
+    """Returns the absolute path, size and mtime the manifest identifies a file by."""
+    file_stat = os.stat(file_path)
+    return {'file_path': os.path.abspath(file_path), 'file_size': file_stat.st_size,
+            'file_mtime_ns': file_stat.st_mtime_ns}
+
+
+def compute_content_hash(file_path, block_size=1 << 20):
+    """Returns the SHA-256 of a file, read in blocks so memory stays flat."""
+    content_hash = hashlib.sha256()
+    with open(file_path, 'rb') as file_obj:
+        for block in iter(lambda: file_obj.read(block_size), b''):
+            content_hash.update(block)
+    return content_hash.hexdigest()
+
+
+def select_changed_files(file_paths, db, force=False):
+    """
+    Checks the files against the ingest manifest and returns the fingerprints of those
+    that still need ingesting. A file whose path, size and mtime are in the manifest is
+    skipped without being read; a file whose content hash is, e.g. a copy or a touched
+    file, is skipped after hashing and recorded under its new path.
+
+    Args:
+        file_paths (list): The files to check.
+        db (BlogAnalysisDB): The database holding the manifest.
+        force (bool): Return every file, ingested or not.
+    """
+    changed_files = []
+    for file_path in file_paths:
+        fingerprint = file_fingerprint(file_path)
+        if not force and db.is_file_ingested(fingerprint['file_path'], fingerprint['file_size'], fingerprint['file_mtime_ns']):
+            logging.info(f"Skipping {file_path}, unchanged since it was ingested.")
+            continue
+
+        fingerprint['content_hash'] = compute_content_hash(file_path)
+        if not force and (db.is_content_ingested(fingerprint['content_hash'])
+                          or any(changed['content_hash'] == fingerprint['content_hash'] for changed in changed_files)):
+            logging.info(f"Skipping {file_path}, its content was already ingested.")
+            db.record_ingested_files([fingerprint], status='SKIPPED')
+            continue
+        changed_files.append(fingerprint)
+    return changed_files
+
+
+def stage_batch(file_path, db, column_definitions, pipeline='staged', load_mode='merge'):
+    """
+    Loads, cleanses and deduplicates a batch and returns the staging table holding it.
+
+    Args:
+        file_path (str or list): The JSONL file(s) of the batch.
+        db (BlogAnalysisDB): The database to load into.
+        column_definitions (dict): The columns and their SQL types.
+        pipeline (str): 'staged' materialises staging_votes_load and staging_votes in the
+            database, 'fused' validates read_json output straight into a temporary table
+            and only persists the rejected records.
+        load_mode (str): The load mode of the batch. 'cdc' marks the records unchanged
+            below the watermark as UNCHANGED while cleansing.
+    """
+    skip_unchanged = load_mode == 'cdc'
+    if pipeline == 'fused':
+        with db.profile_step('read_validate', rows_out_query=READY_ROWS_QUERY.format(staging_table="fused_staging_votes")):
+            db.load_json_to_fused_staging(file_path, column_definitions, skip_unchanged=skip_unchanged)
+        return "fused_staging_votes"
+
+    with db.profile_step('load', rows_out_query="SELECT COUNT(*) FROM blog_analysis.staging_votes_load"):
         db.load_json_to_staging_table(file_path=file_path
                                   , column_definitions=column_definitions)
-        
+    with db.profile_step('cleanse', rows_in_query="SELECT COUNT(*) FROM blog_analysis.staging_votes_load",
+                         rows_out_query=READY_ROWS_QUERY.format(staging_table="blog_analysis.staging_votes")):
+        db.cleanse_and_deduplicate_staging_table(column_definitions, skip_unchanged=skip_unchanged)
+    return "blog_analysis.staging_votes"
+
+
+def _stage_shard(shard_files, column_definitions, shard_path, settings, dedup_bucket_rows):
+    """Cleanses and deduplicates the split records of one Id-hash shard into its own database file."""
+    # Staged in memory, only the cleansed table is written to the shard file
+    with BlogAnalysisDB(db_path=':memory:', settings=settings, dedup_bucket_rows=dedup_bucket_rows) as shard_db:
+        shard_db.conn.execute("SET enable_progress_bar = false;")
+        shard_db.conn.execute("CREATE SCHEMA IF NOT EXISTS blog_analysis;")
+        shard_db.load_shard_to_staging_table(shard_files, column_definitions)
+        shard_db.cleanse_and_deduplicate_staging_table(column_definitions)
+        shard_db.export_staging_table(shard_path)
+    return shard_path
+
 
-        # Step 2: Clean data and set status code for operational loading
-        db.cleanse_and_deduplicate_staging_table()
+def stage_sharded_batch(file_paths, db, column_definitions, shards, load_mode='merge'):
+    """
+    Stages a batch with one process per shard. The files are read and parsed once into
+    blog_analysis.staging_votes_load and split by a hash of the Id into one Parquet file
+    set per shard. Every worker reads only its shard and validates and deduplicates it
+    into a database file of its own, as DuckDB only allows one writing process per file.
+    Every record of an Id lands in the same shard, so each shard is deduplicated on its own.
+    The shard tables are then attached and combined into blog_analysis.staging_votes,
+    which holds the same records and statuses as a single-process stage_batch.
+
+    Args:
+        file_paths (list): The JSONL files of the batch.
+        db (BlogAnalysisDB): The database to load into.
+        column_definitions (dict): The columns and their SQL types.
+        shards (int): The number of shards and worker processes.
+        load_mode (str): The load mode of the batch, see stage_batch.
+    """
+    # The workers share the cores instead of each starting a thread per core
+    settings = dict(db.settings)
+    settings['threads'] = max(1, settings.get('threads', os.cpu_count() or 1) // shards)
+    shard_dir = tempfile.mkdtemp(prefix='vote-shards-', dir=scratch_directory(settings))
+    try:
+        shard_paths = [os.path.join(shard_dir, f'shard-{shard_index}.db') for shard_index in range(shards)]
+        with db.profile_step('load', rows_out_query="SELECT COUNT(*) FROM blog_analysis.staging_votes_load"):
+            db.load_json_to_staging_table(file_paths, column_definitions)
+        with db.profile_step('split_shards'):
+            shard_files = db.split_staging_into_shards(os.path.join(shard_dir, 'input'), shards)
+        with db.profile_step('shard'):
+            # Spawned rather than forked, so the workers do not inherit the open connection
+            with ProcessPoolExecutor(max_workers=shards, mp_context=multiprocessing.get_context('spawn')) as pool:
+                list(pool.map(_stage_shard, shard_files, itertools.repeat(column_definitions), shard_paths,
+                              itertools.repeat(settings), itertools.repeat(db.dedup_bucket_rows)))
+        with db.profile_step('combine_shards',
+                             rows_out_query=READY_ROWS_QUERY.format(staging_table="blog_analysis.staging_votes")):
+            db.combine_shard_staging_tables(shard_paths, column_definitions, skip_unchanged=load_mode == 'cdc')
+    finally:
+        shutil.rmtree(shard_dir, ignore_errors=True)
+    return "blog_analysis.staging_votes"
+
+
+def move_to_operational(db, column_definitions, staging_table, load_mode='merge'):
+    """
+    Moves the READYTOLOAD records of the staging table into blog_analysis.votes. The
+    'cdc' load mode, whose records unchanged below the watermark were already marked
+    UNCHANGED by stage_batch, advances the watermark once the merge has committed.
+    """
+    ready_rows_query = READY_ROWS_QUERY.format(staging_table=staging_table)
+    with db.profile_step('rebuild' if load_mode == 'rebuild' else 'merge', ready_rows_query, OPERATIONAL_ROWS_QUERY):
+        if load_mode == 'rebuild':
+            db.move_data_to_operational_with_ctas(column_definitions, staging_table)
+        else:
+            db.move_data_to_operational_with_merge(column_definitions, staging_table)
 
-        # Step 3: Move data to operational
-        db.move_data_to_operational_with_ctas(column_definitions)
+    if load_mode == 'cdc':
+        db.advance_ingest_watermark(staging_table)
 
 
+def ingest_data_in_chunks(file_paths, db, column_definitions, chunk_rows=None, chunk_bytes=None, pipeline='staged',
+                          load_mode='merge'):
+    """
+    Streams the files through load, cleanse and merge one chunk at a time, so the staging
+    tables never hold more than one chunk whatever the size of the files. Each chunk is
+    merged in its own transaction; a failed load can simply be re-run. Records are
+    deduplicated across chunks: a record only loads if no earlier chunk holds a newer
+    record of its Id, valid or rejected. A rejected record cannot withdraw a valid one
+    already merged from an earlier chunk, though, so a load whose newest record of an Id
+    is rejected and follows a valid one in a later chunk still merges the valid record.
+
+    Args:
+        file_paths (list): The JSONL files to ingest, in order.
+        db (BlogAnalysisDB): The database to load into.
+        column_definitions (dict): The columns and their SQL types.
+        chunk_rows (int): The number of lines per chunk.
+        chunk_bytes (int): The approximate size of a chunk in bytes.
+        pipeline (str): 'staged' or 'fused', see stage_batch.
+        load_mode (str): 'merge' or 'cdc', see ingest_data.
+
+    Returns:
+        dict: The number of staged records per staging_status over all chunks.
+    """
+    # Compressed files and the members of tar archives are decompressed while streaming
+    streams = (stream for file_path in file_paths for stream in iter_jsonl_streams(file_path))
+    return ingest_streams_in_chunks(streams, db, column_definitions, chunk_rows, chunk_bytes, pipeline, load_mode)
+
+
+def ingest_streams_in_chunks(streams, db, column_definitions, chunk_rows=None, chunk_bytes=None, pipeline='staged',
+                             load_mode='merge'):
+    """
+    Ingests binary JSONL streams chunk by chunk like ingest_data_in_chunks, for input that
+    is not in files, e.g. the members of an archive that is still being downloaded.
+
+    Args:
+        streams (iterable): (name, binary stream) pairs, read in order.
+        db (BlogAnalysisDB): The database to load into.
+        column_definitions (dict): The columns and their SQL types.
+        chunk_rows (int): The number of lines per chunk.
+        chunk_bytes (int): The approximate size of a chunk in bytes.
+        pipeline (str): 'staged' or 'fused', see stage_batch.
+        load_mode (str): 'merge' or 'cdc', see ingest_data.
+
+    Returns:
+        dict: The number of staged records per staging_status over all chunks.
+    """
+    status_counts = {}
+    db.setup_streaming_dedup_keys()
+    try:
+        with tempfile.TemporaryDirectory() as chunk_dir:
+            chunk_path = os.path.join(chunk_dir, 'chunk.jsonl')
+            # Numbers the chunks across all streams, later chunks win ties on the CreationDate
+            load_chunk_numbers = itertools.count(1)
+            for stream_name, file_obj in streams:
+                for chunk_number, chunk in enumerate(iter_jsonl_chunks(file_obj, chunk_rows, chunk_bytes), start=1):
+                    with open(chunk_path, 'wb') as chunk_file:
+                        chunk_file.write(chunk)
+
+                    staging_table = stage_batch(chunk_path, db, column_definitions, pipeline, load_mode)
+                    ready_rows_query = READY_ROWS_QUERY.format(staging_table=staging_table)
+                    with db.profile_step('deduplicate_chunks', ready_rows_query, ready_rows_query):
+                        db.deduplicate_staging_against_previous_chunks(next(load_chunk_numbers), staging_table)
+                    move_to_operational(db, column_definitions, staging_table, load_mode)
+                    for status, count in db.staging_status_counts(staging_table).items():
+                        status_counts[status] = status_counts.get(status, 0) + count
+                    logging.info(f"Chunk {chunk_number} of {stream_name} ingested.")
+    finally:
+        db.drop_streaming_dedup_keys()
+        db.drop_fused_staging()
+    return status_counts
+
+
+def ingest_data(file_path, db, load_mode='merge', chunk_rows=None, chunk_bytes=None, pipeline='staged',
+                profile_path=None, force=False, shards=None):
+    """
+    Orchestrates the data ingestion process from one or more JSONL files to the database.
+    All files are staged, cleansed and deduplicated together and merged in a single pass,
+    unless chunk_rows or chunk_bytes ask for a bounded-memory streaming load.
+
+    Args:
+        file_path (str or list): The path or glob to the JSONL file(s), or a list of them.
+        db (BlogAnalysisDB): The database to load into.
+        load_mode (str): 'merge' upserts only the Ids present in the batch (default),
+            'rebuild' recreates the whole operational table with CTAS, 'cdc' merges only
+            the records above the persisted (CreationDate, Id) watermark and the genuine
+            corrections below it, skipping replayed records that are already held.
+        chunk_rows (int): Stream the files in chunks of this many lines.
+        chunk_bytes (int): Stream the files in chunks of about this many bytes.
+        pipeline (str): 'staged' keeps the staging tables in the database for inspection
+            (default), 'fused' streams read_json through validation and dedup into the
+            merge and only writes rejected records, to blog_analysis.votes_quarantine.
+        profile_path (str): Profile every step and write the report as JSON to this path.
+        force (bool): Ingest the files even if the manifest shows they were already ingested
+            unchanged; by default those files are skipped.
+        shards (int): Stage the batch in this many worker processes, each validating and
+            deduplicating the records of one Id-hash shard, see stage_sharded_batch.
+
+    Returns:
+        dict: The profiling report when profile_path is given or profiling is enabled on db,
+        otherwise None.
+    """
+    profiler = db.profiler
+    owns_profiler = profile_path is not None and profiler is None
+    if owns_profiler:
+        profiler = db.enable_profiling()
+    try:
+        if load_mode not in LOAD_MODES:
+            raise ValueError(f"Unknown load mode {load_mode!r}, expected one of {LOAD_MODES}.")
+        if pipeline not in ('staged', 'fused'):
+            raise ValueError(f"Unknown pipeline {pipeline!r}, expected 'staged' or 'fused'.")
+        streaming = bool(chunk_rows or chunk_bytes)
+        if streaming and load_mode == 'rebuild':
+            raise ValueError("Chunked loads merge every chunk in place and cannot use the 'rebuild' load mode.")
+        if shards is not None and (shards < 1 or streaming or pipeline == 'fused'):
+            raise ValueError("A sharded load needs at least one shard and uses neither chunks nor the fused pipeline.")
+
+        # Step 0: Validate file existence & create db. if not exists
+        file_paths = resolve_input_files(file_path)
+        if pipeline == 'fused' and not streaming and any(is_tar_archive(path) for path in file_paths):
+            raise ValueError("The fused pipeline reads the files with read_json and cannot read tar archives unchunked.")
+
+        # Create schema 
+        db.conn.execute(f"CREATE SCHEMA IF NOT EXISTS blog_analysis;")
+
+        with db.profile_step('manifest'):
+            changed_files = select_changed_files(file_paths, db, force)
+        changed_paths = [changed['file_path'] for changed in changed_files]
+
+        # Step 1: Ingest / load JSON file to staging landing table..
+        column_definitions = VOTES_COLUMN_DEFINITIONS
+        if not changed_paths:
+            logging.info("All files were already ingested, nothing to do.")
+        elif streaming:
+            status_counts = ingest_data_in_chunks(changed_paths, db, column_definitions, chunk_rows, chunk_bytes, pipeline,
+                                                  load_mode)
+            db.record_ingested_files(changed_files, load_mode=load_mode, status_counts=status_counts)
+        else:
+            # Step 2: Clean data and set status code for operational loading
+            if shards:
+                staging_table = stage_sharded_batch(changed_paths, db, column_definitions, shards, load_mode)
+            else:
+                staging_table = stage_batch(changed_paths, db, column_definitions, pipeline, load_mode)
+
+            # Step 3: Move data to operational and record the batch in the manifest
+            move_to_operational(db, column_definitions, staging_table, load_mode)
+            status_counts = db.staging_status_counts(staging_table)
+            db.drop_fused_staging()
+            db.record_ingested_files(changed_files, load_mode=load_mode, status_counts=status_counts)
+
+        if profiler is not None:
+            if profile_path:
+                profiler.write(profile_path)
+            return profiler.report()
+
     except Exception as e:
         logging.error(f"An error occurred during the ingestion process: {e}")
         # If you want to propagate the exception up:
         raise
+    finally:
+        if owns_profiler:
+            db.disable_profiling()
 
 
-def main():
-    # Define file path
+def parse_args(argv):
+    # Default file path
     relative_path = '../uncommitted/votes.jsonl'
-    file_path = os.path.join(os.path.dirname(__file__), relative_path)
+    default_file_path = os.path.join(os.path.dirname(__file__), relative_path)
+
+    parser = argparse.ArgumentParser(description="Ingest vote JSONL files into the warehouse.")
+    parser.add_argument('file_paths', nargs='*', default=[default_file_path],
+                        help="JSONL files or globs to ingest together, optionally .gz or .zst compressed or in "
+                             "tar archives (default: uncommitted/votes.jsonl)")
+    parser.add_argument('--load-mode', choices=LOAD_MODES, default='merge',
+                        help="'merge' upserts the batch in place, 'rebuild' recreates the votes table, "
+                             "'cdc' only merges records above the watermark and corrections below it")
+    parser.add_argument('--pipeline', choices=['staged', 'fused'], default='staged',
+                        help="'fused' skips the persistent staging tables and only writes rejected records")
+    parser.add_argument('--force', action='store_true',
+                        help="ingest the files even if the manifest shows they were already ingested unchanged")
+    parser.add_argument('--layout', choices=STORAGE_LAYOUTS, default='indexed',
+                        help="'indexed' keeps ART indexes on Id and CreationDate, 'sorted' keeps votes ordered by CreationDate, "
+                             "'partitioned' writes votes as Parquet partitioned by Year and WeekNumber")
+    parser.add_argument('--partition-path',
+                        help="directory of the Parquet partitions of the partitioned layout (default: warehouse-votes)")
+    parser.add_argument('--dedup-bucket-rows', type=int, default=DEDUP_BUCKET_ROWS,
+                        help=f"number of staged records deduplicated at a time, lower values use less memory "
+                             f"(default: {DEDUP_BUCKET_ROWS})")
+    parser.add_argument('--cluster', action='store_true',
+                        help="rewrite the votes table in CreationDate order after the load")
+    parser.add_argument('--profile', metavar='PATH',
+                        help="write a JSON report of the time, row counts and query profile of every step to PATH")
+    chunking = parser.add_mutually_exclusive_group()
+    chunking.add_argument('--chunk-rows', type=int,
+                          help="stream the files through the pipeline in chunks of this many lines")
+    chunking.add_argument('--chunk-bytes', type=int,
+                          help="stream the files through the pipeline in chunks of about this many bytes")
+    chunking.add_argument('--shards', type=int,
+                          help="validate and deduplicate the files in this many worker processes, one per Id-hash shard")
+    add_resource_arguments(parser)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(sys.argv[1:] if argv is None else argv)
 
     # Initialize db connection within a context manager to ensure it's properly closed
     try:
-        with BlogAnalysisDB() as db:
-            ingest_data(file_path, db)
+        with BlogAnalysisDB(settings=resource_settings_from_args(args), config_path=args.config, layout=args.layout,
+                            partition_path=args.partition_path, dedup_bucket_rows=args.dedup_bucket_rows) as db:
+            ingest_data(args.file_paths, db, load_mode=args.load_mode,
+                        chunk_rows=args.chunk_rows, chunk_bytes=args.chunk_bytes, pipeline=args.pipeline, profile_path=args.profile,
+                        force=args.force, shards=args.shards)
+            if args.cluster:
+                db.cluster_votes()
     except Exception as e:
         logging.error(f"An error occurred: {e}")
 
@@ -0,0 +1,122 @@
+"""
+Opens the input files of an ingest as streams of JSONL, decompressing while reading so
+that compressed drops are never inflated on disk:
+
+- votes.jsonl is read as is.
+- votes.jsonl.gz and votes.jsonl.zst are decompressed on the fly. read_json does this
+  itself, the chunked ingest reads them through gzip or zstandard.
+- votes.tar, votes.tar.gz, votes.tgz, votes.tar.bz2, votes.tar.xz and votes.tar.zst are
+  read as a stream, and every .jsonl, .jsonl.gz or .jsonl.zst member is one JSONL stream.
+
+zstd-compressed streams read in Python, a .tar.zst or a .jsonl.zst inside a tar archive
+or in a chunked ingest, need the zstandard package of the zstd extra.
+"""
+
+import io
+import gzip
+import tarfile
+import itertools
+
+TAR_SUFFIXES = ('.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tar.xz', '.tar.zst')
+JSONL_SUFFIXES = ('.jsonl', '.jsonl.gz', '.jsonl.zst')
+
+# The size of the blocks tar members are loaded in, the most a member takes on disk
+MEMBER_CHUNK_BYTES = 64 * 1024 * 1024
+
+
+def is_tar_archive(file_path):
+    """Returns whether a path names a tar archive, compressed or not."""
+    return str(file_path).lower().endswith(TAR_SUFFIXES)
+
+
+def _zstd_reader(file_obj):
+    try:
+        import zstandard
+    except ImportError as e:
+        raise ImportError("Reading zstd-compressed input in Python needs the zstandard package, install the zstd "
+                          "extra: pip install 'equalexperts_dataeng_exercise[zstd]'.") from e
+    # Buffered for readline, which the chunked ingest iterates lines with
+    return io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(file_obj, closefd=True))
+
+
+def decompressing_reader(file_obj, name):
+    """
+    Wraps a binary file object in a reader that decompresses it on the fly, according
+    to the .gz or .zst suffix of its name. Other files are returned unchanged.
+    """
+    lower_name = str(name).lower()
+    if lower_name.endswith(('.gz', '.tgz')):
+        return gzip.GzipFile(fileobj=file_obj, mode='rb')
+    if lower_name.endswith('.zst'):
+        return _zstd_reader(file_obj)
+    return file_obj
+
+
+def iter_tar_stream_members(file_obj, name):
+    """
+    Yields the (name, stream) of every JSONL member of a tar archive read from a binary
+    stream, e.g. a download in progress. The archive is read once from start to end and
+    each stream is only valid until the next is yielded.
+
+    Args:
+        file_obj: The binary stream of the archive.
+        name (str): The name of the archive; a .tar.zst name selects zstd decompression,
+            other compressions are detected from the content.
+    """
+    if str(name).lower().endswith('.tar.zst'):
+        # tarfile has no zstd support, the decompressed stream is handed to it instead
+        archive = tarfile.open(fileobj=_zstd_reader(file_obj), mode='r|')
+    else:
+        archive = tarfile.open(fileobj=file_obj, mode='r|*')
+    with archive:
+        for member in archive:
+            if member.isfile() and member.name.lower().endswith(JSONL_SUFFIXES):
+                with decompressing_reader(archive.extractfile(member), member.name) as stream:
+                    yield f"{name}:{member.name}", stream
+
+
+def iter_tar_members(file_path):
+    """
+    Yields the (name, stream) of every JSONL member of a tar archive, reading the
+    archive once from start to end. Each stream is only valid until the next is yielded.
+    """
+    with open(file_path, 'rb') as raw:
+        yield from iter_tar_stream_members(raw, file_path)
+
+
+def iter_jsonl_streams(file_path):
+    """
+    Yields the (name, stream) of every JSONL stream of an input file: the members of a
+    tar archive, or the decompressed content of any other file.
+    """
+    if is_tar_archive(file_path):
+        yield from iter_tar_members(file_path)
+        return
+    with open(file_path, 'rb') as raw, decompressing_reader(raw, file_path) as stream:
+        yield str(file_path), stream
+
+
+def iter_jsonl_chunks(file_obj, chunk_rows=None, chunk_bytes=None):
+    """
+    Yields a binary JSONL stream in blocks that always end on a line boundary.
+
+    Args:
+        file_obj: A binary file object to read from.
+        chunk_rows (int): The number of lines per block.
+        chunk_bytes (int): The approximate size of a block in bytes, used when
+            chunk_rows is not given. A block is extended to the end of its last line.
+    """
+    if chunk_rows:
+        while True:
+            lines = list(itertools.islice(file_obj, chunk_rows))
+            if not lines:
+                return
+            yield b''.join(lines)
+    else:
+        while True:
+            block = file_obj.read(chunk_bytes)
+            if not block:
+                return
+            if not block.endswith(b'\n'):
+                block += file_obj.readline()
+            yield block
@@ -1,30 +1,154 @@
+import sys
 import logging
+import argparse
 # from db import BlogAnalysisDB  # Importing db. class
-from equalexperts_dataeng_exercise.db import BlogAnalysisDB
+from equalexperts_dataeng_exercise.db import BlogAnalysisDB, OUTLIER_GRANULARITIES, WINDOWED_OUTLIER_MODES, outliers_view_name
+from equalexperts_dataeng_exercise.config import add_resource_arguments, resource_settings_from_args
 
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-def calculate_outliers(db):
+def calculate_outliers(db, profile_path=None, granularity='week', threshold=0.2, vote_type_ids=None,
+                       by_vote_type=False, start_date=None, end_date=None, mode='global', trailing_weeks=4, alpha=0.3):
     """
     Orchestrates the outlier calculation process from a duckbd table to a view in the duckdb database.
+    The view is blog_analysis.outlier_weeks by default, or outlier_days or outlier_months. Counts
+    per VoteTypeId or over filtered votes go to a view of their own, e.g. outlier_weeks_filtered,
+    see outliers_view_name. The windowed modes create outlier_weeks_yearly, outlier_weeks_trailing
+    or outlier_weeks_ewma.
+
+    Args:
+        db (BlogAnalysisDB): The database holding blog_analysis.votes.
+        profile_path (str): Profile every step and write the report as JSON to this path.
+        granularity (str): 'day', 'week' or 'month'.
+        threshold (float): The allowed relative deviation from the average, 0.2 is 20%.
+        vote_type_ids (list): Only count the votes of these VoteTypeIds, None counts all.
+        by_vote_type (bool): Find the outliers of every VoteTypeId separately.
+        start_date (date or str): Only count the votes from this day on.
+        end_date (date or str): Only count the votes up to and including this day.
+        mode (str): 'global' compares to the average of every period, 'yearly', 'trailing'
+            and 'ewma' compare a week to the average of its year, the average of its
+            previous weeks or the EWMA of the weeks before it.
+        trailing_weeks (int): The number of previous weeks the trailing mode averages.
+        alpha (float): The weight of the latest week in the EWMA.
+
+    Returns:
+        dict: The profiling report when profile_path is given or profiling is enabled on db,
+        otherwise None.
     """
+    if mode != 'global':
+        if mode not in WINDOWED_OUTLIER_MODES:
+            raise ValueError(f"Unknown outlier mode {mode!r}, expected 'global' or one of {list(WINDOWED_OUTLIER_MODES)}.")
+        if granularity != 'week' or vote_type_ids is not None or by_vote_type or start_date or end_date:
+            raise ValueError(f"The {mode} outlier mode only applies to the weekly counts of every vote.")
+
+    profiler = db.profiler
+    owns_profiler = profile_path is not None and profiler is None
+    if owns_profiler:
+        profiler = db.enable_profiling()
     try:
-        # Computes custom week # 0 and outliers view
-        db.create_outlier_weeks_view()
+        weekly_rows_query = "SELECT COUNT(*) FROM blog_analysis.weekly_vote_counts"
+        with db.profile_step('weekly_counts', rows_out_query=weekly_rows_query):
+            db.setup_weekly_vote_counts()
+
+        if mode == 'global':
+            # Rolls the daily vote count cube up to the custom weeks (week # 0) or the days or months
+            filtered = vote_type_ids is not None or start_date is not None or end_date is not None
+            view_name = outliers_view_name(granularity, by_vote_type, filtered)
+            with db.profile_step(view_name, weekly_rows_query, f"SELECT COUNT(*) FROM blog_analysis.{view_name}"):
+                db.create_outliers_view(granularity, threshold, vote_type_ids, by_vote_type, start_date, end_date)
+        else:
+            with db.profile_step('weekly_baselines', weekly_rows_query,
+                                 "SELECT COUNT(*) FROM blog_analysis.weekly_vote_baselines"):
+                db.setup_weekly_vote_baselines(trailing_weeks, alpha)
+            view_name = f"outlier_weeks_{mode}"
+            with db.profile_step(view_name, weekly_rows_query, f"SELECT COUNT(*) FROM blog_analysis.{view_name}"):
+                db.create_windowed_outlier_weeks_view(mode, threshold, trailing_weeks, alpha)
+
+        if profiler is not None:
+            if profile_path:
+                profiler.write(profile_path)
+            return profiler.report()
 
     except Exception as e:
         logging.error(f"An error occurred during the ingestion process: {e}")
         # If you want to propagate the exception up:
         raise
+    finally:
+        if owns_profiler:
+            db.disable_profiling()
+
+
+def read_outlier_weeks(db, timeout=None):
+    """
+    Returns the (Year, WeekNumber, VoteCount) rows of the outlier weeks view. The query
+    runs on a pooled reader cursor, so several threads can read while another loads.
+
+    Args:
+        db (BlogAnalysisDB): The database holding the outlier_weeks view.
+        timeout (float): Seconds to wait for a free reader, None waits indefinitely.
+    """
+    with db.reader(timeout) as cursor:
+        return cursor.execute("SELECT Year, WeekNumber, VoteCount FROM blog_analysis.outlier_weeks").fetchall()
+
+
+def read_outliers(db, granularity='week', timeout=None, mode='global', by_vote_type=False, filtered=False):
+    """
+    Returns the rows of the outlier_days, outlier_weeks or outlier_months view, or of a
+    windowed outlier weeks view, on a pooled reader cursor like read_outlier_weeks.
+
+    Args:
+        db (BlogAnalysisDB): The database holding the view.
+        granularity (str): 'day', 'week' or 'month'.
+        timeout (float): Seconds to wait for a free reader, None waits indefinitely.
+        mode (str): 'global', or the windowed mode 'yearly', 'trailing' or 'ewma'.
+        by_vote_type (bool): Read the view counted per VoteTypeId.
+        filtered (bool): Read the view of the last call with VoteTypeId or date filters.
+    """
+    if granularity not in OUTLIER_GRANULARITIES:
+        raise ValueError(f"Unknown outlier granularity {granularity!r}, expected one of {list(OUTLIER_GRANULARITIES)}.")
+    if mode == 'global':
+        view_name = outliers_view_name(granularity, by_vote_type, filtered)
+    elif mode in WINDOWED_OUTLIER_MODES and granularity == 'week':
+        view_name = f"outlier_weeks_{mode}"
+    else:
+        raise ValueError(f"Unknown outlier mode {mode!r} for the {granularity} granularity.")
+    with db.reader(timeout) as cursor:
+        return cursor.execute(f"SELECT * FROM blog_analysis.{view_name}").fetchall()
+
 
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compute the outlier weeks view from the ingested votes.")
+    parser.add_argument('--granularity', choices=list(OUTLIER_GRANULARITIES), default='week',
+                        help="period the votes are counted by: outlier_days, outlier_weeks or outlier_months (default: week)")
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help="allowed relative deviation from the average count (default: 0.2)")
+    parser.add_argument('--vote-type-id', type=int, action='append', dest='vote_type_ids',
+                        help="only count votes of this VoteTypeId, can be repeated")
+    parser.add_argument('--by-vote-type', action='store_true',
+                        help="find the outliers of every VoteTypeId separately")
+    parser.add_argument('--start-date', help="only count votes from this day on, e.g. 2022-01-01")
+    parser.add_argument('--end-date', help="only count votes up to and including this day")
+    parser.add_argument('--mode', choices=['global', *WINDOWED_OUTLIER_MODES], default='global',
+                        help="baseline a week is compared to: the average of every week, of its year, "
+                             "of its previous weeks or their EWMA (default: global)")
+    parser.add_argument('--trailing-weeks', type=int, default=4,
+                        help="number of previous weeks the trailing mode averages (default: 4)")
+    parser.add_argument('--alpha', type=float, default=0.3,
+                        help="weight of the latest week in the EWMA mode (default: 0.3)")
+    parser.add_argument('--profile', metavar='PATH',
+                        help="write a JSON report of the time, row counts and query profile of every step to PATH")
+    add_resource_arguments(parser)
+    args = parser.parse_args(sys.argv[1:] if argv is None else argv)
 
-def main():
     # Initialize db connection within a context manager to ensure it's properly closed
     try:
-        with BlogAnalysisDB() as db:
-            calculate_outliers(db)
+        with BlogAnalysisDB(settings=resource_settings_from_args(args), config_path=args.config) as db:
+            calculate_outliers(db, profile_path=args.profile, granularity=args.granularity, threshold=args.threshold,
+                               vote_type_ids=args.vote_type_ids, by_vote_type=args.by_vote_type,
+                               start_date=args.start_date, end_date=args.end_date, mode=args.mode,
+                               trailing_weeks=args.trailing_weeks, alpha=args.alpha)
     except Exception as e:
         logging.error(f"An error occurred: {e}")
 
@@ -0,0 +1,156 @@
+"""
+Opt-in instrumentation for the ingestion and outlier pipelines. A PipelineProfiler
+records, for each pipeline step, the wall time, the rows going in and out and the
+DuckDB query profile of every statement the step ran, so a slow load can be traced to
+read_json, the dedup window, the merge anti-join or the index rebuild.
+
+Profiling is enabled on a database with BlogAnalysisDB.enable_profiling(); steps are
+then recorded with BlogAnalysisDB.profile_step(), which is a no-op otherwise.
+"""
+
+import os
+import re
+import json
+import time
+import logging
+import tempfile
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+PLAN_FORMATS = ('json', 'query_tree')
+
+
+def _compact_sql(query, max_length=200):
+    query = re.sub(r'\s+', ' ', str(query)).strip()
+    return query if len(query) <= max_length else query[:max_length - 3] + '...'
+
+
+class ProfiledConnection:
+    """
+    Wraps a DuckDB connection so that every execute() is timed and its query profile
+    is attached to the step the profiler is currently recording.
+    """
+
+    def __init__(self, conn, profiler):
+        self._conn = conn
+        self._profiler = profiler
+
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+
+    def execute(self, query, *args, **kwargs):
+        if self._profiler.current_step is None:
+            return self._conn.execute(query, *args, **kwargs)
+
+        if os.path.exists(self._profiler.profile_output):
+            os.remove(self._profiler.profile_output)
+        tic = time.perf_counter()
+        result = self._conn.execute(query, *args, **kwargs)
+        self._profiler.record_statement(query, time.perf_counter() - tic)
+        return result
+
+
+class PipelineProfiler:
+    """
+    Collects the per-step measurements of one or more pipeline runs.
+
+    Args:
+        conn: The raw DuckDB connection to profile.
+        capture_plans (bool): Keep DuckDB's query profile of every statement, not only its timing.
+        plan_format (str): 'json' for DuckDB's JSON query profile, 'query_tree' for the
+            EXPLAIN ANALYZE style text tree.
+    """
+
+    def __init__(self, conn, capture_plans=True, plan_format='json'):
+        if plan_format not in PLAN_FORMATS:
+            raise ValueError(f"Unknown plan format {plan_format!r}, expected one of {PLAN_FORMATS}.")
+        self.conn = conn
+        self.capture_plans = capture_plans
+        self.plan_format = plan_format
+        self.steps = []
+        self.current_step = None
+        self.started_at = datetime.now(timezone.utc).isoformat(timespec='seconds')
+
+        suffix = '.json' if plan_format == 'json' else '.txt'
+        profile_file, self.profile_output = tempfile.mkstemp(prefix='duckdb-profile-', suffix=suffix)
+        os.close(profile_file)
+        self.conn.execute(f"PRAGMA enable_profiling='{plan_format}';")
+        escaped_output = self.profile_output.replace("'", "''")
+        self.conn.execute(f"PRAGMA profiling_output='{escaped_output}';")
+
+
+    def close(self):
+        """Turns DuckDB profiling off and removes the scratch profile file."""
+        try:
+            self.conn.execute("PRAGMA disable_profiling;")
+        finally:
+            if os.path.exists(self.profile_output):
+                os.remove(self.profile_output)
+
+
+    def _count(self, query):
+        return self.conn.execute(query).fetchone()[0] if query else None
+
+
+    @contextmanager
+    def step(self, name, rows_in_query=None, rows_out_query=None):
+        """
+        Records one pipeline step. The row count queries run outside the timed section.
+
+        Args:
+            name (str): The step name, e.g. 'load' or 'merge'.
+            rows_in_query (str): A query returning the number of rows going into the step.
+            rows_out_query (str): A query returning the number of rows the step produced.
+        """
+        step = {'step': name, 'rows_in': self._count(rows_in_query), 'statements': []}
+        parent_step, self.current_step = self.current_step, step
+        tic = time.perf_counter()
+        try:
+            yield step
+        finally:
+            step['seconds'] = round(time.perf_counter() - tic, 6)
+            self.current_step = parent_step
+        step['rows_out'] = self._count(rows_out_query)
+        self.steps.append(step)
+        logging.info(f"Step {name} took {step['seconds']:.3f}s, rows in {step['rows_in']}, rows out {step['rows_out']}.")
+
+
+    def record_statement(self, query, seconds):
+        statement = {'sql': _compact_sql(query), 'seconds': round(seconds, 6)}
+        if os.path.exists(self.profile_output):
+            with open(self.profile_output) as profile_file:
+                profile = profile_file.read()
+            if self.plan_format == 'json':
+                profile = json.loads(profile)
+                statement['rows_returned'] = profile.get('rows_returned')
+            if self.capture_plans:
+                statement['profile'] = profile
+        self.current_step['statements'].append(statement)
+
+
+    def report(self):
+        """
+        Returns the structured report: every recorded step in order, and the total
+        seconds and number of runs per step name.
+        """
+        totals = {}
+        for step in self.steps:
+            total = totals.setdefault(step['step'], {'seconds': 0.0, 'count': 0})
+            total['seconds'] = round(total['seconds'] + step['seconds'], 6)
+            total['count'] += 1
+        return {
+            'started_at': self.started_at,
+            'plan_format': self.plan_format,
+            'total_seconds': round(sum(step['seconds'] for step in self.steps), 6),
+            'totals': totals,
+            'steps': self.steps,
+        }
+
+
+    def write(self, profile_path):
+        """Writes the report as JSON to profile_path."""
+        with open(profile_path, 'w') as profile_file:
+            json.dump(self.report(), profile_file, indent=2, default=str)
+        logging.info(f"Profile written to {profile_path}.")
@@ -0,0 +1,143 @@
+"""
+Benchmarks each stage of ingest_data and calculate_outliers on synthetic vote files and
+appends the timings as one JSON line per run, so results can be compared across versions.
+
+    python -m equalexperts_dataeng_exercise.scripts.benchmark_ingest --rows 1000000 10000000 100000000
+
+Each run generates votes.jsonl (and votes-upserts.jsonl) with generate_votes, ingests it
+into a fresh file database, ingests the upserts on top and computes the outlier weeks,
+with the step timings and row counts taken from the database's pipeline profiler.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import logging
+import platform
+import tempfile
+import subprocess
+from datetime import datetime, timezone
+
+import duckdb
+
+from equalexperts_dataeng_exercise.db import BlogAnalysisDB
+from equalexperts_dataeng_exercise.config import RESOURCE_SETTINGS, add_resource_arguments, resource_settings_from_args
+from equalexperts_dataeng_exercise.ingest import ingest_data
+from equalexperts_dataeng_exercise.outliers import calculate_outliers
+from equalexperts_dataeng_exercise.scripts.generate_votes import generate_votes, add_generator_arguments
+
+
+def _git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(__file__), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _phase_stages(profiler, phase, first_step):
+    # A chunked load repeats its steps once per chunk, their times are added up
+    stages = {}
+    for step in profiler.steps[first_step:]:
+        stage = stages.setdefault(step['step'], {'stage': f"{phase}.{step['step']}", 'seconds': 0.0})
+        stage['seconds'] = round(stage['seconds'] + step['seconds'], 4)
+        stage['rows'] = step['rows_out']
+    return list(stages.values())
+
+
+def run_benchmark(rows, work_dir, generator_options, ingest_options=None, settings=None, config_path=None):
+    """
+    Generates the files for one size and times every stage against a fresh database.
+
+    Args:
+        rows (int): The number of lines in the generated votes.jsonl.
+        work_dir (str): The directory for the generated files and the database.
+        generator_options (dict): Keyword arguments for generate_votes.
+        ingest_options (dict): Keyword arguments for ingest_data, e.g. the pipeline.
+        settings (dict): DuckDB resource settings for the database.
+        config_path (str): A TOML file of DuckDB resource settings.
+
+    Returns:
+        dict: The benchmark record.
+    """
+    ingest_options = ingest_options or {}
+    data_dir = os.path.join(work_dir, f'votes-{rows}')
+    tic = time.perf_counter()
+    files = generate_votes(data_dir, rows, **generator_options)
+    generate_seconds = time.perf_counter() - tic
+
+    db_path = os.path.join(work_dir, f'warehouse-{rows}.db')
+    if os.path.exists(db_path):
+        os.remove(db_path)
+    stages = []
+    with BlogAnalysisDB(db_path=db_path, settings=settings, config_path=config_path) as db:
+        effective_settings = dict(db.conn.execute(
+            "SELECT name, value FROM duckdb_settings() WHERE name IN (SELECT unnest(?::VARCHAR[]))",
+            [list(RESOURCE_SETTINGS)]).fetchall())
+        # Only the step timings are kept, the query profiles of a large run are not needed here
+        profiler = db.enable_profiling(capture_plans=False)
+        phases = [('ingest', lambda: ingest_data(files['votes'], db, **ingest_options))]
+        if 'upserts' in files:
+            phases.append(('upsert', lambda: ingest_data(files['upserts'], db, **ingest_options)))
+        phases.append(('outliers', lambda: calculate_outliers(db)))
+        for phase, run in phases:
+            first_step = len(profiler.steps)
+            run()
+            stages.extend(_phase_stages(profiler, phase, first_step))
+
+    return {
+        'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'git_revision': _git_revision(),
+        'duckdb_version': duckdb.__version__,
+        'python_version': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'rows': rows,
+        'generator': generator_options,
+        'ingest': ingest_options,
+        'settings': effective_settings,
+        'generate_seconds': round(generate_seconds, 4),
+        'input_bytes': sum(os.path.getsize(path) for path in files.values()),
+        'stages': stages,
+        'total_seconds': round(sum(stage['seconds'] for stage in stages), 4),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark ingest_data and calculate_outliers on synthetic votes.")
+    parser.add_argument('--rows', type=int, nargs='+', default=[1_000_000],
+                        help="sizes to benchmark, e.g. 1000000 10000000 100000000")
+    parser.add_argument('--work-dir', help="where to write the generated files and databases (default: a temporary directory)")
+    parser.add_argument('--output', default='benchmark-results.jsonl', help="JSON lines file the results are appended to")
+    parser.add_argument('--pipeline', choices=['staged', 'fused'], default='staged', help="ingest pipeline to benchmark")
+    parser.add_argument('--chunk-rows', type=int, help="benchmark the chunked ingest with chunks of this many lines")
+    parser.add_argument('--shards', type=int, help="benchmark the sharded ingest with this many worker processes")
+    add_generator_arguments(parser)
+    add_resource_arguments(parser)
+    args = parser.parse_args(sys.argv[1:] if argv is None else argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    generator_options = {
+        'duplicate_ratio': args.duplicate_ratio, 'invalid_ratio': args.invalid_ratio,
+        'late_ratio': args.late_ratio, 'upsert_ratio': args.upsert_ratio, 'seed': args.seed,
+    }
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        work_dir = args.work_dir or temp_dir
+        for rows in args.rows:
+            record = run_benchmark(rows, work_dir, generator_options,
+                                   {'pipeline': args.pipeline, 'chunk_rows': args.chunk_rows, 'shards': args.shards},
+                                   resource_settings_from_args(args), args.config)
+            with open(args.output, 'a') as output:
+                output.write(json.dumps(record) + '\n')
+
+            print(f"{'stage':<20}{'rows out':>14}{'seconds':>10}")
+            for stage in record['stages']:
+                rows_out = '' if stage['rows'] is None else stage['rows']
+                print(f"{stage['stage']:<20}{rows_out:>14}{stage['seconds']:>10.2f}")
+            print(f"{'total':<20}{rows:>14}{record['total_seconds']:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""
+Compares the storage layouts of blog_analysis.votes: the time to load and upsert
+synthetic votes, and the time of the scans the outlier calculation and date-range
+readers run against the table.
+
+    python -m equalexperts_dataeng_exercise.scripts.benchmark_layout --rows 3000000
+
+Each layout is loaded into its own fresh database from the same generated files. Results
+are appended as JSON lines like benchmark_ingest.
+"""
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import logging
+import tempfile
+from datetime import date, timedelta
+
+from equalexperts_dataeng_exercise.db import BlogAnalysisDB
+from equalexperts_dataeng_exercise.ingest import ingest_data
+from equalexperts_dataeng_exercise.outliers import calculate_outliers
+from equalexperts_dataeng_exercise.scripts.generate_votes import generate_votes
+from equalexperts_dataeng_exercise.scripts.benchmark_ingest import _git_revision
+
+WEEK_SCAN_QUERY = """
+    SELECT COUNT(*) FROM blog_analysis.votes
+    WHERE CreationDate >= ?::TIMESTAMP AND CreationDate < ?::TIMESTAMP + INTERVAL 7 DAY
+"""
+ID_LOOKUP_QUERY = "SELECT * FROM blog_analysis.votes WHERE Id = ?"
+
+# The layouts compared, and whether the table is rewritten in CreationDate order after the loads
+VARIANTS = {
+    'indexed': ('indexed', False),
+    'sorted': ('sorted', False),
+    'sorted+cluster': ('sorted', True),
+    'partitioned': ('partitioned', False),
+}
+
+
+def _time(function, repeat=1):
+    tic = time.perf_counter()
+    for _ in range(repeat):
+        function()
+    return round(time.perf_counter() - tic, 4)
+
+
+def run_layout(layout, cluster, files, db_path, load_mode, queries):
+    """
+    Loads the files with one layout, optionally rewrites the table in CreationDate order,
+    and times the loads and the read queries.
+
+    Returns:
+        dict: Seconds per measured operation.
+    """
+    if os.path.exists(db_path):
+        os.remove(db_path)
+    partition_path = os.path.splitext(db_path)[0] + '-votes'
+    shutil.rmtree(partition_path, ignore_errors=True)
+    timings = {}
+    with BlogAnalysisDB(db_path=db_path, layout=layout, partition_path=partition_path) as db:
+        timings['ingest'] = _time(lambda: ingest_data(files['votes'], db, load_mode=load_mode))
+        if 'upserts' in files:
+            timings['upsert'] = _time(lambda: ingest_data(files['upserts'], db, load_mode=load_mode))
+        timings['cluster'] = _time(db.cluster_votes) if cluster else 0.0
+        timings['outliers'] = _time(lambda: calculate_outliers(db))
+        # A full recompute of the weekly counts scans every CreationDate
+        timings['weekly_rebuild'] = _time(db.rebuild_weekly_vote_counts)
+
+        week_starts = queries['week_starts']
+        timings['week_scans'] = _time(lambda: [db.conn.execute(WEEK_SCAN_QUERY, [start, start]).fetchall()
+                                               for start in week_starts])
+        timings['id_lookups'] = _time(lambda: [db.conn.execute(ID_LOOKUP_QUERY, [vote_id]).fetchall()
+                                               for vote_id in queries['ids']])
+    # The partitioned layout keeps the votes next to the database file
+    timings['database_bytes'] = os.path.getsize(db_path) + sum(
+        os.path.getsize(os.path.join(directory, file_name))
+        for directory, _, file_names in os.walk(partition_path) for file_name in file_names)
+    return timings
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the storage layouts of the votes table.")
+    parser.add_argument('--rows', type=int, default=1_000_000, help="number of generated votes")
+    parser.add_argument('--load-mode', choices=['merge', 'rebuild'], default='merge', help="load mode of ingest_data")
+    parser.add_argument('--queries', type=int, default=50, help="number of week scans and of Id lookups")
+    parser.add_argument('--work-dir', help="where to write the generated files and databases (default: a temporary directory)")
+    parser.add_argument('--output', default='benchmark-results.jsonl', help="JSON lines file the results are appended to")
+    args = parser.parse_args(sys.argv[1:] if argv is None else argv)
+
+    logging.disable(logging.INFO)
+    randomizer = random.Random(42)
+    queries = {
+        # The generated votes span 2019 to 2022
+        'week_starts': [str(date(2019, 1, 1) + timedelta(weeks=randomizer.randrange(200))) for _ in range(args.queries)],
+        'ids': [randomizer.randrange(1, args.rows) for _ in range(args.queries)],
+    }
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        work_dir = args.work_dir or temp_dir
+        files = generate_votes(os.path.join(work_dir, f'votes-{args.rows}'), args.rows)
+        record = {
+            'benchmark': 'layout',
+            'git_revision': _git_revision(),
+            'rows': args.rows,
+            'load_mode': args.load_mode,
+            'queries': args.queries,
+            'layouts': {name: run_layout(layout, cluster, files, os.path.join(work_dir, f'warehouse-{name}.db'),
+                                         args.load_mode, queries)
+                        for name, (layout, cluster) in VARIANTS.items()},
+        }
+
+    with open(args.output, 'a') as output:
+        output.write(json.dumps(record) + '\n')
+
+    print(f"{'operation':<16}" + ''.join(f"{name:>16}" for name in VARIANTS))
+    for operation in record['layouts']['indexed']:
+        print(f"{operation:<16}" + ''.join(f"{record['layouts'][name][operation]:>16}" for name in VARIANTS))
+
+
+if __name__ == "__main__":
+    main()
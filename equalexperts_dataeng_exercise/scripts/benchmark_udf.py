@@ -0,0 +1,65 @@
+"""
+Benchmarks the row-at-a-time cleanse_and_deduplicate_row UDF against its vectorized
+Arrow equivalent cleanse_and_deduplicate_batch on generated vote rows.
+
+    python -m equalexperts_dataeng_exercise.scripts.benchmark_udf --rows 200000
+"""
+import argparse
+import logging
+import time
+
+from equalexperts_dataeng_exercise.db import BlogAnalysisDB
+
+UDF_QUERY = """
+    SELECT COUNT(*) FILTER (WHERE result.status = 'FAILED')
+    FROM (
+        SELECT {udf}(Id, PostId, VoteTypeId, CreationDate, UserId, BountyAmount, rn) AS result
+        FROM benchmark_votes
+    ) validated;
+"""
+
+
+def generate_votes(db, rows):
+    # One row in 50 has an invalid Id, one in 70 an invalid CreationDate and one in 20 is a duplicate
+    db.conn.execute(f"""
+        CREATE OR REPLACE TABLE benchmark_votes AS
+        SELECT
+            CASE WHEN i % 50 = 0 THEN 'INVALID' ELSE CAST(i AS VARCHAR) END AS Id,
+            CAST(i % 1000 AS VARCHAR) AS PostId,
+            CAST(i % 10 AS VARCHAR) AS VoteTypeId,
+            CASE WHEN i % 70 = 0 THEN 'INVALID_DATE'
+                ELSE strftime(TIMESTAMP '2020-01-01' + INTERVAL (i % 1000000) MINUTE, '%Y-%m-%dT%H:%M:%S.000')
+            END AS CreationDate,
+            NULL::VARCHAR AS UserId,
+            NULL::VARCHAR AS BountyAmount,
+            CASE WHEN i % 20 = 0 THEN 2 ELSE 1 END AS rn
+        FROM range({rows}) t(i);
+    """)
+
+
+def time_udf(db, udf):
+    tic = time.perf_counter()
+    failed = db.conn.execute(UDF_QUERY.format(udf=udf)).fetchone()[0]
+    return time.perf_counter() - tic, failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the scalar and vectorized validation UDFs.")
+    parser.add_argument('--rows', type=int, default=200_000, help="number of generated rows")
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+    with BlogAnalysisDB(db_path=':memory:') as db:
+        db.register_udfs()
+        generate_votes(db, args.rows)
+
+        results = {udf: time_udf(db, udf) for udf in ['cleanse_and_deduplicate_row', 'cleanse_and_deduplicate_batch']}
+
+    scalar_seconds = results['cleanse_and_deduplicate_row'][0]
+    print(f"{'udf':<32}{'rows':>12}{'failed':>10}{'seconds':>10}{'rows/s':>14}{'speedup':>9}")
+    for udf, (seconds, failed) in results.items():
+        print(f"{udf:<32}{args.rows:>12}{failed:>10}{seconds:>10.2f}{args.rows / seconds:>14,.0f}{scalar_seconds / seconds:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
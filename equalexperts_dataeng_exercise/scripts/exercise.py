@@ -9,23 +9,40 @@ For example
 
     poetry run exercise ingest-data
     poetry run exercise detect-outliers
+    poetry run exercise pipeline
     poetry run exercise test
 
+fetch-data, ingest-data, detect-outliers and pipeline run in this process; the modules
+that import duckdb are only imported by the command that needs them, so --help and the
+tooling commands start without loading it.
 """
+import logging
 import subprocess
+from contextlib import contextmanager
 from pathlib import Path
 
-import duckdb
 import typer
 
 app = typer.Typer()
 
+VOTES_PATH = Path("uncommitted") / "votes.jsonl"
+
 
 def run_cmd(cmd: str):
     proc = subprocess.Popen(cmd, shell=True)
     proc.communicate()
 
 
+@contextmanager
+def exit_on_error():
+    # Like the module CLIs the error is logged, but the command also exits non-zero
+    try:
+        yield
+    except Exception as e:
+        logging.error(f"An error occurred: {e}")
+        raise typer.Exit(code=1)
+
+
 @app.command()
 def tidy():
     run_cmd("isort equalexperts_dataeng_exercise")
@@ -47,26 +64,50 @@ def test():
 
 
 @app.command()
-def fetch_data():
-    run_cmd("python -m equalexperts_dataeng_exercise.scripts.fetch_data")
+def fetch_data(connections: int = typer.Option(1, help="Fetch the archive over this many range connections.")):
+    from equalexperts_dataeng_exercise.scripts.fetch_data import download_data
+
+    with exit_on_error():
+        download_data(connections=connections)
 
 
 @app.command()
 def ingest_data():
-    path_to_data = Path("uncommitted") / "votes.jsonl"
-    run_cmd(f"python -m equalexperts_dataeng_exercise.ingest {path_to_data}")
+    from equalexperts_dataeng_exercise.db import BlogAnalysisDB
+    from equalexperts_dataeng_exercise.ingest import ingest_data as ingest
+
+    with exit_on_error(), BlogAnalysisDB("warehouse.db") as db:
+        ingest(str(VOTES_PATH), db)
 
 
 @app.command()
 def run_query(query: str):
-    conn = duckdb.connect("warehouse.db")
-    result = conn.sql(query)
-    result.show()
+    from equalexperts_dataeng_exercise.db import BlogAnalysisDB
+
+    # Read-only, so queries can run next to each other without locking the database for writers
+    with exit_on_error(), BlogAnalysisDB("warehouse.db", read_only=True) as db, db.reader() as cursor:
+        cursor.sql(query).show()
 
 
 @app.command()
 def detect_outliers():
-    run_cmd("python -m equalexperts_dataeng_exercise.outliers")
+    from equalexperts_dataeng_exercise.db import BlogAnalysisDB
+    from equalexperts_dataeng_exercise.outliers import calculate_outliers
+
+    with exit_on_error(), BlogAnalysisDB("warehouse.db") as db:
+        calculate_outliers(db)
+
+
+@app.command()
+def pipeline():
+    """Ingest uncommitted/votes.jsonl and refresh the outlier weeks on one connection."""
+    from equalexperts_dataeng_exercise.db import BlogAnalysisDB
+    from equalexperts_dataeng_exercise.ingest import ingest_data as ingest
+    from equalexperts_dataeng_exercise.outliers import calculate_outliers
+
+    with exit_on_error(), BlogAnalysisDB("warehouse.db") as db:
+        ingest(str(VOTES_PATH), db)
+        calculate_outliers(db)
 
 
 @app.command()
@@ -1,17 +1,46 @@
+"""
+Fetches the exercise data. The archive is untarred while it downloads, so no copy of it
+is written to disk first:
+
+    python -m equalexperts_dataeng_exercise.scripts.fetch_data
+    python -m equalexperts_dataeng_exercise.scripts.fetch_data --connections 4
+    python -m equalexperts_dataeng_exercise.scripts.fetch_data --ingest
+
+--ingest streams the JSONL members of the archive straight into the chunked ingest of
+warehouse.db instead of extracting them. A dropped connection resumes at the byte it
+stopped at with an HTTP Range request, and with --connections N the archive is fetched
+as consecutive ranges over N connections when the server supports range requests.
+"""
+import io
 import logging
 import os
 import sys
+import argparse
 import tarfile
-import tempfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 import requests
 
+from equalexperts_dataeng_exercise.inputs import MEMBER_CHUNK_BYTES, iter_tar_stream_members
+
 DATA_URL = (
     "https://drive.google.com/uc?export=download&id=1jLcE2Jw1znaBy7FD7XCme_My_1PTZk17"
 )
 DATA_DIR = "uncommitted"
 CHUNK_SIZE_8_MIB = 8 * 1024 * 1024
+# The size of the reads from a response; the bytes of a read the connection drops in are
+# fetched again, so they are kept small
+READ_SIZE_64_KIB = 64 * 1024
+# The size of the ranges fetched in parallel; at most one per connection is held in memory
+PART_SIZE_32_MIB = 32 * 1024 * 1024
+# Consecutive failed attempts at a range before the download gives up
+MAX_RETRIES = 5
+# Seconds to wait for the connection and for each read of the response
+TIMEOUT = 60
+RESUMABLE_ERRORS = (requests.exceptions.ConnectionError, requests.exceptions.ChunkedEncodingError,
+                    requests.exceptions.Timeout)
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
@@ -23,17 +52,246 @@ handler.setFormatter(formatter)
 logger.addHandler(handler)
 
 
-def download_and_extract(url: str):
-    with tempfile.TemporaryFile() as tmp:
-        logger.info("Downloading %s", url)
-        with requests.get(url, stream=True) as download_stream:
-            download_stream.raise_for_status()
-            for chunk in download_stream.iter_content(chunk_size=CHUNK_SIZE_8_MIB):
-                tmp.write(chunk)
-            logger.info("Uncompressing...")
-            tmp.seek(0)
-            with tarfile.open(fileobj=tmp) as uncompressed:
-                uncompressed.extractall(path=DATA_DIR)
+class RangeReader(io.RawIOBase):
+    """
+    Reads the bytes from start to end of a URL as a sequential stream. When the
+    connection drops, the download continues at the current offset with a Range request
+    instead of starting over.
+
+    Args:
+        url (str): The resource to read.
+        start (int): The offset of the first byte.
+        end (int): The offset after the last byte, None reads to the end of the resource.
+        max_retries (int): Consecutive failed attempts before the error is raised.
+    """
+
+    def __init__(self, url, start=0, end=None, max_retries=MAX_RETRIES):
+        self.url = url
+        self.offset = start
+        self.end = end
+        self.max_retries = max_retries
+        self._response = None
+        self._chunks = None
+        self._pending = b''
+
+
+    def readable(self):
+        return True
+
+
+    def _connect(self):
+        headers = {}
+        if self.offset or self.end is not None:
+            last_byte = '' if self.end is None else self.end - 1
+            headers['Range'] = f"bytes={self.offset}-{last_byte}"
+        response = requests.get(self.url, headers=headers, stream=True, timeout=TIMEOUT)
+        response.raise_for_status()
+        if 'Range' in headers and response.status_code != 206:
+            response.close()
+            raise IOError(f"{self.url} does not support range requests, cannot read from byte {self.offset}.")
+        if self.end is None and 'Content-Length' in response.headers:
+            # Known from here on, so a connection that closes early is told apart from the end
+            self.end = self.offset + int(response.headers['Content-Length'])
+        self._response = response
+        self._chunks = response.iter_content(chunk_size=READ_SIZE_64_KIB)
+
+
+    def _disconnect(self):
+        if self._response is not None:
+            self._response.close()
+        self._response = None
+        self._chunks = None
+
+
+    def _next_chunk(self):
+        failures = 0
+        while True:
+            if self.end is not None and self.offset >= self.end:
+                return b''
+            try:
+                if self._chunks is None:
+                    self._connect()
+                chunk = next(self._chunks, b'')
+                if chunk:
+                    return chunk
+                if self.end is None:
+                    return b''
+                raise requests.exceptions.ChunkedEncodingError(
+                    f"The response ended at byte {self.offset} of {self.end}.")
+            except RESUMABLE_ERRORS as e:
+                self._disconnect()
+                failures += 1
+                if failures > self.max_retries:
+                    raise
+                logger.warning("Download of %s interrupted at byte %d, resuming: %s", self.url, self.offset, e)
+
+
+    def readinto(self, buffer):
+        if not self._pending:
+            self._pending = self._next_chunk()
+        size = min(len(buffer), len(self._pending))
+        buffer[:size] = self._pending[:size]
+        self._pending = self._pending[size:]
+        self.offset += size
+        return size
+
+
+    def close(self):
+        self._disconnect()
+        super().close()
+
+
+class ParallelRangeReader(io.RawIOBase):
+    """
+    Reads a URL as a sequential stream while fetching it as consecutive ranges over
+    several connections, each resumed on its own like RangeReader. Ranges are fetched at
+    most `connections` ahead of the reader, which bounds the memory to that many parts.
+
+    Args:
+        url (str): The resource to read; the server must answer Range requests.
+        size (int): The length of the resource in bytes.
+        connections (int): The number of ranges fetched at the same time.
+        part_size (int): The length of a range in bytes.
+        start (int): The offset of the first byte.
+    """
+
+    def __init__(self, url, size, connections=4, part_size=PART_SIZE_32_MIB, start=0):
+        self.url = url
+        self.size = size
+        self.connections = connections
+        self.part_size = part_size
+        self._next_start = start
+        self._parts = deque()
+        self._current = memoryview(b'')
+        self._executor = ThreadPoolExecutor(max_workers=connections, thread_name_prefix='range')
+        self._fill()
+
+
+    def readable(self):
+        return True
+
+
+    def _fetch_part(self, start, end):
+        with RangeReader(self.url, start, end) as reader:
+            return reader.read()
+
+
+    def _fill(self):
+        while len(self._parts) < self.connections and self._next_start < self.size:
+            end = min(self._next_start + self.part_size, self.size)
+            self._parts.append(self._executor.submit(self._fetch_part, self._next_start, end))
+            self._next_start = end
+
+
+    def readinto(self, buffer):
+        if not self._current:
+            if not self._parts:
+                return 0
+            self._current = memoryview(self._parts.popleft().result())
+            self._fill()
+        size = min(len(buffer), len(self._current))
+        buffer[:size] = self._current[:size]
+        self._current = self._current[size:]
+        return size
+
+
+    def close(self):
+        # Parts still downloading finish in the background, queued ones are dropped
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self._parts.clear()
+        super().close()
+
+
+def open_download(url: str, connections=1, part_size=PART_SIZE_32_MIB, start=0):
+    """
+    Opens a URL as a buffered binary stream that resumes dropped connections.
+
+    Args:
+        url (str): The resource to download.
+        connections (int): Fetch the resource as consecutive ranges over this many
+            connections. The server has to advertise range requests and the length of
+            the resource, otherwise a single connection is used.
+        part_size (int): The length of the ranges fetched in parallel.
+        start (int): The offset to start reading at, e.g. the size of a partial download.
+
+    Returns:
+        io.BufferedReader: The stream of the resource from start on.
+    """
+    if connections < 1 or part_size < 1:
+        raise ValueError("A download needs at least one connection and a positive part size.")
+    if connections > 1:
+        with requests.head(url, allow_redirects=True, timeout=TIMEOUT) as response:
+            response.raise_for_status()
+            size = int(response.headers.get('Content-Length', 0))
+            if response.headers.get('Accept-Ranges') == 'bytes' and size:
+                return io.BufferedReader(ParallelRangeReader(response.url, size, connections, part_size, start),
+                                         CHUNK_SIZE_8_MIB)
+        logger.info("%s does not advertise range requests, downloading over one connection.", url)
+    return io.BufferedReader(RangeReader(url, start), CHUNK_SIZE_8_MIB)
+
+
+def download_file(url: str, target_path, connections=1, part_size=PART_SIZE_32_MIB):
+    """
+    Downloads a URL to a file through a .part file, which a later call resumes from
+    where an interrupted download left it.
+
+    Args:
+        url (str): The resource to download.
+        target_path (str): The file to write, e.g. votes.tar.gz for a later ingest_data.
+        connections (int): See open_download.
+        part_size (int): See open_download.
+    """
+    part_path = f"{target_path}.part"
+    start = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+    if start:
+        logger.info("Resuming %s at byte %d", url, start)
+    with open(part_path, 'ab') as target, open_download(url, connections, part_size, start) as source:
+        while chunk := source.read(CHUNK_SIZE_8_MIB):
+            target.write(chunk)
+    os.replace(part_path, target_path)
+
+
+def download_and_extract(url: str, connections=1, part_size=PART_SIZE_32_MIB):
+    logger.info("Downloading and uncompressing %s", url)
+    # Untarred in stream mode, member by member as the bytes arrive
+    with open_download(url, connections, part_size) as download, \
+            tarfile.open(fileobj=download, mode='r|*') as uncompressed:
+        uncompressed.extractall(path=DATA_DIR)
+
+
+def download_and_ingest(url: str, db, connections=1, part_size=PART_SIZE_32_MIB, load_mode='merge', chunk_rows=None,
+                        chunk_bytes=MEMBER_CHUNK_BYTES, pipeline='staged'):
+    """
+    Streams the JSONL members of a tar archive from a URL into the chunked ingest while
+    it downloads. Neither the archive nor its members are written to disk, apart from
+    one chunk at a time. The download is not recorded in the ingest manifest, which
+    tracks files.
+
+    Args:
+        url (str): The tar archive to ingest, compressed or not.
+        db (BlogAnalysisDB): The database to load into.
+        connections (int): See open_download.
+        part_size (int): See open_download.
+        load_mode (str): 'merge' or 'cdc', see ingest_data.
+        chunk_rows (int): Ingest the members in chunks of this many lines.
+        chunk_bytes (int): Ingest the members in chunks of about this many bytes.
+        pipeline (str): 'staged' or 'fused', see stage_batch.
+
+    Returns:
+        dict: The number of staged records per staging_status over all chunks.
+    """
+    # Imported here, so a plain fetch does not load duckdb
+    from equalexperts_dataeng_exercise.ingest import LOAD_MODES, ingest_streams_in_chunks
+    from equalexperts_dataeng_exercise.db import VOTES_COLUMN_DEFINITIONS
+
+    if load_mode not in LOAD_MODES or load_mode == 'rebuild':
+        raise ValueError(f"Unknown load mode {load_mode!r} for a streamed ingest, expected 'merge' or 'cdc'.")
+    db.conn.execute("CREATE SCHEMA IF NOT EXISTS blog_analysis;")
+    logger.info("Downloading and ingesting %s", url)
+    with open_download(url, connections, part_size) as download:
+        members = iter_tar_stream_members(download, url)
+        return ingest_streams_in_chunks(members, db, VOTES_COLUMN_DEFINITIONS, chunk_rows, chunk_bytes, pipeline,
+                                        load_mode)
 
 
 def ensure_data_directory():
@@ -46,12 +304,35 @@ def list_data_directory():
         logger.info(" - %s", Path(DATA_DIR) / str(f))
 
 
-def download_data():
+def download_data(url: str = DATA_URL, connections=1, part_size=PART_SIZE_32_MIB):
     ensure_data_directory()
-    download_and_extract(DATA_URL)
+    download_and_extract(url, connections, part_size)
     list_data_directory()
     logger.info("All done!")
 
 
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fetch the exercise data, untarring it while it downloads.")
+    parser.add_argument('--url', default=DATA_URL, help="the tar archive to fetch (default: the exercise data)")
+    parser.add_argument('--connections', type=int, default=1,
+                        help="fetch the archive as consecutive ranges over this many connections (default: 1)")
+    parser.add_argument('--part-size', type=int, default=PART_SIZE_32_MIB,
+                        help=f"bytes per range fetched in parallel (default: {PART_SIZE_32_MIB})")
+    parser.add_argument('--ingest', action='store_true',
+                        help="stream the JSONL members into the chunked ingest instead of extracting them")
+    parser.add_argument('--db-path', default='warehouse.db', help="database --ingest loads into (default: warehouse.db)")
+    parser.add_argument('--chunk-bytes', type=int, default=MEMBER_CHUNK_BYTES,
+                        help=f"approximate bytes per ingested chunk with --ingest (default: {MEMBER_CHUNK_BYTES})")
+    args = parser.parse_args(sys.argv[1:] if argv is None else argv)
+
+    if args.ingest:
+        from equalexperts_dataeng_exercise.db import BlogAnalysisDB
+        with BlogAnalysisDB(args.db_path) as db:
+            download_and_ingest(args.url, db, args.connections, args.part_size, chunk_bytes=args.chunk_bytes)
+        logger.info("All done!")
+    else:
+        download_data(args.url, args.connections, args.part_size)
+
+
 if __name__ == "__main__":
-    download_data()
+    main()
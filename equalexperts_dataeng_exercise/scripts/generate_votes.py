@@ -0,0 +1,167 @@
+"""
+Generates synthetic vote JSONL files in the schema of uncommitted/votes.jsonl, with
+configurable shares of the record kinds found in tests/test-resources:
+
+- duplicates: an earlier Id sent again, half as an exact copy and half with a later CreationDate
+- invalid records: an Id, CreationDate or PostId that does not parse
+- late-arriving records: a CreationDate 1 to 365 days before its neighbours in the file
+- upserts: a second file correcting the VoteTypeId of existing Ids
+
+The rows are produced by DuckDB from range(), so 100M rows are written at disk speed and
+the same seed always gives the same files.
+
+    python -m equalexperts_dataeng_exercise.scripts.generate_votes uncommitted/synthetic --rows 10000000
+"""
+import os
+import argparse
+import logging
+
+import duckdb
+
+JSON_DATE_FORMAT = '%Y-%m-%dT%H:%M:%S.000'
+
+
+def _uniform_sql(index_column, seed, stream):
+    # A reproducible uniform draw in [0, 1) per row and per decision
+    return f"((hash({index_column}, {seed}, {stream}) % 1000000) / 1000000.0)"
+
+
+def _creation_date_sql(index_column, rows, start_date, days):
+    """
+    Spreads the rows over the period in file order, with a quarterly swing in the daily
+    volume (x + 0.5 * sin(2 pi k x) / (2 pi k) is increasing) so that some weeks are outliers.
+    """
+    cycles = max(1, days // 91)
+    position = f"(({index_column} + 0.5) / {rows})"
+    warped = f"({position} + 0.5 * sin(2 * pi() * {cycles} * {position}) / (2 * pi() * {cycles}))"
+    return f"(TIMESTAMP '{start_date}' + to_seconds(CAST({warped} * {days} * 86400 AS BIGINT)))"
+
+
+def _votes_sql(rows, duplicate_ratio, invalid_ratio, late_ratio, seed, start_date, days):
+    kind = _uniform_sql('i', seed, 1)
+    duplicate_limit = duplicate_ratio
+    invalid_limit = duplicate_limit + invalid_ratio
+    late_limit = invalid_limit + late_ratio
+    return f"""
+        WITH drawn AS (
+            SELECT i,
+                CASE
+                    WHEN i > 0 AND {kind} < {duplicate_limit} THEN 'duplicate'
+                    WHEN {kind} < {invalid_limit} THEN 'invalid'
+                    WHEN {kind} < {late_limit} THEN 'late'
+                    ELSE 'valid'
+                END AS kind,
+                CAST(hash(i, {seed}, 2) % greatest(i, 1) AS BIGINT) AS original_index,
+                CAST(hash(i, {seed}, 3) % 3 AS INTEGER) AS invalid_column,
+                CAST(1 + hash(i, {seed}, 4) % 365 AS INTEGER) AS days_late,
+                CAST(1 + hash(i, {seed}, 5) % 100000 AS BIGINT) AS PostId,
+                CAST(1 + hash(i, {seed}, 6) % 16 AS INTEGER) AS VoteTypeId,
+                CAST(1 + hash(i, {seed}, 7) % 50000 AS BIGINT) AS UserId
+            FROM range({rows}) t(i)
+        ),
+        dated AS (
+            SELECT *,
+                CASE kind
+                    WHEN 'duplicate' THEN {_creation_date_sql('original_index', rows, start_date, days)}
+                        + to_seconds(CAST(hash(i, {seed}, 8) % 2 AS BIGINT) * 3600)
+                    WHEN 'late' THEN {_creation_date_sql('i', rows, start_date, days)} - to_days(days_late)
+                    ELSE {_creation_date_sql('i', rows, start_date, days)}
+                END AS creation_timestamp
+            FROM drawn
+        )
+        SELECT
+            CASE
+                WHEN kind = 'invalid' AND invalid_column = 0 THEN 'INVALID_NUM'
+                WHEN kind = 'duplicate' THEN CAST(original_index + 1 AS VARCHAR)
+                ELSE CAST(i + 1 AS VARCHAR)
+            END AS Id,
+            CASE WHEN kind = 'invalid' AND invalid_column = 2 THEN 'INVALID_NUM' ELSE CAST(PostId AS VARCHAR) END AS PostId,
+            CAST(VoteTypeId AS VARCHAR) AS VoteTypeId,
+            CASE WHEN kind = 'invalid' AND invalid_column = 1 THEN 'INVALID_DATE'
+                ELSE strftime(creation_timestamp, '{JSON_DATE_FORMAT}')
+            END AS CreationDate,
+            CASE WHEN VoteTypeId IN (5, 8) THEN CAST(UserId AS VARCHAR) END AS UserId,
+            CASE WHEN VoteTypeId IN (8, 9) THEN CAST(50 * (1 + hash(i, {seed}, 9) % 10) AS VARCHAR) END AS BountyAmount
+        FROM dated
+    """
+
+
+def _upserts_sql(rows, upsert_ratio, seed, start_date, days):
+    upsert_rows = int(rows * upsert_ratio)
+    return f"""
+        SELECT
+            CAST(original_index + 1 AS VARCHAR) AS Id,
+            CAST(1 + hash(original_index, {seed}, 5) % 100000 AS VARCHAR) AS PostId,
+            CAST(1 + hash(i, {seed}, 10) % 16 AS VARCHAR) AS VoteTypeId,
+            strftime({_creation_date_sql('original_index', rows, start_date, days)}, '{JSON_DATE_FORMAT}') AS CreationDate,
+            NULL::VARCHAR AS UserId,
+            NULL::VARCHAR AS BountyAmount
+        FROM (
+            SELECT i, CAST(hash(i, {seed}, 11) % {rows} AS BIGINT) AS original_index
+            FROM range({upsert_rows}) t(i)
+        ) corrections
+    """
+
+
+def generate_votes(output_dir, rows, duplicate_ratio=0.05, invalid_ratio=0.01, late_ratio=0.02,
+                   upsert_ratio=0.01, seed=42, start_date='2019-01-01', days=1461):
+    """
+    Writes votes.jsonl and, when upsert_ratio is set, votes-upserts.jsonl to output_dir.
+
+    Args:
+        output_dir (str): The directory to write the files to.
+        rows (int): The number of lines in votes.jsonl.
+        duplicate_ratio (float): The share of lines re-sending an earlier Id.
+        invalid_ratio (float): The share of lines with an unparseable Id, CreationDate or PostId.
+        late_ratio (float): The share of lines dated 1 to 365 days before their neighbours.
+        upsert_ratio (float): The size of votes-upserts.jsonl relative to votes.jsonl.
+        seed (int): The seed of the generator.
+        start_date (str): The first CreationDate.
+        days (int): The number of days the CreationDates span.
+
+    Returns:
+        dict: The generated file paths.
+    """
+    if duplicate_ratio + invalid_ratio + late_ratio > 1:
+        raise ValueError("The duplicate, invalid and late ratios cannot add up to more than 1.")
+
+    os.makedirs(output_dir, exist_ok=True)
+    files = {'votes': os.path.join(output_dir, 'votes.jsonl')}
+    queries = {'votes': _votes_sql(rows, duplicate_ratio, invalid_ratio, late_ratio, seed, start_date, days)}
+    if upsert_ratio:
+        files['upserts'] = os.path.join(output_dir, 'votes-upserts.jsonl')
+        queries['upserts'] = _upserts_sql(rows, upsert_ratio, seed, start_date, days)
+
+    conn = duckdb.connect(':memory:')
+    try:
+        for name, query in queries.items():
+            escaped_path = files[name].replace("'", "''")
+            conn.execute(f"COPY ({query}) TO '{escaped_path}' (FORMAT JSON);")
+            logging.info(f"Generated {files[name]}.")
+    finally:
+        conn.close()
+    return files
+
+
+def add_generator_arguments(parser):
+    parser.add_argument('--duplicate-ratio', type=float, default=0.05, help="share of lines re-sending an earlier Id")
+    parser.add_argument('--invalid-ratio', type=float, default=0.01, help="share of lines with an invalid value")
+    parser.add_argument('--late-ratio', type=float, default=0.02, help="share of late-arriving lines")
+    parser.add_argument('--upsert-ratio', type=float, default=0.01, help="size of the upsert file relative to votes.jsonl")
+    parser.add_argument('--seed', type=int, default=42, help="seed of the generator")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate synthetic vote JSONL files.")
+    parser.add_argument('output_dir', help="directory to write votes.jsonl and votes-upserts.jsonl to")
+    parser.add_argument('--rows', type=int, default=1_000_000, help="number of lines in votes.jsonl")
+    add_generator_arguments(parser)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    generate_votes(args.output_dir, args.rows, args.duplicate_ratio, args.invalid_ratio,
+                   args.late_ratio, args.upsert_ratio, args.seed)
+
+
+if __name__ == "__main__":
+    main()
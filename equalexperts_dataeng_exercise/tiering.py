@@ -0,0 +1,67 @@
+import sys
+import logging
+import argparse
+from equalexperts_dataeng_exercise.db import BlogAnalysisDB
+from equalexperts_dataeng_exercise.config import add_resource_arguments, resource_settings_from_args
+
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+
+def archive_cold_votes(db, horizon_weeks, profile_path=None):
+    """
+    Moves the votes older than the horizon from the hot votes table to the compressed
+    Parquet archive. Ad hoc queries over the full history read blog_analysis.votes_history,
+    and the outlier weeks keep counting the archived weeks.
+
+    Args:
+        db (BlogAnalysisDB): The database holding blog_analysis.votes.
+        horizon_weeks (int): The number of recent weeks to keep in the hot table.
+        profile_path (str): Profile the step and write the report as JSON to this path.
+
+    Returns:
+        int: The number of votes archived.
+    """
+    profiler = db.profiler
+    owns_profiler = profile_path is not None and profiler is None
+    if owns_profiler:
+        profiler = db.enable_profiling()
+    try:
+        with db.profile_step('archive', "SELECT COUNT(*) FROM blog_analysis.votes", "SELECT COUNT(*) FROM blog_analysis.votes"):
+            archived_count = db.archive_votes(horizon_weeks)
+
+        if profile_path:
+            profiler.write(profile_path)
+        return archived_count
+
+    except Exception as e:
+        logging.error(f"An error occurred during the archiving process: {e}")
+        raise
+    finally:
+        if owns_profiler:
+            db.disable_profiling()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Move the votes older than a horizon to the compressed Parquet archive.")
+    parser.add_argument('--horizon-weeks', type=int, default=52,
+                        help="number of recent weeks kept in the hot votes table (default: 52)")
+    parser.add_argument('--archive-path',
+                        help="directory of the archived Parquet partitions (default: warehouse-archive)")
+    parser.add_argument('--profile', metavar='PATH',
+                        help="write a JSON report of the time, row counts and query profile of the step to PATH")
+    add_resource_arguments(parser)
+    args = parser.parse_args(sys.argv[1:] if argv is None else argv)
+
+    # Initialize db connection within a context manager to ensure it's properly closed
+    try:
+        with BlogAnalysisDB(settings=resource_settings_from_args(args), config_path=args.config,
+                            archive_path=args.archive_path) as db:
+            archive_cold_votes(db, args.horizon_weeks, profile_path=args.profile)
+    except Exception as e:
+        logging.error(f"An error occurred: {e}")
+
+
+if __name__ == "__main__":
+    main()
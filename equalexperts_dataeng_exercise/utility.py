@@ -2,126 +2,20 @@ import os
 import logging
 # from db import BlogAnalysisDB  # Importing db. class
 from equalexperts_dataeng_exercise.db import BlogAnalysisDB
+from equalexperts_dataeng_exercise import ingest
 
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
-debug = True
 
 
 def ingest_data(file_path, db):
     """
-    Orchestrates the data ingestion process from a JSONL file to the database.
+    Orchestrates the data ingestion process from a JSONL file to the database, with the
+    CTAS rebuild of ingest.ingest_data. A file the ingest manifest shows was already
+    loaded unchanged is skipped.
     """
-    try:
-        # Validate file existence
-        if not os.path.exists(file_path):
-            error_message = f"File {file_path} does not exist."
-            logging.error(error_message)
-            raise FileNotFoundError(error_message)
-
-       
-        logging.info("Setting up staging and operational schemas.")
-        table_definitions = {
-            "staging_votes": """
-                Id VARCHAR,
-                PostId VARCHAR,
-                VoteTypeId VARCHAR,
-                CreationDate VARCHAR,
-                UserId VARCHAR,
-                BountyAmount VARCHAR,
-                DW_INSERT TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            """,
-            "votes": """
-                Id INTEGER,
-                PostId INTEGER,
-                VoteTypeId INTEGER,
-                CreationDate DATETIME,
-                UserId INTEGER,
-                BountyAmount NUMERIC(18,2),
-                DW_INSERT TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            """
-        }
-
-        db.setup_schema("blog_analysis", {"votes": table_definitions["votes"]})
-
-        column_definitions = {
-            'Id': 'VARCHAR',
-            'PostId': 'VARCHAR',
-            'VoteTypeId': 'VARCHAR',
-            'CreationDate': 'VARCHAR',
-            'UserId': 'VARCHAR',
-            'BountyAmount': 'VARCHAR'
-        }
-
-        db.load_json_to_staging_table(file_path=file_path
-                                  , column_definitions=column_definitions)
-        
-        # Mimmic archive file movement
-        db.fake_file_archive(file_path)
-
-        # Cleansing data and setting status code for operational loading
-        db.cleanse_and_deduplicate_staging_table()
-
-        table_mappings = {
-            "Id": "Id",
-            "PostId": "PostId",
-            "VoteTypeId": "VoteTypeId",
-            "CreationDate": "CreationDate",
-            "UserId": "UserId",
-            "BountyAmount": "BountyAmount",
-            "DW_INSERT": "CURRENT_TIMESTAMP",
-        }
-
-        # Move data to operational
-        # db.move_data_to_operational(table_mappings)
-        db.move_data_to_operational_with_ctas(column_definitions)
-
-        # TO BE REMOVED
-        if debug:
-            
-            print(1)
-
-            
-            # Fetch and print the total record count from stage table
-            total_records = db.conn.execute("SELECT COUNT(*) FROM blog_analysis.staging_votes_load;").fetchone()[0]
-            print(f"Total records in stage load: {total_records}")
-            total_records = db.conn.execute("SELECT COUNT(*) FROM blog_analysis.staging_votes;").fetchone()[0]
-            print(f"Total records in stage: {total_records}")
-
-            # Fetch and print the total record count from votes table
-            total_records_votes = db.conn.execute("SELECT COUNT(*) FROM blog_analysis.votes;").fetchone()[0]
-            print(f"Total records in votes: {total_records_votes}")
-
-            numb_of_record = 50
-            # # Fetch and print the first n rows from stage table
-            # first_n_staging = db.conn.execute(f"SELECT * FROM blog_analysis.staging_votes_load ORDER BY staging_status LIMIT {numb_of_record};").fetchall()
-            # print("records from staging_votes_load:")
-            # for record in first_n_staging:
-            #     print(record)
-
-            # Fetch and print the first n rows from votes table
-            first_n_staging = db.conn.execute(f"SELECT * FROM blog_analysis.staging_votes LIMIT {numb_of_record};").fetchall()
-            print("records from staging_votes:")
-            for record in first_n_staging:
-                print(record)
-
-            # # Fetch and print the first n rows from votes table
-            # first_n_staging = db.conn.execute(f"SELECT * FROM blog_analysis.votes LIMIT {numb_of_record};").fetchall()
-            # print("records from votes:")
-            # for record in first_n_staging:
-            #     print(record)
-
-            # for table in ['staging_votes_load','staging_votes']:
-            #     db.get_table_schema_info(f'{table}')
-
-            # db.conn.execute(f"DROP TABLE blog_analysis.votes;").fetchall()
-
-
-    except Exception as e:
-        logging.error(f"An error occurred during the ingestion process: {e}")
-        # If you want to propagate the exception up:
-        raise
+    return ingest.ingest_data(file_path, db, load_mode='rebuild')
 
 
 def main():
@@ -167,53 +61,60 @@ def cleanse_and_deduplicate_row(id, post_id, vote_type_id, creation_date, user_i
     # Construct the error description
     error_description = '; '.join(errors) if errors else None
 
-    return status, error_description
-
-
+    return {'status': status, 'error_description': error_description}
 
-# register it 
-import duckdb
 
-# Create a connection to DuckDB
-con = duckdb.connect()
+# Python's int() accepts surrounding whitespace and a sign
+INTEGER_PATTERN = r'^\s*[+-]?[0-9]+\s*$'
+# The '%Y-%m-%dT%H:%M:%S.%f' format, where %f takes one to six digits
+CREATION_DATE_PATTERN = r'^[0-9]{4}-[0-9]{1,2}-[0-9]{1,2}T[0-9]{1,2}:[0-9]{1,2}:[0-9]{1,2}\.[0-9]{1,6}$'
 
-# Register the UDF
-con.create_function("cleanse_and_deduplicate_row", cleanse_and_deduplicate_row,
-                    parameters=["VARCHAR", "VARCHAR", "VARCHAR", "VARCHAR", "VARCHAR", "VARCHAR", "BIGINT"],
-                    return_type="STRUCT<status VARCHAR, error_description VARCHAR>")
 
+def _join_errors(errors, new_errors):
+    """Appends an array of error messages (or nulls) to another with a '; ' separator."""
+    import pyarrow.compute as pc
 
+    joined = pc.binary_join_element_wise(errors, new_errors, '; ')
+    return pc.if_else(pc.is_null(errors), new_errors, pc.if_else(pc.is_null(new_errors), errors, joined))
 
-result = con.execute("""
-SELECT cleanse_and_deduplicate_row(Id, PostId, VoteTypeId, CreationDate, UserId, BountyAmount, rn).* 
-FROM (SELECT *, ROW_NUMBER() OVER (PARTITION BY Id ORDER BY CreationDate DESC) AS rn FROM staging_votes_load) t
-""").fetchall()
 
-# Print or process the result
-print(result)
+def _invalid_creation_dates(creation_date):
+    """Flags the non-empty creation dates that datetime.strptime would reject."""
+    import pyarrow as pa
+    import pyarrow.compute as pc
 
+    well_formed = pc.fill_null(pc.match_substring_regex(creation_date, CREATION_DATE_PATTERN), False)
+    parts = pc.split_pattern_regex(pc.if_else(well_formed, creation_date, '0-0-0T0:0:0.0'), r'[-T:.]')
+    year, month, day, hour, minute, second = [pc.cast(pc.list_element(parts, i), pa.int64()) for i in range(6)]
 
+    # Days in each month, with February adjusted for leap years
+    is_leap = pc.and_(pc.equal(pc.bit_wise_and(year, 3), 0),
+                      pc.or_(pc.not_equal(pc.remainder(year, 100), 0), pc.equal(pc.remainder(year, 400), 0)))
+    month_lengths = pa.array([0, 31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31], pa.int64())
+    days_in_month = pc.add(pc.take(month_lengths, pc.if_else(pc.less_equal(month, 12), month, 0)),
+                           pc.cast(pc.and_(is_leap, pc.equal(month, 2)), pa.int64()))
 
+    valid = pc.and_(well_formed, pc.and_(
+        pc.and_(pc.greater_equal(year, 1), pc.greater_equal(day, 1)),
+        pc.and_(pc.less_equal(day, days_in_month),
+                pc.and_(pc.less(hour, 24), pc.and_(pc.less(minute, 60), pc.less(second, 60))))))
+    is_empty = pc.or_kleene(pc.is_null(creation_date), pc.equal(creation_date, ''))
+    return pc.and_not(pc.invert(valid), is_empty)
 
-# db.py
 
-import duckdb
-from datetime import datetime
-
-class BlogAnalysisDB:
-    def __init__(self, db_path=':memory:'):
-        self.conn = duckdb.connect(db_path)
-        self.register_udfs()
-
-    def register_udfs(self):
-        # Define the UDF
-        def cleanse_and_deduplicate_row(id, post_id, vote_type_id, creation_date, user_id, bounty_amount, row_number):
-            # UDF logic as previously defined
-            pass
+def cleanse_and_deduplicate_batch(id, post_id, vote_type_id, creation_date, user_id, bounty_amount, row_number):
+    """
+    Vectorized version of cleanse_and_deduplicate_row: applies the same rules to whole
+    Arrow arrays at once, so DuckDB calls it once per vector instead of once per row.
+    """
+    import pyarrow as pa
+    import pyarrow.compute as pc
 
-        # Register the UDF with DuckDB
-        self.conn.create_function("cleanse_and_deduplicate_row", cleanse_and_deduplicate_row,
-                                  parameters=["VARCHAR", "VARCHAR", "VARCHAR", "VARCHAR", "VARCHAR", "VARCHAR", "BIGINT"],
-                                  return_type="STRUCT<status VARCHAR, error_description VARCHAR>")
+    no_errors = pa.nulls(len(id), pa.string())
+    invalid_id = pc.and_not(pc.is_valid(id), pc.fill_null(pc.match_substring_regex(id, INTEGER_PATTERN), True))
+    errors = _join_errors(no_errors, pc.if_else(pc.fill_null(invalid_id, False), 'Invalid Id', no_errors))
+    errors = _join_errors(errors, pc.if_else(_invalid_creation_dates(creation_date), 'Invalid CreationDate', no_errors))
+    errors = _join_errors(errors, pc.if_else(pc.greater(row_number, 1), 'Duplicate record', no_errors))
 
-    # Other methods...
+    status = pc.if_else(pc.is_null(errors), 'READYTOLOAD', 'FAILED')
+    return pc.make_struct(status, errors, field_names=['status', 'error_description'])
@@ -0,0 +1,55 @@
+import sys
+from pathlib import Path
+
+# This adds the project directory to the Python path to resolve the `db` import
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+import duckdb
+import pytest
+from equalexperts_dataeng_exercise.scripts.generate_votes import generate_votes
+from equalexperts_dataeng_exercise.scripts.benchmark_ingest import run_benchmark
+
+# Command to test the benchmark scripts from project terminal => pytest tests/benchmark_test.py
+
+ROWS = 20000
+
+
+def count_query(file_path):
+    return f"""
+        SELECT
+            COUNT(*) AS lines,
+            COUNT(DISTINCT Id) AS ids,
+            COUNT(*) FILTER (WHERE Id = 'INVALID_NUM' OR PostId = 'INVALID_NUM' OR CreationDate = 'INVALID_DATE') AS invalid
+        FROM read_json('{file_path}', format='newline_delimited',
+            columns={{'Id': 'VARCHAR', 'PostId': 'VARCHAR', 'VoteTypeId': 'VARCHAR',
+                      'CreationDate': 'VARCHAR', 'UserId': 'VARCHAR', 'BountyAmount': 'VARCHAR'}})
+    """
+
+
+def test_generated_files_follow_the_ratios(tmp_path):
+    files = generate_votes(str(tmp_path), ROWS, duplicate_ratio=0.1, invalid_ratio=0.05, late_ratio=0.05, upsert_ratio=0.02)
+    conn = duckdb.connect(':memory:')
+    lines, ids, invalid = conn.execute(count_query(files['votes'])).fetchone()
+    upsert_lines = conn.execute(count_query(files['upserts'])).fetchone()[0]
+    conn.close()
+
+    assert lines == ROWS
+    assert ids == pytest.approx(ROWS * 0.9, rel=0.05), "About 10% of the lines should re-send an earlier Id"
+    assert invalid == pytest.approx(ROWS * 0.05, rel=0.1)
+    assert upsert_lines == ROWS * 0.02
+
+
+def test_generator_is_reproducible(tmp_path):
+    first = generate_votes(str(tmp_path / 'first'), 1000, seed=7)
+    second = generate_votes(str(tmp_path / 'second'), 1000, seed=7)
+    assert Path(first['votes']).read_bytes() == Path(second['votes']).read_bytes()
+
+
+def test_run_benchmark_times_every_stage(tmp_path):
+    record = run_benchmark(2000, str(tmp_path), {'upsert_ratio': 0.05})
+    stages = [stage['stage'] for stage in record['stages']]
+    assert stages == ['ingest.manifest', 'ingest.load', 'ingest.cleanse', 'ingest.merge',
+                      'upsert.manifest', 'upsert.load', 'upsert.cleanse', 'upsert.merge',
+                      'outliers.weekly_counts', 'outliers.outlier_weeks']
+    assert record['stages'][1]['rows'] == 2000
+    assert all(stage['seconds'] >= 0 for stage in record['stages'])
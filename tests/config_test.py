@@ -0,0 +1,69 @@
+import os
+import sys
+from pathlib import Path
+
+# This adds the project directory to the Python path to resolve the `db` import
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+import pytest
+from equalexperts_dataeng_exercise.db import BlogAnalysisDB
+from equalexperts_dataeng_exercise.config import load_resource_settings, resource_settings_from_args, scratch_directory
+from equalexperts_dataeng_exercise.ingest import parse_args
+
+# Command to test config.py from project terminal => pytest tests/config_test.py
+
+
+@pytest.fixture
+def config_file(tmp_path):
+    config_path = tmp_path / 'duckdb.toml'
+    config_path.write_text('[duckdb]\nthreads = 3\nmemory_limit = "3GB"\npreserve_insertion_order = true\n')
+    return str(config_path)
+
+
+def test_arguments_override_environment_override_config_file(config_file):
+    environ = {'BLOG_ANALYSIS_CONFIG': config_file, 'BLOG_ANALYSIS_MEMORY_LIMIT': '2GB',
+               'BLOG_ANALYSIS_PRESERVE_INSERTION_ORDER': 'false'}
+    settings = load_resource_settings({'threads': 1, 'temp_directory': None}, environ=environ)
+    assert settings == {'threads': 1, 'memory_limit': '2GB', 'preserve_insertion_order': False}
+
+
+def test_no_settings_keep_duckdb_defaults():
+    assert load_resource_settings(environ={}) == {}
+
+
+@pytest.mark.parametrize("settings", [{'thread': 2}, {'threads': 'many'}, {'preserve_insertion_order': 'maybe'}])
+def test_invalid_settings_raise_error(settings):
+    with pytest.raises(ValueError):
+        load_resource_settings(settings, environ={})
+
+
+def test_settings_are_applied_to_the_connection(tmp_path):
+    temp_directory = str(tmp_path / 'spill')
+    db = BlogAnalysisDB(db_path=':memory:', settings={
+        'threads': 2, 'memory_limit': '1GB', 'temp_directory': temp_directory,
+        'max_temp_directory_size': '2GB', 'preserve_insertion_order': False})
+    try:
+        current = dict(db.conn.execute("""
+            SELECT name, value FROM duckdb_settings()
+            WHERE name IN ('threads', 'temp_directory', 'preserve_insertion_order')
+        """).fetchall())
+        assert current == {'threads': '2', 'temp_directory': temp_directory, 'preserve_insertion_order': 'false'}
+    finally:
+        db.close()
+
+
+def test_scratch_directory_is_created_or_falls_back_to_the_system_temp_directory(tmp_path):
+    temp_directory = str(tmp_path / 'missing' / 'spill')
+    assert scratch_directory({'temp_directory': temp_directory}) == temp_directory
+    assert os.path.isdir(temp_directory)
+    assert scratch_directory({}) is None
+
+    # A directory below a file cannot be created
+    (tmp_path / 'file').write_text('')
+    assert scratch_directory({'temp_directory': str(tmp_path / 'file' / 'spill')}) is None
+
+
+def test_cli_resource_arguments(config_file):
+    args = parse_args(['votes.jsonl', '--config', config_file, '--threads', '4', '--preserve-insertion-order', 'false'])
+    settings = load_resource_settings(resource_settings_from_args(args), args.config, environ={})
+    assert settings == {'threads': 4, 'memory_limit': '3GB', 'preserve_insertion_order': False}
@@ -4,8 +4,9 @@ from pathlib import Path
 # This adds the project directory to the Python path to resolve the `db` import
 sys.path.append(str(Path(__file__).resolve().parents[1]))
 
+import duckdb
 import pytest
-from equalexperts_dataeng_exercise.db import BlogAnalysisDB
+from equalexperts_dataeng_exercise.db import BlogAnalysisDB, _custom_week_sql
 
 # Command to test db.py from project terminal => pytest tests/db_test.py
 
@@ -56,3 +57,126 @@ def test_schema_setup(db):
         """).fetchall()
         assert result[0][0] == 1, f"Table {table} should exist in schema blog_analysis"
 
+
+
+def test_with_block_reuses_the_open_connection():
+    db_instance = BlogAnalysisDB(db_path=':memory:')
+    conn = db_instance.conn
+    with db_instance as entered:
+        assert entered.conn is conn, "Entering the with block should not open a second connection"
+    assert db_instance.conn is None
+
+    # A closed instance reconnects explicitly when entered again
+    with db_instance:
+        assert db_instance.test_connection() is True
+    assert db_instance.conn is None
+
+
+def test_reader_pool_reuses_a_bounded_number_of_cursors():
+    with BlogAnalysisDB(db_path=':memory:', reader_pool_size=2) as db_instance:
+        with db_instance.reader() as first, db_instance.reader() as second:
+            assert first is not second
+            with pytest.raises(TimeoutError):
+                with db_instance.reader(timeout=0.01):
+                    pass
+        with db_instance.reader() as reused:
+            assert reused in (first, second), "A returned cursor should be reused"
+
+
+def test_readers_run_in_parallel_and_see_committed_data(tmp_path):
+    from concurrent.futures import ThreadPoolExecutor
+
+    db_path = str(tmp_path / 'warehouse.db')
+    with BlogAnalysisDB(db_path=db_path) as writer:
+        writer.setup_schema("votes", VOTES_DEFINITIONS)
+        writer.conn.execute("INSERT INTO blog_analysis.votes (Id, CreationDate) SELECT range, TIMESTAMP '2022-01-01' FROM range(1000);")
+
+        def count_votes(_):
+            with writer.reader() as cursor:
+                return cursor.execute("SELECT COUNT(*) FROM blog_analysis.votes").fetchone()[0]
+
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            assert list(pool.map(count_votes, range(8))) == [1000] * 8
+
+    with BlogAnalysisDB(db_path=db_path, read_only=True) as reader_db:
+        with reader_db.reader() as cursor:
+            assert cursor.execute("SELECT COUNT(*) FROM blog_analysis.votes").fetchone()[0] == 1000
+        with pytest.raises(Exception):
+            reader_db.conn.execute("DELETE FROM blog_analysis.votes;")
+
+
+def test_weekly_counts_from_the_calendar_match_the_custom_weeks(db):
+    # A vote every day for ten years covers every variant of the week 0 rule at the new year
+    db.conn.execute("""
+        INSERT INTO blog_analysis.votes (Id, CreationDate)
+        SELECT row_number() OVER (), day + INTERVAL 13 HOUR
+        FROM range(TIMESTAMP '2015-01-01', TIMESTAMP '2025-01-01', INTERVAL 1 DAY) days(day);
+    """)
+    db.rebuild_weekly_vote_counts()
+
+    year_sql, week_sql = _custom_week_sql("CreationDate")
+    expected = db.conn.execute(f"""
+        SELECT {year_sql} AS Year, {week_sql} AS WeekNumber, COUNT(*) AS VoteCount
+        FROM blog_analysis.votes
+        GROUP BY ALL
+        ORDER BY ALL
+    """).fetchall()
+    assert db.conn.execute("SELECT * FROM blog_analysis.weekly_vote_counts ORDER BY ALL").fetchall() == expected
+    assert db.conn.execute("SELECT COUNT(*), COUNT(DISTINCT Date) FROM blog_analysis.calendar").fetchone() == (3653, 3653)
+
+
+@pytest.mark.parametrize('dedup_bucket_rows', [None, 1, 3])
+def test_bucketed_dedup_keeps_the_latest_record_of_every_id(db, dedup_bucket_rows):
+    db.conn.execute("""
+        CREATE OR REPLACE TABLE blog_analysis.staging_votes_load AS
+        SELECT * FROM (VALUES
+            ('1', '10', '2', '2022-01-01T00:00:00.000', NULL, NULL),
+            ('1', '10', '2', '2022-01-03T00:00:00.000', NULL, NULL),
+            ('1', 'x', '2', '2022-01-02T00:00:00.000', NULL, NULL),
+            ('2', '20', '2', '2022-01-05T00:00:00.000', NULL, NULL),
+            ('3', '30', '2', NULL, NULL, NULL),
+            ('3', '30', '2', '2022-01-04T00:00:00.000', NULL, NULL),
+            ('4', '40', '2', '2022-01-06T00:00:00.000', NULL, NULL),
+            ('4', 'x', '2', '2022-01-07T00:00:00.000', NULL, NULL),
+            (NULL, '50', '2', '2022-01-08T00:00:00.000', NULL, NULL),
+            (NULL, '50', '2', '2022-01-09T00:00:00.000', NULL, NULL)
+        ) AS load(Id, PostId, VoteTypeId, CreationDate, UserId, BountyAmount)
+    """)
+    db.cleanse_and_deduplicate_staging_table(dedup_bucket_rows=dedup_bucket_rows)
+
+    statuses = db.conn.execute("""
+        SELECT Id, PostId, CreationDate::VARCHAR, staging_status, error_description
+        FROM blog_analysis.staging_votes
+        ORDER BY ALL
+    """).fetchall()
+    assert statuses == [
+        (1, 10, '2022-01-01 00:00:00', 'DUPLICATE', 'Duplicate record'),
+        (1, 10, '2022-01-03 00:00:00', 'READYTOLOAD', None),
+        (1, None, '2022-01-02 00:00:00', 'FAILED', 'Invalid PostId; Duplicate record'),
+        (2, 20, '2022-01-05 00:00:00', 'READYTOLOAD', None),
+        (3, 30, '2022-01-04 00:00:00', 'READYTOLOAD', None),
+        (3, 30, None, 'FAILED', 'Invalid CreationDate; Duplicate record'),
+        # The latest record of Id 4 is invalid, so none of it is loaded
+        (4, 40, '2022-01-06 00:00:00', 'DUPLICATE', 'Duplicate record'),
+        (4, None, '2022-01-07 00:00:00', 'FAILED', 'Invalid PostId'),
+        (None, 50, '2022-01-08 00:00:00', 'FAILED', 'Invalid Id; Duplicate record'),
+        (None, 50, '2022-01-09 00:00:00', 'FAILED', 'Invalid Id'),
+    ]
+
+
+def test_dedup_bucket_rows_must_be_positive():
+    with pytest.raises(ValueError):
+        BlogAnalysisDB(db_path=':memory:', dedup_bucket_rows=0)
+
+
+def test_register_udfs_without_pyarrow_names_the_extra(db, monkeypatch):
+    # A None entry in sys.modules makes the import fail as if pyarrow were not installed
+    monkeypatch.setitem(sys.modules, 'pyarrow', None)
+    with pytest.raises(ImportError, match=r"\[arrow\]"):
+        db.register_udfs()
+
+
+def test_failed_connection_raises(tmp_path):
+    # A read-only connection cannot create the missing file
+    with pytest.raises(duckdb.IOException):
+        BlogAnalysisDB(db_path=str(tmp_path / 'missing.db'), read_only=True)
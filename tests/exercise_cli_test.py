@@ -0,0 +1,62 @@
+import os
+import sys
+import shutil
+import subprocess
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+import pytest
+from typer.testing import CliRunner
+from equalexperts_dataeng_exercise.db import BlogAnalysisDB
+from equalexperts_dataeng_exercise.scripts import exercise
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    # The commands read uncommitted/votes.jsonl and write warehouse.db in the working directory
+    os.makedirs(tmp_path / 'uncommitted')
+    shutil.copy(os.path.join(os.path.dirname(__file__), '../uncommitted/samples-votes.jsonl'),
+                tmp_path / 'uncommitted' / 'votes.jsonl')
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+def test_pipeline_ingests_and_detects_outliers_in_process(workdir):
+    result = CliRunner().invoke(exercise.app, ['pipeline'])
+    assert result.exit_code == 0, result.output
+
+    with BlogAnalysisDB(str(workdir / 'warehouse.db'), read_only=True) as db:
+        assert db.conn.execute("SELECT COUNT(*) FROM blog_analysis.votes").fetchone()[0] == 16
+        assert db.conn.execute("SELECT COUNT(*) FROM blog_analysis.outlier_weeks").fetchone()[0] > 0
+
+
+def test_separate_commands_match_pipeline(workdir):
+    runner = CliRunner()
+    assert runner.invoke(exercise.app, ['ingest-data']).exit_code == 0
+    assert runner.invoke(exercise.app, ['detect-outliers']).exit_code == 0
+    with BlogAnalysisDB(str(workdir / 'warehouse.db'), read_only=True) as db:
+        separate = db.conn.execute("SELECT * FROM blog_analysis.outlier_weeks ORDER BY ALL").fetchall()
+    os.remove(workdir / 'warehouse.db')
+
+    assert runner.invoke(exercise.app, ['pipeline']).exit_code == 0
+    with BlogAnalysisDB(str(workdir / 'warehouse.db'), read_only=True) as db:
+        assert db.conn.execute("SELECT * FROM blog_analysis.outlier_weeks ORDER BY ALL").fetchall() == separate
+
+
+def test_failed_command_exits_non_zero(workdir):
+    os.remove(workdir / 'uncommitted' / 'votes.jsonl')
+    result = CliRunner().invoke(exercise.app, ['ingest-data'])
+    assert result.exit_code == 1
+
+
+def test_run_query_without_warehouse_exits_non_zero(workdir):
+    result = CliRunner().invoke(exercise.app, ['run-query', 'SELECT 1'])
+    assert result.exit_code == 1
+    assert not isinstance(result.exception, AttributeError)
+
+
+def test_help_does_not_import_duckdb():
+    code = ("import sys; from equalexperts_dataeng_exercise.scripts import exercise; "
+            "assert 'duckdb' not in sys.modules, 'duckdb was imported'")
+    subprocess.run([sys.executable, '-c', code], check=True, cwd=str(Path(__file__).resolve().parents[1]))
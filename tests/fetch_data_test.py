@@ -0,0 +1,197 @@
+import os
+import sys
+import tarfile
+import threading
+from pathlib import Path
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+import pytest
+from equalexperts_dataeng_exercise.db import BlogAnalysisDB
+from equalexperts_dataeng_exercise.ingest import ingest_data
+from equalexperts_dataeng_exercise.inputs import MEMBER_CHUNK_BYTES
+from equalexperts_dataeng_exercise.scripts import fetch_data
+
+FILE_NAMES = ['sample-votes-dups.jsonl', 'sample-votes-invalid-datatypes.jsonl', 'samples-votes-upsert-col.jsonl']
+FILE_PATHS = [os.path.join(os.path.dirname(__file__), f'../uncommitted/{file_name}') for file_name in FILE_NAMES]
+
+
+class ArchiveHandler(BaseHTTPRequestHandler):
+    # Set by the server fixture: the served bytes, whether ranges are answered, how many
+    # responses are cut off after drop_after bytes, and the Range header of every GET
+    content = b''
+    accepts_ranges = True
+    drops = 0
+    drop_after = 0
+    ranges = []
+
+    def log_message(self, *args):
+        pass
+
+
+    def _send_headers(self, status, length, first_byte=None):
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/octet-stream')
+        self.send_header('Content-Length', str(length))
+        if self.accepts_ranges:
+            self.send_header('Accept-Ranges', 'bytes')
+        if first_byte is not None:
+            self.send_header('Content-Range', f"bytes {first_byte}-{first_byte + length - 1}/{len(self.content)}")
+        self.end_headers()
+
+
+    def do_HEAD(self):
+        self._send_headers(200, len(self.content))
+
+
+    def do_GET(self):
+        range_header = self.headers.get('Range')
+        type(self).ranges.append(range_header)
+        body = self.content
+        if range_header and self.accepts_ranges:
+            first, last = range_header[len('bytes='):].split('-')
+            first_byte = int(first)
+            body = self.content[first_byte:int(last) + 1 if last else len(self.content)]
+            self._send_headers(206, len(body), first_byte)
+        else:
+            self._send_headers(200, len(body))
+        if type(self).drops > 0 and len(body) > self.drop_after:
+            # Cut the response off, the client sees fewer bytes than the Content-Length
+            type(self).drops -= 1
+            self.wfile.write(body[:self.drop_after])
+            self.close_connection = True
+            return
+        self.wfile.write(body)
+
+
+def write_archive(directory):
+    archive_path = os.path.join(directory, 'votes.tar.gz')
+    with tarfile.open(archive_path, 'w:gz') as archive:
+        for file_path in FILE_PATHS:
+            archive.add(file_path, arcname=f"drop/{os.path.basename(file_path)}")
+    with open(archive_path, 'rb') as archive_file:
+        return archive_file.read()
+
+
+@pytest.fixture
+def server(tmp_path, monkeypatch):
+    # Small reads, so a cut-off response resumes in the middle of the archive
+    monkeypatch.setattr(fetch_data, 'READ_SIZE_64_KIB', 50)
+    ArchiveHandler.content = write_archive(str(tmp_path))
+    ArchiveHandler.accepts_ranges = True
+    ArchiveHandler.drops = 0
+    ArchiveHandler.drop_after = 0
+    ArchiveHandler.ranges = []
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), ArchiveHandler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}/votes.tar.gz"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_download_reads_the_whole_resource(server):
+    with fetch_data.open_download(server) as download:
+        assert download.read() == ArchiveHandler.content
+    assert ArchiveHandler.ranges == [None]
+
+
+def test_dropped_connection_resumes_with_range_request(server):
+    ArchiveHandler.drops = 2
+    ArchiveHandler.drop_after = 100
+    with fetch_data.open_download(server) as download:
+        assert download.read() == ArchiveHandler.content
+    # The length is known from the first response, the resumed ranges end at the last byte
+    last_byte = len(ArchiveHandler.content) - 1
+    assert ArchiveHandler.ranges == [None, f'bytes=100-{last_byte}', f'bytes=200-{last_byte}']
+
+
+def test_dropped_connection_without_range_support_raises(server):
+    ArchiveHandler.accepts_ranges = False
+    ArchiveHandler.drops = 1
+    ArchiveHandler.drop_after = 100
+    with pytest.raises(IOError), fetch_data.open_download(server) as download:
+        download.read()
+
+
+def test_too_many_drops_raise(server):
+    ArchiveHandler.drops = 10
+    ArchiveHandler.drop_after = 0
+    with pytest.raises(IOError), fetch_data.open_download(server) as download:
+        download.read()
+
+
+@pytest.mark.parametrize("drops", [0, 3])
+def test_parallel_ranges_are_read_in_order(server, drops):
+    ArchiveHandler.drops = drops
+    ArchiveHandler.drop_after = 10
+    part_size = 512
+    with fetch_data.open_download(server, connections=3, part_size=part_size) as download:
+        assert download.read() == ArchiveHandler.content
+    part_count = -(-len(ArchiveHandler.content) // part_size)
+    assert len(ArchiveHandler.ranges) == part_count + drops
+    assert f"bytes=0-{part_size - 1}" in ArchiveHandler.ranges
+
+
+def test_parallel_download_falls_back_to_one_connection(server):
+    ArchiveHandler.accepts_ranges = False
+    with fetch_data.open_download(server, connections=3, part_size=512) as download:
+        assert download.read() == ArchiveHandler.content
+    assert ArchiveHandler.ranges == [None]
+
+
+def test_invalid_download_options_raise(server):
+    with pytest.raises(ValueError):
+        fetch_data.open_download(server, connections=0)
+    with pytest.raises(ValueError):
+        fetch_data.open_download(server, connections=2, part_size=0)
+
+
+@pytest.mark.parametrize("connections", [1, 2])
+def test_download_file_resumes_partial_download(server, tmp_path, connections):
+    target_path = str(tmp_path / 'downloaded.tar.gz')
+    with open(f"{target_path}.part", 'wb') as partial:
+        partial.write(ArchiveHandler.content[:300])
+
+    fetch_data.download_file(server, target_path, connections=connections, part_size=512)
+
+    with open(target_path, 'rb') as downloaded:
+        assert downloaded.read() == ArchiveHandler.content
+    assert not os.path.exists(f"{target_path}.part")
+    last_byte = min(300 + 512, len(ArchiveHandler.content)) - 1
+    assert ArchiveHandler.ranges[0] == ('bytes=300-' if connections == 1 else f'bytes=300-{last_byte}')
+
+
+def test_download_and_extract_untars_while_downloading(server, tmp_path, monkeypatch):
+    monkeypatch.setattr(fetch_data, 'DATA_DIR', str(tmp_path / 'data'))
+    fetch_data.ensure_data_directory()
+    fetch_data.download_and_extract(server, connections=2, part_size=512)
+
+    for file_path in FILE_PATHS:
+        with open(file_path, 'rb') as expected, open(tmp_path / 'data' / 'drop' / os.path.basename(file_path), 'rb') as actual:
+            assert actual.read() == expected.read()
+
+
+@pytest.mark.parametrize("options", [{}, {'chunk_rows': 3}, {'connections': 2, 'part_size': 512}])
+def test_download_and_ingest_matches_ingesting_the_files(server, options):
+    ArchiveHandler.drops = 1
+    ArchiveHandler.drop_after = 300
+    expected_db = BlogAnalysisDB(db_path=':memory:')
+    actual_db = BlogAnalysisDB(db_path=':memory:')
+    try:
+        # The members are ingested chunk by chunk, like a chunked ingest of the extracted files
+        ingest_data(FILE_PATHS, expected_db, chunk_rows=options.get('chunk_rows'), chunk_bytes=MEMBER_CHUNK_BYTES)
+        status_counts = fetch_data.download_and_ingest(server, actual_db, **options)
+
+        query = "SELECT * FROM blog_analysis.votes ORDER BY Id"
+        assert actual_db.conn.execute(query).fetchall() == expected_db.conn.execute(query).fetchall()
+        assert status_counts.get('READYTOLOAD', 0) > 0
+    finally:
+        expected_db.close()
+        actual_db.close()
+
+
+def test_download_and_ingest_rejects_rebuild(server):
+    with BlogAnalysisDB(db_path=':memory:') as db, pytest.raises(ValueError):
+        fetch_data.download_and_ingest(server, db, load_mode='rebuild')
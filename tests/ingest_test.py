@@ -1,5 +1,8 @@
 import os
 import sys
+import glob
+import gzip
+import tarfile
 from pathlib import Path
 
 # This adds the project directory to the Python path to resolve the `db` import
@@ -7,7 +10,9 @@ sys.path.append(str(Path(__file__).resolve().parents[1]))
 
 import pytest
 from equalexperts_dataeng_exercise.db import BlogAnalysisDB
+from equalexperts_dataeng_exercise import ingest
 from equalexperts_dataeng_exercise.ingest import ingest_data
+from equalexperts_dataeng_exercise.outliers import calculate_outliers
 
 """
 NOTE:
@@ -185,4 +190,526 @@ def test_upsert_column(db, file_info_set, expected_total_records, expected_VoteT
     VoteTypeId = db.conn.execute("SELECT VoteTypeId FROM blog_analysis.votes WHERE Id = 1;").fetchone()[0]
     assert VoteTypeId == expected_VoteTypeId, f"VoteTypeId date value mismatch. Expected: {expected_VoteTypeId}, Found: {VoteTypeId}"
 
-    
+
+@pytest.mark.parametrize("load_mode", ['merge', 'rebuild'])
+def test_load_modes_produce_same_operational_table(load_mode):
+    file_names = ['samples-votes.jsonl', 'samples-votes-upsert.jsonl', 'samples-votes-upsert-col.jsonl']
+    expected_db = BlogAnalysisDB(db_path=':memory:')
+    actual_db = BlogAnalysisDB(db_path=':memory:')
+    try:
+        for file_name in file_names:
+            file_path = os.path.join(os.path.dirname(__file__), f'../uncommitted/{file_name}')
+            ingest_data(file_path, expected_db, load_mode='rebuild')
+            ingest_data(file_path, actual_db, load_mode=load_mode)
+
+        query = "SELECT * FROM blog_analysis.votes ORDER BY Id"
+        assert actual_db.conn.execute(query).fetchall() == expected_db.conn.execute(query).fetchall()
+    finally:
+        expected_db.close()
+        actual_db.close()
+
+
+def test_unknown_load_mode_raises_error(db):
+    file_path = os.path.join(os.path.dirname(__file__), '../uncommitted/samples-votes.jsonl')
+    with pytest.raises(ValueError):
+        ingest_data(file_path, db, load_mode='append')
+
+
+def test_ingest_multiple_files_in_one_pass(db):
+    # Ids 1 to 9 appear in both files and must be deduplicated across them
+    file_paths = [os.path.join(os.path.dirname(__file__), f'../uncommitted/{file_name}')
+                  for file_name in ['samples-votes.jsonl', 'samples-votes-upsert.jsonl']]
+    ingest_data(file_paths, db)
+    records_count = db.conn.execute("SELECT COUNT(*) FROM blog_analysis.votes").fetchone()[0]
+    distinct_ids = db.conn.execute("SELECT COUNT(DISTINCT Id) FROM blog_analysis.votes").fetchone()[0]
+    assert records_count == distinct_ids == 24, f"Expected 24 unique records, got {records_count}"
+
+
+def test_ingest_glob(db):
+    file_glob = os.path.join(os.path.dirname(__file__), '../uncommitted/samples-votes-upsert*.jsonl')
+    ingest_data(file_glob, db)
+    records_count = db.conn.execute("SELECT COUNT(*) FROM blog_analysis.votes").fetchone()[0]
+    assert records_count == 16, f"Expected 16 records, got {records_count}"
+
+
+def test_ingest_glob_without_matches_raises_error(db):
+    file_glob = os.path.join(os.path.dirname(__file__), '../uncommitted/nofile-*.jsonl')
+    with pytest.raises(FileNotFoundError):
+        ingest_data(file_glob, db)
+
+
+@pytest.mark.parametrize("chunking", [{'chunk_rows': 1}, {'chunk_rows': 3}, {'chunk_bytes': 200}])
+@pytest.mark.parametrize("file_names", [
+    ['sample-votes-dups.jsonl', 'samples-votes-upsert.jsonl', 'samples-votes-upsert-col.jsonl'],
+    ['sample-votes-invalid-datatypes.jsonl'],
+])
+def test_chunked_ingestion_matches_single_pass(chunking, file_names, tmp_path):
+    file_paths = [os.path.join(os.path.dirname(__file__), f'../uncommitted/{file_name}') for file_name in file_names]
+    # Rejected records newer than a valid record of their Id, several chunks before it
+    cross_chunk_path = tmp_path / 'cross-chunk-votes.jsonl'
+    cross_chunk_path.write_text(
+        '{"Id":"900001","PostId":"1","VoteTypeId":"2","CreationDate":"INVALID_DATE"}\n'
+        '{"Id":"900002","PostId":"INVALID_NUM","VoteTypeId":"2","CreationDate":"2022-02-01T00:00:00.000"}\n'
+        + ''.join(f'{{"Id":"90001{number}","PostId":"1","VoteTypeId":"2","CreationDate":"2022-01-0{number}T00:00:00.000"}}\n'
+                  for number in range(1, 5))
+        + '{"Id":"900001","PostId":"1","VoteTypeId":"2","CreationDate":"2022-01-01T00:00:00.000"}\n'
+        '{"Id":"900002","PostId":"2","VoteTypeId":"2","CreationDate":"2022-01-01T00:00:00.000"}\n')
+    file_paths.append(str(cross_chunk_path))
+    expected_db = BlogAnalysisDB(db_path=':memory:')
+    actual_db = BlogAnalysisDB(db_path=':memory:')
+    try:
+        ingest_data(file_paths, expected_db)
+        ingest_data(file_paths, actual_db, **chunking)
+
+        query = "SELECT * FROM blog_analysis.votes ORDER BY Id"
+        assert actual_db.conn.execute(query).fetchall() == expected_db.conn.execute(query).fetchall()
+        assert actual_db.conn.execute("SELECT COUNT(*) FROM blog_analysis.votes WHERE Id IN (900001, 900002)").fetchone()[0] == 0
+    finally:
+        expected_db.close()
+        actual_db.close()
+
+
+def test_chunked_ingestion_rejects_rebuild_mode(db):
+    file_path = os.path.join(os.path.dirname(__file__), '../uncommitted/samples-votes.jsonl')
+    with pytest.raises(ValueError):
+        ingest_data(file_path, db, load_mode='rebuild', chunk_rows=5)
+
+
+def test_staging_keeps_typed_values_and_describes_only_rejected_records(db):
+    file_path = os.path.join(os.path.dirname(__file__), '../uncommitted/sample-votes-invalid-datatypes.jsonl')
+    ingest_data(file_path, db)
+
+    column_types = dict(db.conn.execute("""
+        SELECT column_name, data_type
+        FROM information_schema.columns
+        WHERE table_schema = 'blog_analysis' AND table_name = 'staging_votes'
+    """).fetchall())
+    assert column_types['Id'] == 'BIGINT' and column_types['CreationDate'] == 'TIMESTAMP'
+
+    ready_descriptions = db.conn.execute("""
+        SELECT DISTINCT error_description, rejected_values
+        FROM blog_analysis.staging_votes WHERE staging_status = 'READYTOLOAD'
+    """).fetchall()
+    assert ready_descriptions == [(None, None)], "Valid records should carry no error description or raw values"
+
+    error_description, rejected_values = db.conn.execute("""
+        SELECT error_description, rejected_values
+        FROM blog_analysis.staging_votes WHERE rejected_values.CreationDate = '2022-99-99'
+    """).fetchone()
+    assert error_description == 'Invalid Id; Invalid CreationDate; Invalid PostId; Invalid VoteTypeId; Invalid BountyAmount'
+    assert rejected_values['Id'] == '@'
+
+
+@pytest.mark.parametrize("chunking", [{}, {'chunk_rows': 3}])
+@pytest.mark.parametrize("file_names", [
+    ['sample-votes-dups.jsonl', 'samples-votes-upsert.jsonl', 'samples-votes-upsert-col.jsonl'],
+    ['sample-votes-invalid-datatypes.jsonl', 'sample-votes-invalid-CreationDates.jsonl'],
+])
+def test_fused_pipeline_matches_staged_pipeline(chunking, file_names):
+    file_paths = [os.path.join(os.path.dirname(__file__), f'../uncommitted/{file_name}') for file_name in file_names]
+    expected_db = BlogAnalysisDB(db_path=':memory:')
+    actual_db = BlogAnalysisDB(db_path=':memory:')
+    try:
+        ingest_data(file_paths, expected_db, **chunking)
+        ingest_data(file_paths, actual_db, pipeline='fused', **chunking)
+
+        query = "SELECT * FROM blog_analysis.votes ORDER BY Id"
+        assert actual_db.conn.execute(query).fetchall() == expected_db.conn.execute(query).fetchall()
+    finally:
+        expected_db.close()
+        actual_db.close()
+
+
+@pytest.mark.parametrize("options", [{}, {'pipeline': 'fused'}, {'shards': 2}])
+def test_tied_duplicates_keep_the_valid_then_the_later_record(db, tmp_path, options):
+    file_path = tmp_path / 'tied-votes.jsonl'
+    file_path.write_text(
+        # Id 1: the invalid record comes first, Id 2: it comes last
+        '{"Id":"1","PostId":"INVALID_NUM","VoteTypeId":"2","CreationDate":"2022-01-03T00:00:00.000"}\n'
+        '{"Id":"1","PostId":"10","VoteTypeId":"2","CreationDate":"2022-01-03T00:00:00.000"}\n'
+        '{"Id":"2","PostId":"20","VoteTypeId":"2","CreationDate":"2022-01-04T00:00:00.000"}\n'
+        '{"Id":"2","PostId":"INVALID_NUM","VoteTypeId":"2","CreationDate":"2022-01-04T00:00:00.000"}\n'
+        # Id 3: two valid records, the later one in the file wins
+        '{"Id":"3","PostId":"30","VoteTypeId":"2","CreationDate":"2022-01-05T00:00:00.000"}\n'
+        '{"Id":"3","PostId":"30","VoteTypeId":"3","CreationDate":"2022-01-05T00:00:00.000"}\n')
+    ingest_data(str(file_path), db, **options)
+
+    assert db.conn.execute("SELECT Id, PostId, VoteTypeId FROM blog_analysis.votes ORDER BY Id").fetchall() == [
+        (1, 10, 2), (2, 20, 2), (3, 30, 3)]
+
+
+@pytest.mark.parametrize("load_mode", ['merge', 'rebuild'])
+def test_sharded_ingestion_matches_single_process(load_mode):
+    file_names = ['sample-votes-dups.jsonl', 'sample-votes-invalid-datatypes.jsonl', 'samples-votes-upsert.jsonl',
+                  'samples-votes-upsert-col.jsonl']
+    file_paths = [os.path.join(os.path.dirname(__file__), f'../uncommitted/{file_name}') for file_name in file_names]
+    expected_db = BlogAnalysisDB(db_path=':memory:')
+    actual_db = BlogAnalysisDB(db_path=':memory:')
+    try:
+        ingest_data(file_paths, expected_db, load_mode=load_mode)
+        ingest_data(file_paths, actual_db, load_mode=load_mode, shards=3)
+
+        for query in ["SELECT * FROM blog_analysis.votes ORDER BY Id",
+                      "SELECT * FROM blog_analysis.staging_votes ORDER BY ALL",
+                      "SELECT * FROM blog_analysis.weekly_vote_counts ORDER BY ALL"]:
+            assert actual_db.conn.execute(query).fetchall() == expected_db.conn.execute(query).fetchall()
+    finally:
+        expected_db.close()
+        actual_db.close()
+
+
+def test_sharded_ingestion_creates_a_missing_temp_directory(tmp_path):
+    file_path = os.path.join(os.path.dirname(__file__), '../uncommitted/sample-votes-dups.jsonl')
+    temp_directory = tmp_path / 'missing' / 'spill'
+    with BlogAnalysisDB(db_path=':memory:', settings={'temp_directory': str(temp_directory)}) as db:
+        ingest_data(file_path, db, shards=2)
+        assert db.conn.execute("SELECT COUNT(*) FROM blog_analysis.votes").fetchone()[0] > 0
+    # The shard databases are removed again
+    assert os.listdir(temp_directory) == []
+
+
+def test_sharded_ingestion_rejects_chunks_and_the_fused_pipeline(db):
+    file_path = os.path.join(os.path.dirname(__file__), '../uncommitted/samples-votes.jsonl')
+    with pytest.raises(ValueError):
+        ingest_data(file_path, db, shards=2, chunk_rows=5)
+    with pytest.raises(ValueError):
+        ingest_data(file_path, db, shards=2, pipeline='fused')
+
+
+def write_compressed_inputs(input_format, file_paths, directory):
+    # Writes the files as one compressed file each, or as the members of one tar archive
+    if input_format in ('jsonl.gz', 'jsonl.zst'):
+        compressed_paths = []
+        for file_path in file_paths:
+            compressed_path = os.path.join(directory, f"{os.path.basename(file_path)}.{input_format.split('.')[-1]}")
+            with open(file_path, 'rb') as source:
+                content = source.read()
+            if input_format == 'jsonl.gz':
+                content = gzip.compress(content)
+            else:
+                content = pytest.importorskip('zstandard').ZstdCompressor().compress(content)
+            with open(compressed_path, 'wb') as target:
+                target.write(content)
+            compressed_paths.append(compressed_path)
+        return compressed_paths
+
+    archive_path = os.path.join(directory, f"votes.{input_format}")
+    with tarfile.open(archive_path, 'w:gz' if input_format == 'tar.gz' else 'w') as archive:
+        for member_number, file_path in enumerate(file_paths):
+            archive.add(file_path, arcname=f"drop/{member_number}-{os.path.basename(file_path)}")
+        # Other members of the archive are skipped
+        readme_path = os.path.join(directory, 'README.txt')
+        with open(readme_path, 'w') as readme:
+            readme.write('not votes')
+        archive.add(readme_path, arcname='drop/README.txt')
+    return [archive_path]
+
+
+@pytest.mark.parametrize("options", [{}, {'chunk_rows': 3}, {'shards': 2}])
+@pytest.mark.parametrize("input_format", ['jsonl.gz', 'jsonl.zst', 'tar', 'tar.gz'])
+def test_compressed_and_archived_inputs_match_plain_jsonl(input_format, options, tmp_path):
+    file_names = ['sample-votes-dups.jsonl', 'sample-votes-invalid-datatypes.jsonl', 'samples-votes-upsert-col.jsonl']
+    file_paths = [os.path.join(os.path.dirname(__file__), f'../uncommitted/{file_name}') for file_name in file_names]
+    input_paths = write_compressed_inputs(input_format, file_paths, str(tmp_path))
+    expected_db = BlogAnalysisDB(db_path=':memory:')
+    actual_db = BlogAnalysisDB(db_path=':memory:')
+    try:
+        ingest_data(file_paths, expected_db, **options)
+        ingest_data(input_paths, actual_db, **options)
+
+        query = "SELECT * FROM blog_analysis.votes ORDER BY Id"
+        assert actual_db.conn.execute(query).fetchall() == expected_db.conn.execute(query).fetchall()
+    finally:
+        expected_db.close()
+        actual_db.close()
+
+
+def test_archives_are_extracted_to_a_missing_temp_directory(tmp_path):
+    file_path = os.path.join(os.path.dirname(__file__), '../uncommitted/samples-votes.jsonl')
+    archive_paths = write_compressed_inputs('tar', [file_path], str(tmp_path))
+    temp_directory = tmp_path / 'missing' / 'spill'
+    with BlogAnalysisDB(db_path=':memory:', settings={'temp_directory': str(temp_directory)}) as db:
+        # Plain files do not need a block directory
+        ingest_data(file_path, db)
+        assert not temp_directory.exists()
+        ingest_data(archive_paths, db)
+        assert db.conn.execute("SELECT COUNT(*) FROM blog_analysis.votes").fetchone()[0] > 0
+
+
+def test_fused_pipeline_rejects_unchunked_tar_archives(db, tmp_path):
+    file_path = os.path.join(os.path.dirname(__file__), '../uncommitted/samples-votes.jsonl')
+    archive_paths = write_compressed_inputs('tar', [file_path], str(tmp_path))
+    with pytest.raises(ValueError):
+        ingest_data(archive_paths, db, pipeline='fused')
+
+
+def test_input_files_are_resolved_once(db, monkeypatch):
+    resolved = []
+    resolve_input_files = ingest.resolve_input_files
+    monkeypatch.setattr(ingest, 'resolve_input_files', lambda file_path: resolved.append(file_path) or resolve_input_files(file_path))
+    ingest_data(os.path.join(os.path.dirname(__file__), '../uncommitted/samples-votes.jsonl'), db, pipeline='fused')
+    assert len(resolved) == 1
+
+
+def test_fused_pipeline_quarantines_only_rejected_records(db):
+    file_path = os.path.join(os.path.dirname(__file__), '../uncommitted/sample-votes-invalid-datatypes.jsonl')
+    ingest_data(file_path, db, pipeline='fused')
+
+    staging_tables = db.conn.execute("""
+        SELECT table_name FROM information_schema.tables
+        WHERE table_schema = 'blog_analysis' AND table_name LIKE 'staging_votes%'
+    """).fetchall()
+    assert staging_tables == [], "The fused pipeline should not create the staging tables"
+
+    expected_failed = BlogAnalysisDB(db_path=':memory:')
+    try:
+        ingest_data(file_path, expected_failed)
+        failed_count = expected_failed.conn.execute(
+            "SELECT COUNT(*) FROM blog_analysis.staging_votes WHERE staging_status = 'FAILED'").fetchone()[0]
+    finally:
+        expected_failed.close()
+
+    quarantined_count = db.conn.execute("SELECT COUNT(*) FROM blog_analysis.votes_quarantine").fetchone()[0]
+    assert quarantined_count == failed_count > 0
+    error_description = db.conn.execute(
+        "SELECT error_description FROM blog_analysis.votes_quarantine WHERE CreationDate = '2022-99-99'").fetchone()[0]
+    assert error_description == 'Invalid Id; Invalid CreationDate; Invalid PostId; Invalid VoteTypeId; Invalid BountyAmount'
+
+
+def test_unknown_pipeline_raises_error(db):
+    file_path = os.path.join(os.path.dirname(__file__), '../uncommitted/samples-votes.jsonl')
+    with pytest.raises(ValueError):
+        ingest_data(file_path, db, pipeline='parallel')
+
+
+@pytest.mark.parametrize("load_mode", ['merge', 'rebuild'])
+def test_sorted_layout_matches_indexed_layout(load_mode):
+    file_names = ['samples-votes.jsonl', 'samples-votes-upsert.jsonl', 'samples-votes-upsert-col.jsonl']
+    indexed_db = BlogAnalysisDB(db_path=':memory:', layout='indexed')
+    sorted_db = BlogAnalysisDB(db_path=':memory:', layout='sorted')
+    try:
+        for file_name in file_names:
+            file_path = os.path.join(os.path.dirname(__file__), f'../uncommitted/{file_name}')
+            ingest_data(file_path, indexed_db, load_mode=load_mode)
+            ingest_data(file_path, sorted_db, load_mode=load_mode)
+
+        query = "SELECT * FROM blog_analysis.votes ORDER BY Id"
+        assert sorted_db.conn.execute(query).fetchall() == indexed_db.conn.execute(query).fetchall()
+
+        index_query = "SELECT index_name FROM duckdb_indexes() WHERE table_name = 'votes' ORDER BY index_name"
+        assert indexed_db.conn.execute(index_query).fetchall() == [('CreationDate_idx',), ('Id_idx',)]
+        assert sorted_db.conn.execute(index_query).fetchall() == [], "The sorted layout should not keep indexes"
+    finally:
+        indexed_db.close()
+        sorted_db.close()
+
+
+def test_cluster_votes_orders_the_table_by_creation_date(db):
+    for file_name in ['samples-votes.jsonl', 'samples-votes-upsert-col.jsonl']:
+        ingest_data(os.path.join(os.path.dirname(__file__), f'../uncommitted/{file_name}'), db)
+    before = db.conn.execute("SELECT * FROM blog_analysis.votes ORDER BY Id").fetchall()
+
+    db.cluster_votes()
+    dates_in_storage_order = [row[0] for row in db.conn.execute("SELECT CreationDate FROM blog_analysis.votes ORDER BY rowid").fetchall()]
+    assert dates_in_storage_order == sorted(dates_in_storage_order)
+    assert db.conn.execute("SELECT * FROM blog_analysis.votes ORDER BY Id").fetchall() == before
+    assert db.conn.execute("SELECT COUNT(*) FROM duckdb_indexes() WHERE table_name = 'votes'").fetchone()[0] == 2, \
+        "The indexed layout should rebuild its indexes after clustering"
+
+
+@pytest.mark.parametrize("load_mode", ['merge', 'rebuild'])
+def test_partitioned_layout_matches_indexed_layout(load_mode, tmp_path):
+    file_names = ['samples-votes.jsonl', 'samples-votes-upsert.jsonl', 'samples-votes-upsert-col.jsonl']
+    indexed_db = BlogAnalysisDB(db_path=':memory:', layout='indexed')
+    partitioned_db = BlogAnalysisDB(db_path=':memory:', layout='partitioned', partition_path=str(tmp_path / 'votes'))
+    try:
+        for file_name in file_names:
+            file_path = os.path.join(os.path.dirname(__file__), f'../uncommitted/{file_name}')
+            ingest_data(file_path, indexed_db, load_mode=load_mode)
+            ingest_data(file_path, partitioned_db, load_mode=load_mode)
+        for db in (indexed_db, partitioned_db):
+            calculate_outliers(db)
+
+        for query in ["SELECT * FROM blog_analysis.votes ORDER BY Id",
+                      "SELECT * FROM blog_analysis.weekly_vote_counts ORDER BY Year, WeekNumber",
+                      "SELECT * FROM blog_analysis.outlier_weeks"]:
+            assert partitioned_db.conn.execute(query).fetchall() == indexed_db.conn.execute(query).fetchall()
+
+        partitions = partitioned_db.conn.execute("""
+            SELECT DISTINCT Year, WeekNumber FROM blog_analysis.votes_partitioned ORDER BY ALL
+        """).fetchall()
+        assert partitions == partitioned_db.conn.execute(
+            "SELECT Year, WeekNumber FROM blog_analysis.weekly_vote_counts ORDER BY ALL").fetchall()
+        assert all((tmp_path / 'votes' / f'Year={year}' / f'WeekNumber={week}').is_dir() for year, week in partitions)
+    finally:
+        indexed_db.close()
+        partitioned_db.close()
+
+
+def test_partitioned_merge_rewrites_only_touched_partitions(tmp_path):
+    db = BlogAnalysisDB(db_path=':memory:', layout='partitioned', partition_path=str(tmp_path / 'votes'))
+    try:
+        ingest_data(os.path.join(os.path.dirname(__file__), '../uncommitted/samples-votes.jsonl'), db)
+        files_before = set(glob.glob(str(tmp_path / 'votes' / '*' / '*' / '*.parquet')))
+
+        # The correction moves the vote of Id 1 and adds one vote, touching at most three weeks
+        correction_path = tmp_path / 'correction.jsonl'
+        correction_path.write_text(
+            '{"Id":"1","PostId":"1","VoteTypeId":"2","CreationDate":"2022-06-01T00:00:00.000"}\n'
+            '{"Id":"9001","PostId":"1","VoteTypeId":"2","CreationDate":"2022-06-02T00:00:00.000"}\n')
+        old_week = db.conn.execute("SELECT Year, WeekNumber FROM blog_analysis.votes_partitioned WHERE Id = 1").fetchone()
+        ingest_data(str(correction_path), db)
+
+        files_after = set(glob.glob(str(tmp_path / 'votes' / '*' / '*' / '*.parquet')))
+        replaced = files_before - files_after
+        assert len(replaced) == 1 and f'Year={old_week[0]}' in replaced.pop(), "Only the old week of Id 1 should be rewritten"
+        assert len(files_after - files_before) <= 2
+        assert db.conn.execute("SELECT COUNT(*) FROM blog_analysis.votes").fetchone()[0] == 17
+        assert db.conn.execute("""
+            SELECT Year, WeekNumber FROM blog_analysis.votes_partitioned WHERE Id = 1
+        """).fetchone() == (2022, 22)
+
+        db.delete_votes([1, 9001])
+        assert db.conn.execute("SELECT COUNT(*) FROM blog_analysis.votes").fetchone()[0] == 15
+        assert not (tmp_path / 'votes' / 'Year=2022' / 'WeekNumber=22').exists()
+        assert db.conn.execute("SELECT SUM(VoteCount) FROM blog_analysis.weekly_vote_counts").fetchone()[0] == 15
+    finally:
+        db.close()
+
+
+def test_unknown_layout_raises_error():
+    with pytest.raises(ValueError):
+        BlogAnalysisDB(db_path=':memory:', layout='clustered')
+
+
+def test_unchanged_file_is_skipped_unless_forced(db):
+    file_path = os.path.join(os.path.dirname(__file__), '../uncommitted/samples-votes.jsonl')
+    ingest_data(file_path, db)
+    db.delete_votes([1])
+
+    # A skipped file is not read again, so the deleted vote stays deleted
+    ingest_data(file_path, db)
+    assert db.conn.execute("SELECT COUNT(*) FROM blog_analysis.votes").fetchone()[0] == 15
+
+    ingest_data(file_path, db, force=True)
+    assert db.conn.execute("SELECT COUNT(*) FROM blog_analysis.votes").fetchone()[0] == 16
+
+    manifest = db.conn.execute("""
+        SELECT batch_id, status, rows_loaded, rows_rejected, rows_duplicate
+        FROM blog_analysis.ingest_manifest ORDER BY batch_id
+    """).fetchall()
+    assert manifest == [(1, 'LOADED', 16, 0, 0), (2, 'LOADED', 16, 0, 0)]
+
+
+def test_manifest_skips_copies_and_processes_changed_files(db, tmp_path):
+    source_path = os.path.join(os.path.dirname(__file__), '../uncommitted/sample-votes-dups.jsonl')
+    original_path = tmp_path / 'votes.jsonl'
+    original_path.write_bytes(Path(source_path).read_bytes())
+    ingest_data(str(original_path), db)
+
+    copy_path = tmp_path / 'votes-copy.jsonl'
+    copy_path.write_bytes(original_path.read_bytes())
+    ingest_data(str(copy_path), db)
+    assert db.conn.execute("SELECT status FROM blog_analysis.ingest_manifest WHERE file_path = ?",
+                           [str(copy_path)]).fetchall() == [('SKIPPED',)]
+
+    with open(original_path, 'a') as original_file:
+        original_file.write('{"Id":"9001","PostId":"1","VoteTypeId":"2","CreationDate":"2022-03-01T00:00:00.000"}\n')
+    ingest_data([str(original_path), str(copy_path)], db)
+
+    loaded = db.conn.execute("""
+        SELECT file_path, rows_loaded FROM blog_analysis.ingest_manifest
+        WHERE status = 'LOADED' ORDER BY batch_id
+    """).fetchall()
+    assert loaded == [(str(original_path), 8), (str(original_path), 9)], "Only the changed file should be processed again"
+    assert db.conn.execute("SELECT COUNT(*) FROM blog_analysis.votes").fetchone()[0] == 9
+
+
+def test_cdc_load_mode_matches_merge_and_skips_replayed_records(db):
+    file_names = ['samples-votes.jsonl', 'samples-votes-upsert.jsonl', 'samples-votes-upsert-col.jsonl']
+    expected_db = BlogAnalysisDB(db_path=':memory:')
+    try:
+        for file_name in file_names:
+            file_path = os.path.join(os.path.dirname(__file__), f'../uncommitted/{file_name}')
+            ingest_data(file_path, expected_db, load_mode='merge')
+            ingest_data(file_path, db, load_mode='cdc')
+
+        query = "SELECT * FROM blog_analysis.votes ORDER BY Id"
+        assert db.conn.execute(query).fetchall() == expected_db.conn.execute(query).fetchall()
+        # The VoteTypeId correction of Id 1 is below the watermark and must still be applied
+        assert db.conn.execute("SELECT VoteTypeId FROM blog_analysis.votes WHERE Id = 1").fetchone()[0] == 100
+    finally:
+        expected_db.close()
+
+    assert db.get_ingest_watermark() == db.conn.execute(
+        "SELECT CreationDate, Id FROM blog_analysis.votes ORDER BY CreationDate DESC, Id DESC LIMIT 1").fetchone()
+
+    # Replaying a file that is already held merges nothing
+    file_path = os.path.join(os.path.dirname(__file__), '../uncommitted/samples-votes-upsert-col.jsonl')
+    ingest_data(file_path, db, load_mode='cdc', force=True)
+    assert db.conn.execute("""
+        SELECT rows_loaded FROM blog_analysis.ingest_manifest ORDER BY batch_id DESC LIMIT 1
+    """).fetchone()[0] == 0
+    assert db.conn.execute(
+        "SELECT COUNT(*) FROM blog_analysis.staging_votes WHERE staging_status = 'UNCHANGED'").fetchone()[0] == 16
+
+
+@pytest.mark.parametrize("options", [{'pipeline': 'fused'}, {'shards': 2}, {'chunk_rows': 5}])
+def test_cdc_load_mode_skips_replayed_records_in_every_pipeline(db, options):
+    file_names = ['samples-votes.jsonl', 'samples-votes-upsert-col.jsonl']
+    file_paths = [os.path.join(os.path.dirname(__file__), f'../uncommitted/{file_name}') for file_name in file_names]
+    expected_db = BlogAnalysisDB(db_path=':memory:')
+    try:
+        for file_path in file_paths:
+            ingest_data(file_path, expected_db, load_mode='merge')
+            ingest_data(file_path, db, load_mode='cdc', **options)
+
+        query = "SELECT * FROM blog_analysis.votes ORDER BY Id"
+        assert db.conn.execute(query).fetchall() == expected_db.conn.execute(query).fetchall()
+    finally:
+        expected_db.close()
+
+    # The replayed records are marked UNCHANGED while they are cleansed
+    ingest_data(file_paths[-1], db, load_mode='cdc', force=True, **options)
+    assert db.conn.execute("""
+        SELECT rows_loaded FROM blog_analysis.ingest_manifest ORDER BY batch_id DESC LIMIT 1
+    """).fetchone()[0] == 0
+
+
+@pytest.mark.parametrize("chunking", [{'chunk_rows': 5}, {}])
+def test_cdc_load_mode_reapplies_late_and_deleted_records(db, chunking):
+    file_path = os.path.join(os.path.dirname(__file__), '../uncommitted/samples-votes.jsonl')
+    ingest_data(file_path, db, load_mode='cdc', **chunking)
+    watermark = db.get_ingest_watermark()
+    db.delete_votes([1])
+
+    # Id 1 is below the watermark but no longer held, so it is not filtered out
+    ingest_data(file_path, db, load_mode='cdc', force=True, **chunking)
+    assert db.conn.execute("SELECT COUNT(*) FROM blog_analysis.votes").fetchone()[0] == 16
+    assert db.conn.execute("""
+        SELECT rows_loaded FROM blog_analysis.ingest_manifest ORDER BY batch_id DESC LIMIT 1
+    """).fetchone()[0] == 1
+    assert db.get_ingest_watermark() == watermark
+
+
+@pytest.mark.parametrize("load_mode", ['merge', 'rebuild'])
+def test_id_summary_tracks_operational_ids(db, load_mode):
+    for file_name in ['samples-votes.jsonl', 'samples-votes-upsert.jsonl']:
+        file_path = os.path.join(os.path.dirname(__file__), f'../uncommitted/{file_name}')
+        ingest_data(file_path, db, load_mode=load_mode)
+
+    id_range = db.conn.execute("SELECT min_id, max_id FROM blog_analysis.votes_id_range").fetchall()
+    assert id_range == db.conn.execute("SELECT MIN(Id), MAX(Id) FROM blog_analysis.votes").fetchall()
+    assert db.conn.execute("SELECT SUM(bit_count(mask)) FROM blog_analysis.votes_id_blocks").fetchone()[0] == \
+        db.conn.execute("SELECT COUNT(*) FROM blog_analysis.votes").fetchone()[0]
+
+
+def test_id_summary_is_built_for_a_table_loaded_without_it(db):
+    file_path = os.path.join(os.path.dirname(__file__), '../uncommitted/samples-votes.jsonl')
+    ingest_data(file_path, db)
+    db.conn.execute("DROP TABLE blog_analysis.votes_id_range")
+    db.conn.execute("DROP TABLE blog_analysis.votes_id_blocks")
+
+    # Without a summary built from the held votes the replayed Ids would be inserted twice
+    ingest_data(file_path, db, force=True)
+    assert db.conn.execute("SELECT COUNT(*), COUNT(DISTINCT Id) FROM blog_analysis.votes").fetchone() == (16, 16)
@@ -5,10 +5,11 @@ from pathlib import Path
 # This adds the project directory to the Python path to resolve the `db` import
 sys.path.append(str(Path(__file__).resolve().parents[1]))
 
+import duckdb
 import pytest
-from equalexperts_dataeng_exercise.db import BlogAnalysisDB
+from equalexperts_dataeng_exercise.db import BlogAnalysisDB, VOTES_COLUMN_DEFINITIONS
 from equalexperts_dataeng_exercise.ingest import ingest_data
-from equalexperts_dataeng_exercise.outliers import calculate_outliers
+from equalexperts_dataeng_exercise.outliers import calculate_outliers, read_outlier_weeks, read_outliers
 
 """
 NOTE:
@@ -131,3 +132,247 @@ def test_view_idempotency(db, file_info):
 
     # Compare the initial and recreated view contents
     assert initial_results == recreated_results, "The view contents should remain constant after recreation, indicating idempotency."
+
+
+WEEKLY_COUNTS_QUERY = "SELECT Year, WeekNumber, VoteCount FROM blog_analysis.weekly_vote_counts ORDER BY Year, WeekNumber"
+
+
+def recompute_weekly_counts(db):
+    # Recompute the weekly counts the slow way, straight from the votes table
+    db.rebuild_weekly_vote_counts()
+    return db.conn.execute(WEEKLY_COUNTS_QUERY).fetchall()
+
+
+def test_weekly_counts_follow_upserts(db):
+    # samples-votes-upsert-col.jsonl moves Ids 1, 2 and 216 to other weeks
+    for file_name in ['samples-votes.jsonl', 'samples-votes-upsert.jsonl', 'samples-votes-upsert-col.jsonl']:
+        ingest_data(os.path.join(os.path.dirname(__file__), f'../uncommitted/{file_name}'), db)
+
+    incremental_counts = db.conn.execute(WEEKLY_COUNTS_QUERY).fetchall()
+    assert incremental_counts == recompute_weekly_counts(db), "Incremental weekly counts should match a full recompute"
+
+
+def test_weekly_counts_follow_deletes(db):
+    ingest_data(os.path.join(os.path.dirname(__file__), '../uncommitted/samples-votes.jsonl'), db)
+
+    # Id 1 is the only vote of 2022 week 0
+    db.delete_votes([1, 2])
+
+    incremental_counts = db.conn.execute(WEEKLY_COUNTS_QUERY).fetchall()
+    assert (2022, 0, 1) not in incremental_counts, "Emptied weeks should be removed from the aggregate"
+    assert incremental_counts == recompute_weekly_counts(db), "Incremental weekly counts should match a full recompute"
+
+
+def test_outlier_readers_run_in_parallel(db, file_info):
+    from concurrent.futures import ThreadPoolExecutor
+
+    test_file_path, _, expected_outliers = file_info
+    ingest_data(test_file_path, db)
+    calculate_outliers(db)
+
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        results = list(pool.map(lambda _: read_outlier_weeks(db), range(8)))
+
+    expected_rows = [(row["Year"], row["WeekNumber"], row["VoteCount"]) for row in expected_outliers]
+    assert results == [expected_rows] * 8
+
+
+DAILY_COUNTS_QUERY = "SELECT Date, VoteTypeId, VoteCount FROM blog_analysis.daily_vote_counts ORDER BY ALL"
+
+
+def test_daily_cube_follows_upserts_and_deletes(db):
+    for file_name in ['samples-votes.jsonl', 'samples-votes-upsert.jsonl', 'samples-votes-upsert-col.jsonl']:
+        ingest_data(os.path.join(os.path.dirname(__file__), f'../uncommitted/{file_name}'), db)
+    db.delete_votes([1, 2])
+
+    incremental_counts = db.conn.execute(DAILY_COUNTS_QUERY).fetchall()
+    direct_counts = db.conn.execute("""
+        SELECT CreationDate::DATE, VoteTypeId, COUNT(*) FROM blog_analysis.votes GROUP BY ALL ORDER BY ALL
+    """).fetchall()
+    assert incremental_counts == direct_counts, "The cube should hold the votes per day and VoteTypeId"
+
+
+@pytest.mark.parametrize('granularity, period_sql', [
+    ('day', "CreationDate::DATE"),
+    ('month', "EXTRACT(YEAR FROM CreationDate) AS Year, EXTRACT(MONTH FROM CreationDate) AS Month"),
+])
+def test_outliers_by_period_match_a_direct_count(db, granularity, period_sql):
+    ingest_data(os.path.join(os.path.dirname(__file__), '../uncommitted/samples-votes.jsonl'), db)
+    calculate_outliers(db, granularity=granularity, threshold=0.3)
+
+    expected = db.conn.execute(f"""
+        WITH Counts AS (
+            SELECT {period_sql}, COUNT(*) AS VoteCount FROM blog_analysis.votes GROUP BY ALL
+        )
+        SELECT * EXCLUDE (AvgVoteCount)
+        FROM (SELECT *, AVG(VoteCount) OVER () AS AvgVoteCount FROM Counts)
+        WHERE VoteCount < 0.7 * AvgVoteCount OR VoteCount > 1.3 * AvgVoteCount
+        ORDER BY ALL
+    """).fetchall()
+    assert expected, "The sample should have outliers at this granularity"
+    assert read_outliers(db, granularity) == expected
+
+
+def recompute_outlier_weeks(db):
+    db.create_outlier_weeks_view()
+    return read_outlier_weeks(db)
+
+
+def test_outliers_by_vote_type_and_filters(db):
+    ingest_data(os.path.join(os.path.dirname(__file__), '../uncommitted/samples-votes.jsonl'), db)
+    calculate_outliers(db)
+    outlier_weeks = read_outlier_weeks(db)
+
+    calculate_outliers(db, by_vote_type=True)
+    rows = read_outliers(db, by_vote_type=True)
+    assert rows and all(len(row) == 4 for row in rows), "The view should have a VoteTypeId column"
+
+    # Filtering on every VoteTypeId and the full date range counts every vote
+    vote_type_ids = [row[0] for row in db.conn.execute("SELECT DISTINCT VoteTypeId FROM blog_analysis.votes").fetchall()]
+    calculate_outliers(db, vote_type_ids=vote_type_ids, start_date='2000-01-01', end_date='2100-01-01')
+    assert read_outliers(db, filtered=True) == outlier_weeks
+
+    calculate_outliers(db, start_date='2100-01-01', by_vote_type=True)
+    assert read_outliers(db, by_vote_type=True, filtered=True) == []
+
+    # The filtered and per-type views leave the canonical view alone
+    columns = db.conn.execute("SELECT * FROM blog_analysis.outlier_weeks LIMIT 0").description
+    assert [column[0] for column in columns] == ['Year', 'WeekNumber', 'VoteCount']
+    assert read_outlier_weeks(db) == outlier_weeks
+
+
+def test_invalid_outlier_options(db):
+    with pytest.raises(ValueError):
+        calculate_outliers(db, granularity='quarter')
+    with pytest.raises(ValueError):
+        calculate_outliers(db, threshold=-0.1)
+    with pytest.raises(ValueError):
+        calculate_outliers(db, start_date='last week')
+
+
+def expected_weekly_baselines(db, trailing_weeks, alpha):
+    # The baselines computed from scratch over the weekly counts
+    weeks = db.conn.execute(WEEKLY_COUNTS_QUERY).fetchall()
+    baselines, ewma = [], None
+    for position, (year, week_number, vote_count) in enumerate(weeks):
+        previous = [count for _, _, count in weeks[max(0, position - trailing_weeks):position]]
+        trailing_mean = sum(previous) / len(previous) if previous else None
+        previous_ewma = ewma
+        ewma = vote_count if ewma is None else alpha * vote_count + (1 - alpha) * ewma
+        baselines.append((year, week_number, vote_count, trailing_mean, previous_ewma))
+    return rounded(baselines)
+
+
+def rounded(rows):
+    return [tuple(round(value, 9) if isinstance(value, float) else value for value in row) for row in rows]
+
+
+def read_weekly_baselines(db):
+    return rounded(db.conn.execute("""
+        SELECT Year, WeekNumber, VoteCount, TrailingMean, PreviousEwma
+        FROM blog_analysis.weekly_vote_baselines
+        ORDER BY Position
+    """).fetchall())
+
+
+def test_weekly_baselines_follow_loads_and_deletes(db):
+    ingest_data(os.path.join(os.path.dirname(__file__), '../uncommitted/samples-votes.jsonl'), db)
+    db.setup_weekly_vote_baselines(trailing_weeks=3, alpha=0.5)
+    assert read_weekly_baselines(db) == expected_weekly_baselines(db, 3, 0.5)
+
+    # samples-votes-upsert-col.jsonl moves Ids 1, 2 and 216 to other weeks
+    for file_name in ['samples-votes-upsert.jsonl', 'samples-votes-upsert-col.jsonl']:
+        ingest_data(os.path.join(os.path.dirname(__file__), f'../uncommitted/{file_name}'), db)
+        assert read_weekly_baselines(db) == expected_weekly_baselines(db, 3, 0.5)
+    db.delete_votes([1, 2])
+    assert read_weekly_baselines(db) == expected_weekly_baselines(db, 3, 0.5)
+
+    # Other parameters recompute the state
+    db.setup_weekly_vote_baselines(trailing_weeks=2, alpha=0.2)
+    assert read_weekly_baselines(db) == expected_weekly_baselines(db, 2, 0.2)
+
+
+def test_appending_a_week_keeps_the_earlier_baselines(db):
+    ingest_data(os.path.join(os.path.dirname(__file__), '../uncommitted/samples-votes.jsonl'), db)
+    db.setup_weekly_vote_baselines()
+    # A marker in the first week shows the earlier weeks are not recomputed
+    db.conn.execute("UPDATE blog_analysis.weekly_vote_baselines SET TrailingMean = -1 WHERE Position = 1")
+    earlier = db.conn.execute("SELECT * FROM blog_analysis.weekly_vote_baselines ORDER BY Position").fetchall()
+
+    db.conn.execute("""
+        CREATE TEMP TABLE late_votes AS
+        SELECT 1000000::BIGINT AS Id, 1::BIGINT AS PostId, 2::BIGINT AS VoteTypeId,
+               TIMESTAMP '2030-01-15' AS CreationDate, NULL::BIGINT AS UserId, NULL::NUMERIC AS BountyAmount,
+               'READYTOLOAD' AS staging_status
+    """)
+    db.move_data_to_operational_with_merge(VOTES_COLUMN_DEFINITIONS, staging_table='late_votes')
+
+    rows = db.conn.execute("SELECT * FROM blog_analysis.weekly_vote_baselines ORDER BY Position").fetchall()
+    assert rows[:-1] == earlier
+    assert rows[-1][0] == 2030 and rows[-1][2:4] == (len(earlier) + 1, 1)
+
+
+def test_incremental_baselines_match_a_recompute_after_chunked_loads_and_upserts(db):
+    ingest_data(os.path.join(os.path.dirname(__file__), '../uncommitted/samples-votes.jsonl'), db)
+    calculate_outliers(db, mode='ewma')
+    ingest_data(os.path.join(os.path.dirname(__file__), '../uncommitted/all-samples-votes-outliers.jsonl'), db,
+                chunk_rows=7)
+    for file_name in ['samples-votes-upsert.jsonl', 'samples-votes-upsert-col.jsonl']:
+        ingest_data(os.path.join(os.path.dirname(__file__), f'../uncommitted/{file_name}'), db)
+    db.delete_votes([1, 2])
+
+    query = "SELECT * FROM blog_analysis.weekly_vote_baselines ORDER BY Position"
+    incremental = rounded(db.conn.execute(query).fetchall())
+    positions = [row[2] for row in incremental]
+    assert positions == list(range(1, len(incremental) + 1))
+
+    # Other parameters and back recompute the state from scratch
+    db.setup_weekly_vote_baselines(trailing_weeks=2, alpha=0.2)
+    db.setup_weekly_vote_baselines()
+    assert incremental == rounded(db.conn.execute(query).fetchall())
+
+
+def test_duplicate_baseline_positions_are_rejected(db):
+    ingest_data(os.path.join(os.path.dirname(__file__), '../uncommitted/samples-votes.jsonl'), db)
+    db.setup_weekly_vote_baselines()
+    with pytest.raises(duckdb.ConstraintException):
+        db.conn.execute("INSERT INTO blog_analysis.weekly_vote_baselines (Year, WeekNumber, Position) VALUES (1900, 0, 1)")
+
+
+@pytest.mark.parametrize('mode, baseline_column', [('trailing', 'TrailingMean'), ('ewma', 'PreviousEwma')])
+def test_windowed_outlier_weeks(db, mode, baseline_column):
+    ingest_data(os.path.join(os.path.dirname(__file__), '../uncommitted/samples-votes.jsonl'), db)
+    calculate_outliers(db, mode=mode, threshold=0.5, trailing_weeks=2, alpha=0.5)
+
+    expected = db.conn.execute(f"""
+        SELECT Year, WeekNumber, VoteCount, {baseline_column}
+        FROM blog_analysis.weekly_vote_baselines
+        WHERE VoteCount < 0.5 * {baseline_column} OR VoteCount > 1.5 * {baseline_column}
+        ORDER BY Year, WeekNumber
+    """).fetchall()
+    assert expected, "The sample should have outliers in this mode"
+    assert read_outliers(db, mode=mode) == expected
+
+
+def test_yearly_outlier_weeks(db):
+    ingest_data(os.path.join(os.path.dirname(__file__), '../uncommitted/samples-votes.jsonl'), db)
+    calculate_outliers(db, mode='yearly')
+
+    expected = db.conn.execute(f"""
+        SELECT Year, WeekNumber, VoteCount, AvgVoteCount
+        FROM (SELECT *, AVG(VoteCount) OVER (PARTITION BY Year) AS AvgVoteCount FROM ({WEEKLY_COUNTS_QUERY}))
+        WHERE VoteCount < 0.8 * AvgVoteCount OR VoteCount > 1.2 * AvgVoteCount
+        ORDER BY Year, WeekNumber
+    """).fetchall()
+    assert read_outliers(db, mode='yearly') == expected
+
+
+def test_invalid_windowed_outlier_options(db):
+    with pytest.raises(ValueError):
+        calculate_outliers(db, mode='median')
+    with pytest.raises(ValueError):
+        calculate_outliers(db, mode='ewma', granularity='day')
+    with pytest.raises(ValueError):
+        db.setup_weekly_vote_baselines(trailing_weeks=0)
+    with pytest.raises(ValueError):
+        db.setup_weekly_vote_baselines(alpha=1.5)
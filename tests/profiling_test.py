@@ -0,0 +1,70 @@
+import os
+import sys
+import json
+from pathlib import Path
+
+# This adds the project directory to the Python path to resolve the `db` import
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+import pytest
+from equalexperts_dataeng_exercise.db import BlogAnalysisDB
+from equalexperts_dataeng_exercise.ingest import ingest_data
+from equalexperts_dataeng_exercise.outliers import calculate_outliers
+
+# Command to test profiling.py from project terminal => pytest tests/profiling_test.py
+
+
+@pytest.fixture
+def db():
+    # Setup a test database instance
+    db_instance = BlogAnalysisDB(db_path=':memory:')
+    yield db_instance
+    db_instance.close()
+
+
+def sample_path(file_name):
+    return os.path.join(os.path.dirname(__file__), f'../uncommitted/{file_name}')
+
+
+def test_ingest_profile_is_returned_and_written(db, tmp_path):
+    profile_path = tmp_path / 'ingest-profile.json'
+    report = ingest_data(sample_path('sample-votes-dups.jsonl'), db, profile_path=str(profile_path))
+
+    assert json.loads(profile_path.read_text()) == json.loads(json.dumps(report, default=str))
+    assert [step['step'] for step in report['steps']] == ['manifest', 'load', 'cleanse', 'merge']
+
+    _, load, cleanse, merge = report['steps']
+    assert load['rows_out'] == cleanse['rows_in']
+    assert cleanse['rows_out'] == merge['rows_in'] == merge['rows_out'] == 8
+    assert all(step['seconds'] >= 0 and step['statements'] for step in report['steps'])
+    assert any('ingest_manifest' in statement['sql'] for statement in report['steps'][0]['statements'])
+
+    read_json_statement = load['statements'][0]
+    assert 'read_json' in read_json_statement['sql']
+    assert 'children' in read_json_statement['profile'], "The JSON query profile should hold the operator tree"
+
+    assert db.profiler is None, "Profiling started by ingest_data should be turned off again"
+    assert db.conn.execute("SELECT COUNT(*) FROM blog_analysis.votes").fetchone()[0] == 8
+
+
+def test_no_report_without_profiling(db):
+    assert ingest_data(sample_path('samples-votes.jsonl'), db) is None
+    assert calculate_outliers(db) is None
+
+
+def test_profiling_enabled_on_db_covers_ingest_and_outliers(db):
+    db.enable_profiling(capture_plans=False, plan_format='query_tree')
+    ingest_data(sample_path('samples-votes.jsonl'), db, pipeline='fused', chunk_rows=10)
+    report = calculate_outliers(db)
+
+    assert report['totals']['read_validate']['count'] == 2, "16 lines in chunks of 10 make 2 chunks"
+    assert report['totals']['deduplicate_chunks']['count'] == 2
+    assert [step['step'] for step in report['steps'][-2:]] == ['weekly_counts', 'outlier_weeks']
+    assert report['steps'][-1]['rows_out'] == db.conn.execute("SELECT COUNT(*) FROM blog_analysis.outlier_weeks").fetchone()[0]
+    assert all('profile' not in statement for step in report['steps'] for statement in step['statements'])
+    assert db.profiler is not None, "Profiling enabled by the caller should stay on"
+
+
+def test_unknown_plan_format_raises_error(db):
+    with pytest.raises(ValueError):
+        db.enable_profiling(plan_format='svg')
@@ -0,0 +1,90 @@
+import os
+import sys
+from pathlib import Path
+
+# This adds the project directory to the Python path to resolve the `db` import
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+import pytest
+from equalexperts_dataeng_exercise.db import BlogAnalysisDB
+from equalexperts_dataeng_exercise.ingest import ingest_data
+from equalexperts_dataeng_exercise.outliers import calculate_outliers
+from equalexperts_dataeng_exercise.tiering import archive_cold_votes
+
+
+def _resource(file_name):
+    return os.path.join(os.path.dirname(__file__), f'../uncommitted/{file_name}')
+
+
+@pytest.fixture
+def db(tmp_path):
+    db = BlogAnalysisDB(db_path=':memory:', archive_path=str(tmp_path / 'archive'))
+    ingest_data(_resource('samples-votes.jsonl'), db)
+    yield db
+    db.close()
+
+
+def test_archive_keeps_the_full_history_queryable(db, tmp_path):
+    calculate_outliers(db)
+    votes_before = db.conn.execute("SELECT * FROM blog_analysis.votes ORDER BY Id").fetchall()
+    outliers_before = db.conn.execute("SELECT * FROM blog_analysis.outlier_weeks").fetchall()
+
+    # The latest vote is on 2022-02-27, in the week starting 2022-02-21
+    archived_count = archive_cold_votes(db, horizon_weeks=2)
+    assert archived_count == db.conn.execute("SELECT COUNT(*) FROM blog_analysis.votes_archive").fetchone()[0] > 0
+    assert db.conn.execute("SELECT MIN(CreationDate) >= '2022-02-07' FROM blog_analysis.votes").fetchone()[0]
+    assert db.conn.execute("SELECT MAX(CreationDate) < '2022-02-07' FROM blog_analysis.votes_archive").fetchone()[0]
+    assert db.conn.execute("SELECT * FROM blog_analysis.votes_history ORDER BY Id").fetchall() == votes_before
+
+    calculate_outliers(db)
+    assert db.conn.execute("SELECT * FROM blog_analysis.outlier_weeks").fetchall() == outliers_before
+    db.rebuild_weekly_vote_counts()
+    assert db.conn.execute("SELECT * FROM blog_analysis.outlier_weeks").fetchall() == outliers_before
+
+    compressions = db.conn.execute(f"""
+        SELECT DISTINCT compression
+        FROM parquet_metadata('{tmp_path / 'archive'}/*/*/*.parquet')
+    """).fetchall()
+    assert compressions == [('ZSTD',)]
+
+    assert archive_cold_votes(db, horizon_weeks=2) == 0, "A second run should have nothing left to archive"
+
+
+@pytest.mark.parametrize("load_mode", ['merge', 'rebuild'])
+def test_corrections_replace_archived_votes(db, load_mode):
+    expected_db = BlogAnalysisDB(db_path=':memory:')
+    try:
+        for file_name in ['samples-votes.jsonl', 'samples-votes-upsert-col.jsonl']:
+            ingest_data(_resource(file_name), expected_db, load_mode=load_mode)
+
+        archive_cold_votes(db, horizon_weeks=0)
+        ingest_data(_resource('samples-votes-upsert-col.jsonl'), db, load_mode=load_mode)
+
+        assert db.conn.execute("SELECT * FROM blog_analysis.votes_history ORDER BY Id").fetchall() == \
+            expected_db.conn.execute("SELECT * FROM blog_analysis.votes ORDER BY Id").fetchall()
+        assert db.conn.execute("SELECT VoteTypeId FROM blog_analysis.votes_history WHERE Id = 1").fetchone()[0] == 100
+        query = "SELECT * FROM blog_analysis.weekly_vote_counts ORDER BY Year, WeekNumber"
+        assert db.conn.execute(query).fetchall() == expected_db.conn.execute(query).fetchall()
+    finally:
+        expected_db.close()
+
+
+def test_delete_votes_removes_archived_votes(db):
+    archive_cold_votes(db, horizon_weeks=2)
+    archived_id = db.conn.execute("SELECT MIN(Id) FROM blog_analysis.votes_archive").fetchone()[0]
+    hot_id = db.conn.execute("SELECT MIN(Id) FROM blog_analysis.votes").fetchone()[0]
+
+    db.delete_votes([archived_id, hot_id])
+    assert db.conn.execute("SELECT COUNT(*) FROM blog_analysis.votes_history").fetchone()[0] == 14
+    assert db.conn.execute(
+        "SELECT COUNT(*) FROM blog_analysis.votes_history WHERE Id IN (?, ?)", [archived_id, hot_id]).fetchone()[0] == 0
+    assert db.conn.execute("SELECT SUM(VoteCount) FROM blog_analysis.weekly_vote_counts").fetchone()[0] == 14
+
+
+def test_archive_needs_a_table_layout_and_a_path(tmp_path):
+    with BlogAnalysisDB(db_path=':memory:', layout='partitioned', partition_path=str(tmp_path / 'votes')) as db:
+        with pytest.raises(ValueError):
+            db.archive_votes(4)
+    with BlogAnalysisDB(db_path=':memory:') as db:
+        with pytest.raises(ValueError):
+            db.archive_votes(4)
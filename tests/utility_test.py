@@ -0,0 +1,69 @@
+import os
+import sys
+from pathlib import Path
+
+# This adds the project directory to the Python path to resolve the `db` import
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+import pytest
+from equalexperts_dataeng_exercise.db import BlogAnalysisDB
+
+pa = pytest.importorskip("pyarrow")
+
+from equalexperts_dataeng_exercise.utility import cleanse_and_deduplicate_batch, cleanse_and_deduplicate_row
+
+# Command to test utility.py from project terminal => pytest tests/utility_test.py
+
+
+@pytest.fixture
+def db():
+    # Setup a test database instance with the validation UDFs registered
+    db_instance = BlogAnalysisDB(db_path=':memory:')
+    db_instance.register_udfs()
+    yield db_instance
+    db_instance.close()
+
+
+IDS = ['1', ' 2 ', '-3', '+4', 'x', '', None, '1.5', '99999999999']
+CREATION_DATES = [
+    '2022-01-02T00:00:00.000', '2024-02-29T00:00:00.0', '2022-02-29T00:00:00.0', '2022-02-30T00:00:00.1',
+    '2022-13-01T00:00:00.0', '', None, '2022-01-02', '2022-01-02T24:00:00.0', '2022-1-2T1:2:3.4',
+    '1900-02-29T00:00:00.0', '2022-01-02T00:00:00.1234567',
+]
+
+
+def test_batch_rules_match_row_rules():
+    rows = [(id, creation_date, row_number) for id in IDS for creation_date in CREATION_DATES for row_number in (1, 2)]
+    expected = [cleanse_and_deduplicate_row(id, None, None, creation_date, None, None, row_number)
+                for id, creation_date, row_number in rows]
+
+    nulls = pa.nulls(len(rows), pa.string())
+    actual = cleanse_and_deduplicate_batch(
+        pa.array([row[0] for row in rows], pa.string()), nulls, nulls,
+        pa.array([row[1] for row in rows], pa.string()), nulls, nulls,
+        pa.array([row[2] for row in rows], pa.int64()),
+    ).to_pylist()
+
+    assert actual == expected, "The vectorized rules should give the same result as the row rules"
+
+
+def test_registered_udfs_agree_in_sql(db):
+    file_path = os.path.join(os.path.dirname(__file__), '../uncommitted/sample-votes-invalid-datatypes.jsonl')
+    db.conn.execute("CREATE SCHEMA IF NOT EXISTS blog_analysis;")
+    db.load_json_to_staging_table(file_path, {'Id': '', 'PostId': '', 'VoteTypeId': '', 'CreationDate': '', 'UserId': '', 'BountyAmount': ''})
+
+    query = """
+        SELECT Id, CreationDate, result
+        FROM (
+            SELECT Id, CreationDate,
+                {udf}(Id, PostId, VoteTypeId, CreationDate, UserId, BountyAmount,
+                      ROW_NUMBER() OVER (PARTITION BY Id ORDER BY CreationDate DESC)) AS result
+            FROM blog_analysis.staging_votes_load
+        ) validated
+        ORDER BY Id, CreationDate, result.status
+    """
+    row_results = db.conn.execute(query.format(udf='cleanse_and_deduplicate_row')).fetchall()
+    batch_results = db.conn.execute(query.format(udf='cleanse_and_deduplicate_batch')).fetchall()
+
+    assert batch_results == row_results
+    assert ('2', 'INVALID_DATE', {'status': 'FAILED', 'error_description': 'Invalid CreationDate'}) in batch_results